@@ -0,0 +1,181 @@
+# src/openlogi_ai_faq/answer_cache.py (質問文・モデル・FAQデータをキーにした回答キャッシュ)
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from .faq_io import write_json_atomic
+from .retrieval import normalize_text
+
+# キャッシュファイルの接尾辞 (FAQデータファイルと同じ場所に保存する)
+ANSWER_CACHE_SUFFIX = ".answers.json"
+# 保持する回答の最大件数 (超えた場合は最も長く使われていないものから削除する)
+ANSWER_CACHE_MAX_ENTRIES = 1000
+# 回答の有効期間 (秒)。0 の場合は期限なし
+ANSWER_CACHE_TTL = 7 * 24 * 60 * 60
+# ファイルに保存する最短の間隔 (秒)。回答を追加するたびにファイル全体を書き直さないよう、
+# この間隔内に追加した回答は次の保存 (または flush()) でまとめて保存する。0 の場合は追加のたびに保存する
+ANSWER_CACHE_SAVE_INTERVAL = 5.0
+
+
+def normalize_question(question):
+    """
+    キャッシュのキーに使う質問文の正規化。
+    全角・半角と大文字・小文字を揃え、連続する空白を1つにまとめる。
+    """
+    return " ".join(normalize_text(question).split())
+
+
+def cache_filename(data_filename):
+    """FAQデータファイル名に対応する回答キャッシュのファイル名を返す。"""
+    return data_filename + ANSWER_CACHE_SUFFIX
+
+
+class AnswerCache:
+    """
+    モデルの回答をディスクに保存するキャッシュ。
+    キーは 正規化した質問文・モデル名・FAQデータのハッシュ から作る。
+    FAQデータのハッシュが変わると (データが更新されると)、読み込み時に以前の回答はすべて破棄される。
+    件数の上限を超えた場合は最も長く使われていない回答 (LRU) から、有効期間を過ぎた回答は参照時に削除する。
+    スレッドセーフ。
+    """
+
+    def __init__(self, filename, corpus_hash, max_entries=ANSWER_CACHE_MAX_ENTRIES, ttl=ANSWER_CACHE_TTL,
+                 save_interval=ANSWER_CACHE_SAVE_INTERVAL):
+        """
+        Args:
+            filename (str): キャッシュファイル名。
+            corpus_hash (str): 読み込んだFAQデータのハッシュ (retrieval.file_hash の結果など)。
+            max_entries (int): 保持する回答の最大件数。
+            ttl (float): 回答の有効期間 (秒)。0 の場合は期限なし。
+            save_interval (float): ファイルに保存する最短の間隔 (秒)。
+        """
+        self.filename = filename
+        self.corpus_hash = corpus_hash
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self.save_interval = save_interval
+        self._entries = OrderedDict()   # キー -> 回答 (古く使われたものが先頭)
+        self._lock = threading.Lock()
+        # ファイルへの書き込みを1つずつ行うためのロック (_lock を持ったまま書き込むと get() を待たせるため別にする)
+        self._save_lock = threading.Lock()
+        self._dirty = False             # 保存していない回答があるか
+        self._last_save = 0.0           # 最後に保存した時刻 (time.monotonic())
+        # 統計情報
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.saved_prompt_tokens = 0     # キャッシュから回答したことで送信せずに済んだプロンプトトークン
+        self.saved_response_tokens = 0
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.filename, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (json.JSONDecodeError, IOError, OSError) as e:
+            print(f"警告: 回答キャッシュの読み込みに失敗しました。空のキャッシュで開始します - {self.filename}\n{e}")
+            return
+        if not isinstance(data, dict) or data.get('corpus_hash') != self.corpus_hash:
+            # FAQデータが変わったので、以前の回答は使わない
+            return
+        entries = data.get('entries', [])
+        if isinstance(entries, list):
+            for entry in entries:
+                if isinstance(entry, dict) and 'key' in entry:
+                    self._entries[entry['key']] = entry
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def save(self):
+        """キャッシュをファイルに保存する。"""
+        with self._save_lock:
+            with self._lock:
+                data = {'corpus_hash': self.corpus_hash, 'entries': list(self._entries.values())}
+                self._dirty = False
+                self._last_save = time.monotonic()
+            try:
+                write_json_atomic(self.filename, data)
+                return True
+            except (IOError, OSError) as e:
+                with self._lock:
+                    self._dirty = True
+                print(f"警告: 回答キャッシュの保存に失敗しました - {self.filename}\n{e}")
+                return False
+
+    def flush(self):
+        """保存していない回答があればファイルに保存する (終了時や解放時に呼び出す)。"""
+        with self._lock:
+            dirty = self._dirty
+        return self.save() if dirty else True
+
+    def make_key(self, question, model_name):
+        material = "\n".join([normalize_question(question), model_name, self.corpus_hash])
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    def _expired(self, entry, now):
+        return self.ttl > 0 and now - entry.get('created', 0) > self.ttl
+
+    def get(self, question, model_name):
+        """
+        キャッシュ済みの回答を返す。
+
+        Returns:
+            dict | None: {'question', 'answer', 'prompt_tokens', 'response_tokens', 'created'}。
+                         ない場合や有効期間を過ぎている場合はNone。
+        """
+        key = self.make_key(question, model_name)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry, now):
+                del self._entries[key]
+                self.evictions += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.saved_prompt_tokens += entry.get('prompt_tokens', 0)
+            self.saved_response_tokens += entry.get('response_tokens', 0)
+            return entry
+
+    def put(self, question, model_name, answer, prompt_tokens=0, response_tokens=0):
+        """
+        回答をキャッシュに追加する。前回の保存から save_interval 秒以上経っていればファイルに保存する
+        (経っていない場合は、次の put() か flush() でまとめて保存する)。
+        """
+        key = self.make_key(question, model_name)
+        with self._lock:
+            self._entries[key] = {
+                'key': key,
+                'question': question,
+                'answer': answer,
+                'prompt_tokens': prompt_tokens,
+                'response_tokens': response_tokens,
+                'created': time.time(),
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            self._dirty = True
+            due = time.monotonic() - self._last_save >= self.save_interval
+        if due:
+            self.save()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def format_stats(self):
+        """ヒット・ミスの件数などを表示用の文字列にする。"""
+        lookups = self.hits + self.misses
+        rate = self.hits / lookups if lookups else 0.0
+        return (f"  回答キャッシュ: ヒット {self.hits}, ミス {self.misses} (ヒット率 {rate:.0%}), "
+                f"削除 {self.evictions}, 保持 {len(self)} 件\n"
+                f"  キャッシュにより送信せずに済んだトークン数: プロンプト {self.saved_prompt_tokens}, "
+                f"応答 {self.saved_response_tokens}")
@@ -0,0 +1,227 @@
+# src/openlogi_ai_faq/answerer.py (1つの質問に回答する処理。サーバー・一括処理から使う)
+from . import chunking
+from . import retrieval
+from . import vector_search
+from .answer_cache import AnswerCache, cache_filename
+from .context_packing import TokenEstimator, token_counts_filename
+from .conversation import HISTORY_TURNS, BoundedHistory
+from .corpus import compact_records
+from .qa_app import (ANSWER_CACHE_ENABLED, NO_ANSWER_MESSAGE, PASSAGE_CHUNKING, RETRIEVAL_ENGINE, RETRIEVAL_TOP_K,
+                     USE_ARTIFACT,
+                     answer_cache_model_key, context_artifact_key, extract_reference_url, format_retrieval_prompt,
+                     calibrate_token_counts, history_cache_key, load_corpus, prepare_faq_context, format_stateless_prompt)
+from .retrieval import file_hash
+
+
+class FaqAnswerer:
+    """
+    読み込み済みのFAQデータを使って、質問ごとに独立したリクエストで回答する。
+    コーパスの準備 (検索インデックスの読み込みや全FAQのコンテキストの整形) は作成時に1回だけ行い、
+    answer() は複数のスレッドから同時に呼び出せる。
+    """
+
+    def __init__(self, faq_data, data_filename, backend, mode='retrieval', engine=RETRIEVAL_ENGINE,
+                 top_k=RETRIEVAL_TOP_K, answer_cache=None, history_turns=HISTORY_TURNS, prompt_prefix="",
+                 search_index=None, context=None, passages=None):
+        """
+        Args:
+            faq_data (list[dict]): 読み込んだFAQデータ。
+            data_filename (str): FAQデータファイル名 (検索インデックスの保存場所と、変更の検出に使う)。
+            backend: model_backend の GeminiBackend / FakeBackend など (generate(prompt) を持つもの)。
+            mode (str): 'full' (全FAQを毎回の前置きにする) または 'retrieval' (質問ごとに関連FAQを検索する)。
+            engine (str): 'retrieval' モードの検索方法 ('bm25' または 'vector')。
+            top_k (int): 'retrieval' モードで1回の質問に含めるFAQの件数。
+            answer_cache (AnswerCache | None): 回答キャッシュ。Noneの場合は使わない。
+            history_turns (int): 呼び出し元から渡された会話履歴のうち、プロンプトに全文で含める往復数。
+            prompt_prefix (str): 回答ルールの前に置くコーパスごとの前置き (corpus.CorpusConfig.prompt_prefix)。
+            search_index: 準備済みの検索インデックス (アーティファクトや、同じデータの別のコーパスのもの)。
+                          Noneの場合は data_filename から読み込むか作成する。
+            context (tuple[str, bool] | None): 準備済みの 'full' モードのコンテキストと、切り詰められたかどうか。
+            passages (list[dict] | None): faq_data のパッセージ (chunking.chunk_records の結果)。指定した場合は、
+                                          関連するパッセージだけをプロンプトに含める (search_index もパッセージのもの)。
+
+        Raises:
+            ValueError: 有効なFAQが1件もない場合。
+        """
+        self.faq_data = faq_data
+        self.backend = backend
+        self.mode = mode
+        self.engine = engine
+        self.top_k = top_k
+        self.answer_cache = answer_cache
+        self.history_turns = history_turns
+        self.prompt_prefix = prompt_prefix
+        self.passages = passages
+        self.known_urls = {faq.get('url') for faq in faq_data}
+        model_name = getattr(backend, 'model_name', 'model')
+        self.cache_model_key = answer_cache_model_key(model_name, mode, engine, prompt_prefix, passages is not None)
+
+        self.search_index = None
+        self.context = None
+        if mode == 'retrieval':
+            if search_index is not None:
+                self.search_index = search_index
+            elif passages is not None:
+                # パッセージのインデックスは分割の設定に合わせて毎回作成する (保存しない)
+                if engine == 'vector':
+                    self.search_index = vector_search.VectorIndex.build(passages)
+                else:
+                    self.search_index = retrieval.BM25Index.build(passages)
+            elif engine == 'vector':
+                self.search_index = vector_search.load_or_build_index(data_filename, faq_data)
+            else:
+                self.search_index = retrieval.load_or_build_index(data_filename, faq_data)
+            if self.search_index.doc_count == 0:
+                raise ValueError("検索できる有効なFAQがありませんでした。")
+        else:
+            if context is None:
+                context = prepare_faq_context(faq_data, data_filename, model_name, prompt_prefix=prompt_prefix,
+                                              passages=passages is not None)
+            self.context, limited = context
+            if self.context is None:
+                raise ValueError("コンテキストに追加できる有効なFAQがありませんでした。")
+            if limited:
+                print("警告: FAQデータの一部のみがコンテキストとして使用されます。")
+
+    def build_prompt(self, question, history=None):
+        """
+        質問に対するプロンプトを作成する。
+
+        Args:
+            question (str): ユーザーの質問。
+            history (list[dict] | None): それまでの会話 [{'question', 'answer'}, ...] (古い順)。
+
+        Returns:
+            str | None: プロンプト。'retrieval' モードで関連するFAQが見つからない場合はNone。
+        """
+        return self._build_prompt(question, self._history_text(history))
+
+    def _history_text(self, history):
+        bounded = BoundedHistory(self.history_turns)
+        for turn in history or ():
+            bounded.add(turn.get('question', ''), turn.get('answer', ''))
+        return bounded.format()
+
+    def _build_prompt(self, question, history_text):
+        if self.mode == 'retrieval':
+            if self.passages is not None:
+                related_faqs = chunking.retrieve_passages(self.search_index, self.faq_data, self.passages,
+                                                          question, self.top_k)
+                chunking.answer_tokens(self.faq_data, related_faqs)
+            else:
+                related_faqs = retrieval.retrieve_faqs(self.search_index, self.faq_data, question, self.top_k)
+            if not related_faqs:
+                return None
+            return format_retrieval_prompt(question, related_faqs, history_text, self.prompt_prefix)
+        return format_stateless_prompt(self.context, question, history_text)
+
+    def answer(self, question, history=None, before_call=None):
+        """
+        質問に回答する。回答キャッシュのキーには、プロンプトに含める会話履歴のハッシュを含める。
+
+        Args:
+            question (str): ユーザーの質問。
+            history (list[dict] | None): それまでの会話 [{'question', 'answer'}, ...] (古い順)。
+            before_call (callable | None): モデルを呼び出す直前に before_call(prompt) を呼び出す
+                                           (レート制限の待機など。キャッシュから回答する場合は呼び出さない)。
+
+        Returns:
+            dict: {'answer', 'reference_url', 'reference_known', 'cached',
+                   'prompt_tokens', 'response_tokens', 'latency'}
+
+        Raises:
+            Exception: モデルの呼び出しに失敗した場合 (バックエンドの例外をそのまま送出する)。
+        """
+        history_text = self._history_text(history)
+        cache_key = history_cache_key(self.cache_model_key, history_text)
+        if self.answer_cache is not None:
+            cached = self.answer_cache.get(question, cache_key)
+            if cached is not None:
+                return self._result(cached['answer'], cached=True)
+
+        prompt = self._build_prompt(question, history_text)
+        if prompt is None:
+            # 関連するFAQがない場合はモデルに問い合わせない
+            return self._result(NO_ANSWER_MESSAGE)
+        if before_call is not None:
+            before_call(prompt)
+        response = self.backend.generate(prompt)
+        if self.answer_cache is not None:
+            self.answer_cache.put(question, cache_key, response.text,
+                                  response.prompt_tokens, response.response_tokens)
+        return self._result(response.text, prompt_tokens=response.prompt_tokens,
+                            response_tokens=response.response_tokens, latency=response.latency)
+
+    def close(self):
+        """保存していない回答キャッシュを保存する (corpus.CorpusRegistry が解放時に呼び出す)。"""
+        if self.answer_cache is not None:
+            self.answer_cache.flush()
+
+    def _result(self, text, cached=False, prompt_tokens=0, response_tokens=0, latency=0.0):
+        reference_url = extract_reference_url(text)
+        return {
+            'answer': text,
+            'reference_url': reference_url,
+            'reference_known': reference_url is None or reference_url in self.known_urls,
+            'cached': cached,
+            'prompt_tokens': prompt_tokens,
+            'response_tokens': response_tokens,
+            'latency': latency,
+        }
+
+
+def load_corpus_answerer(config, shared, backend, mode='retrieval', engine=RETRIEVAL_ENGINE, top_k=RETRIEVAL_TOP_K,
+                         use_cache=ANSWER_CACHE_ENABLED, use_artifact=USE_ARTIFACT, passages=PASSAGE_CHUNKING):
+    """
+    コーパスの FaqAnswerer を作る (corpus.CorpusRegistry の loader として使う)。
+    FAQレコードは FaqRecord にして保持し、アーティファクトがあれば検索インデックスやコンテキストをそこから読み込む
+    (パッセージ単位の検索インデックスはアーティファクトにないため、読み込むたびに作成する)。
+
+    Args:
+        config (corpus.CorpusConfig): コーパスの設定。
+        shared (FaqAnswerer | None): 同じFAQデータファイルを使う読み込み済みのコーパス。
+                                     あればFAQレコード・検索インデックス・回答キャッシュを共有する。
+        backend, mode, engine, top_k: FaqAnswerer と同じ。
+        use_cache (bool): 回答キャッシュを使うかどうか。
+        use_artifact (bool): アーティファクト (artifact.py) を使うかどうか。
+        passages (bool): 長いFAQの回答をパッセージに分割し、関連するパッセージだけをプロンプトに含めるかどうか。
+
+    Returns:
+        FaqAnswerer: コーパスの FaqAnswerer。
+
+    Raises:
+        ValueError: FAQデータを読み込めない場合や、有効なFAQが1件もない場合。
+    """
+    if shared is not None:
+        shared_passages = shared.passages if passages else None
+        if passages and shared_passages is None:
+            shared_passages = chunking.chunk_records(shared.faq_data)
+        same_index = shared.engine == engine and (shared.passages is not None) == passages
+        return FaqAnswerer(shared.faq_data, config.data_file, backend, mode=mode, engine=engine, top_k=top_k,
+                           answer_cache=shared.answer_cache, prompt_prefix=config.prompt_prefix,
+                           search_index=shared.search_index if same_index else None, passages=shared_passages)
+
+    faq_data, artifact = load_corpus(config.data_file, use_artifact)
+    if faq_data is None:
+        raise ValueError(f"FAQデータを読み込めませんでした。({config.data_file})")
+    model_name = getattr(backend, 'model_name', 'model')
+    if mode != 'retrieval':
+        # トークン数の実測値がなければ、コンテキストの作成 (とアーティファクトのキーの計算) の前に実測する
+        calibrate_token_counts(TokenEstimator(model_name, token_counts_filename(config.data_file)), faq_data,
+                               backend.count_tokens)
+    search_index = context = None
+    if artifact is not None:
+        if mode == 'retrieval' and not passages:
+            search_index = artifact.vector_index() if engine == 'vector' else artifact.bm25_index()
+        elif mode != 'retrieval':
+            context = artifact.context(context_artifact_key(config.data_file, model_name,
+                                                            prompt_prefix=config.prompt_prefix, passages=passages))
+        data_hash = artifact.data_hash
+        artifact.close()
+    else:
+        data_hash = file_hash(config.data_file)
+    answer_cache = AnswerCache(cache_filename(config.data_file), data_hash) if use_cache else None
+    faq_data = compact_records(faq_data)
+    return FaqAnswerer(faq_data, config.data_file, backend, mode=mode, engine=engine, top_k=top_k,
+                       answer_cache=answer_cache, prompt_prefix=config.prompt_prefix, search_index=search_index,
+                       context=context, passages=chunking.chunk_records(faq_data) if passages else None)
@@ -0,0 +1,301 @@
+# src/openlogi_ai_faq/artifact.py (Q&Aアプリの起動を速くするための、FAQデータから作るアーティファクト)
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+
+from .faq_io import DEFAULT_FAQ_FILENAME, file_hash
+
+# アーティファクトのファイル名の接尾辞 (FAQデータファイルと同じ場所に保存する)
+ARTIFACT_SUFFIX = ".artifact"
+# 形式のバージョン (形式や、保存するFAQの作り方を変えたら上げる。古いアーティファクトは使われず、作り直される)
+ARTIFACT_VERSION = 2
+# セクションの開始位置を揃える境界 (バイト)。ベクトル行列をメモリマップのまま numpy 配列として読むため
+SECTION_ALIGN = 64
+
+# ファイルの先頭: マジック (8バイト), バージョン (uint32), ヘッダー (JSON) のバイト数 (uint64)
+_PREFIX = struct.Struct('<8sIQ')
+_MAGIC = b"FAQARTF\n"
+
+
+def artifact_filename(data_filename):
+    """FAQデータファイル名に対応するアーティファクトのファイル名を返す。"""
+    return data_filename + ARTIFACT_SUFFIX
+
+
+class FaqArtifact:
+    """
+    FAQデータファイルから作った、起動時に必要なデータをまとめた読み込み専用のファイル。
+    ファイル全体をメモリマップし、各セクションは必要になったときに読む (使わないセクションはディスクから読まれない)。
+
+    セクション:
+        'records': 重複を除いたFAQレコード (JSON配列)。検索インデックスの文書番号はこの並び順と一致する。
+        'urls':    FAQレコードのURLの一覧 (JSON配列)。'full' モードではレコード全体を読まずに参照URLを確認できる。
+        'context': 'full' モードのコンテキスト (UTF-8)。メタデータの 'key' が作成時の設定を表す。
+        'bm25':    retrieval.BM25Index (JSON)。
+        'vectors': vector_search.VectorIndex の行列 (float32, 次元数 × レコード数)。IDF などはメタデータに持つ。
+    """
+
+    def __init__(self, filename, mapped, header):
+        self.filename = filename
+        self.data_hash = header['data_hash']
+        self._mmap = mapped
+        self._view = memoryview(mapped)
+        self._sections = header['sections']
+
+    @classmethod
+    def open(cls, filename, data_hash, warn=True):
+        """
+        アーティファクトを開く。warn がFalseの場合、壊れていても警告を表示しない。
+
+        Returns:
+            FaqArtifact | None: ファイルがない場合、data_hash や形式のバージョンが一致しない場合、壊れている場合はNone。
+        """
+        try:
+            with open(filename, 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            return None
+        except (IOError, OSError, ValueError) as e:
+            if warn:
+                print(f"警告: アーティファクトを開けませんでした - {filename}\n{e}")
+            return None
+        try:
+            magic, version, header_length = _PREFIX.unpack_from(mapped, 0)
+            if magic != _MAGIC or version != ARTIFACT_VERSION:
+                mapped.close()
+                return None
+            header = json.loads(mapped[_PREFIX.size:_PREFIX.size + header_length])
+            if header.get('data_hash') != data_hash:
+                mapped.close()
+                return None
+            for section in header['sections'].values():
+                if section['offset'] + section['length'] > len(mapped):
+                    raise ValueError("セクションがファイルの末尾を超えています。")
+        except (struct.error, json.JSONDecodeError, UnicodeDecodeError, KeyError, TypeError, ValueError) as e:
+            if warn:
+                print(f"警告: アーティファクトの形式が正しくありません。作り直します - {filename}\n{e}")
+            mapped.close()
+            return None
+        return cls(filename, mapped, header)
+
+    def close(self):
+        self._view.release()
+        try:
+            self._mmap.close()
+        except BufferError:
+            # 行列などがまだメモリマップを参照している場合は、参照がなくなったときに閉じられる
+            pass
+
+    def __contains__(self, name):
+        return name in self._sections
+
+    def meta(self, name):
+        """セクションのメタデータ (作成時に指定したもの) を返す。"""
+        return {key: value for key, value in self._sections[name].items() if key not in ('offset', 'length')}
+
+    def section(self, name):
+        """セクションの内容を、ファイルをコピーせずに memoryview で返す。"""
+        section = self._sections[name]
+        return self._view[section['offset']:section['offset'] + section['length']]
+
+    def _json(self, name):
+        return json.loads(bytes(self.section(name)))
+
+    def records(self):
+        """重複を除いたFAQレコードのリスト。"""
+        return self._json('records')
+
+    def urls(self):
+        """FAQレコードのURLの一覧。"""
+        return self._json('urls')
+
+    def context(self, key):
+        """
+        'full' モードのコンテキストを返す。
+
+        Returns:
+            tuple[str, bool] | None: (コンテキスト, 切り詰められたか)。key が作成時と異なる場合はNone。
+        """
+        if 'context' not in self or self._sections['context'].get('key') != key:
+            return None
+        return str(self.section('context'), 'utf-8'), self._sections['context'].get('limited', False)
+
+    def bm25_index(self):
+        """BM25 のインデックス。ない場合やパラメーターが現在の設定と異なる場合はNone。"""
+        from . import retrieval
+        if 'bm25' not in self:
+            return None
+        index = retrieval.BM25Index.from_dict(self._json('bm25'))
+        if (index.k1, index.b, index.ngram_size) != (retrieval.BM25_K1, retrieval.BM25_B, retrieval.NGRAM_SIZE):
+            return None
+        return index
+
+    def vector_index(self):
+        """
+        ベクトルのインデックス。行列はメモリマップしたファイルを直接参照する (読み込み時にコピーしない)。
+        ない場合やパラメーターが現在の設定と異なる場合はNone。
+        """
+        import numpy as np
+        from . import vector_search
+        if 'vectors' not in self:
+            return None
+        meta = self._sections['vectors']
+        if (meta.get('dim') != vector_search.VECTOR_DIM or meta.get('ngram_size') != vector_search.NGRAM_SIZE
+                or meta.get('question_weight') != vector_search.QUESTION_WEIGHT):
+            return None
+        matrix = np.frombuffer(self.section('vectors'), dtype=np.float32).reshape(meta['dim'], meta['rows'])
+        return vector_search.VectorIndex(matrix, meta['idf'], meta['ngram_size'], meta.get('doc_count'))
+
+
+def _json_bytes(data):
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def records_sections(faq_data, dedup):
+    """'records' と 'urls' セクションを作る。dedup は faq_data が重複除去済みかどうか。"""
+    return {
+        'records': (_json_bytes(faq_data), {'count': len(faq_data), 'dedup': dedup}),
+        'urls': (_json_bytes([faq.get('url') for faq in faq_data]), {}),
+    }
+
+
+def context_section(key, context, limited):
+    """'context' セクションを作る。"""
+    return {'context': (context.encode('utf-8'), {'key': key, 'limited': limited})}
+
+
+def bm25_section(index):
+    """'bm25' セクションを作る。"""
+    return {'bm25': (_json_bytes(index.to_dict()), {})}
+
+
+def vector_section(index):
+    """'vectors' セクションを作る。"""
+    from . import vector_search
+    meta = {'dim': index.dim, 'rows': index.record_count, 'doc_count': index.doc_count,
+            'ngram_size': index.ngram_size, 'question_weight': vector_search.QUESTION_WEIGHT,
+            'idf': index.idf.tolist()}
+    # 行列は (次元数, レコード数) の C 順序で書き込む (メモリマップの配列ならそのまま書き出される)
+    import numpy as np
+    return {'vectors': (memoryview(np.ascontiguousarray(index.matrix, dtype=np.float32)).cast('B'), meta)}
+
+
+def write_artifact(filename, data_hash, sections):
+    """
+    セクションをまとめてアーティファクトを書き出す。一時ファイルに書いてから置き換える。
+
+    Args:
+        sections (dict[str, tuple[bytes | memoryview, dict]]): セクション名 -> (内容, メタデータ)。
+
+    Raises:
+        IOError, OSError: 書き込みに失敗した場合。
+    """
+    # ヘッダーの長さでセクションの位置が変わるため、位置を決めてからヘッダーを作る (位置の桁数が変わる場合に備えて繰り返す)
+    header_length = 0
+    while True:
+        offset = _PREFIX.size + header_length
+        layout = {}
+        for name, (content, meta) in sections.items():
+            offset += -offset % SECTION_ALIGN
+            layout[name] = dict(meta, offset=offset, length=len(content))
+            offset += len(content)
+        header = _json_bytes({'data_hash': data_hash, 'sections': layout})
+        if len(header) == header_length:
+            break
+        header_length = len(header)
+
+    tmp_filename = filename + ".tmp"
+    with open(tmp_filename, 'wb') as f:
+        f.write(_PREFIX.pack(_MAGIC, ARTIFACT_VERSION, header_length))
+        f.write(header)
+        for name, (content, _) in sections.items():
+            f.write(b'\0' * (layout[name]['offset'] - f.tell()))
+            f.write(content)
+    os.replace(tmp_filename, filename)
+
+
+def update_artifact(data_filename, data_hash, sections):
+    """
+    FAQデータファイルのアーティファクトに sections を加えて (同じ名前のセクションは置き換えて) 書き出す。
+    既存のアーティファクトが data_hash と一致しない場合は、sections だけで作り直す。
+
+    Returns:
+        bool: 保存に成功した場合はTrue。
+    """
+    filename = artifact_filename(data_filename)
+    existing = FaqArtifact.open(filename, data_hash, warn=False)
+    try:
+        merged = {}
+        if existing is not None:
+            for name in existing._sections:
+                if name not in sections:
+                    merged[name] = (existing.section(name), existing.meta(name))
+        merged.update(sections)
+        write_artifact(filename, data_hash, merged)
+        return True
+    except (IOError, OSError) as e:
+        print(f"警告: アーティファクトの保存に失敗しました - {filename}\n{e}")
+        return False
+    finally:
+        merged = None
+        if existing is not None:
+            existing.close()
+
+
+if __name__ == "__main__":
+    from . import qa_app
+    from . import context_packing
+    from .model_backend import MODEL_BACKENDS
+
+    parser = argparse.ArgumentParser(
+        description="FAQデータから、Q&Aアプリの起動時に読み込むアーティファクト (重複を除いたFAQ・コンテキスト・検索インデックス) を作る")
+    parser.add_argument("--data", default=DEFAULT_FAQ_FILENAME, help="FAQデータファイル")
+    parser.add_argument("--backend", choices=MODEL_BACKENDS, default=qa_app.MODEL_BACKEND,
+                        help=f"コンテキストを作るモデルのバックエンド (デフォルト: {qa_app.MODEL_BACKEND})")
+    parser.add_argument("--context-budget", type=int,
+                        help="full モードでFAQ情報に使えるトークン数 (デフォルト: モデルのコンテキストの上限から計算)")
+    parser.add_argument("--focus-file", help="full モードで優先してコンテキストに含めるFAQを決めるための質問ファイル")
+    parser.add_argument("--vector", action="store_true", help="ベクトル検索 (--engine vector) の行列も含める")
+    parser.add_argument("--passages", action="store_true", default=qa_app.PASSAGE_CHUNKING,
+                        help="full モードのコンテキストを、パッセージ単位で選んで作る (qa_app の --passages 用)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    try:
+        data_hash = file_hash(args.data)
+    except (IOError, OSError) as e:
+        print(f"エラー: FAQデータファイルを読み込めませんでした - {args.data}\n{e}")
+        sys.exit(1)
+    faq_data = qa_app.load_faq_data(args.data)
+    if faq_data is None:
+        print(f"エラー: FAQデータの読み込みに失敗しました。({args.data} を確認してください)")
+        sys.exit(1)
+    focus_queries = context_packing.load_focus_queries(args.focus_file) if args.focus_file else []
+    model_label = qa_app.MODEL_NAME if args.backend == 'gemini' else args.backend
+
+    from . import retrieval
+    sections = records_sections(faq_data, qa_app.DEDUP_ON_LOAD)
+    context, limited = qa_app.prepare_faq_context(faq_data, args.data, model_label, args.context_budget, focus_queries,
+                                                  passages=args.passages)
+    if context is not None:
+        key = qa_app.context_artifact_key(args.data, model_label, args.context_budget, focus_queries,
+                                          passages=args.passages)
+        sections.update(context_section(key, context, limited))
+    sections.update(bm25_section(retrieval.BM25Index.build(faq_data)))
+    if args.vector:
+        from . import vector_search
+        sections.update(vector_section(vector_search.VectorIndex.build(faq_data)))
+
+    filename = artifact_filename(args.data)
+    try:
+        write_artifact(filename, data_hash, sections)
+    except (IOError, OSError) as e:
+        print(f"エラー: アーティファクトの保存に失敗しました - {filename}\n{e}")
+        sys.exit(1)
+    size = os.path.getsize(filename)
+    print(f"アーティファクトを作成しました: {filename} ({size / (1024 * 1024):.1f} MB, "
+          f"セクション: {', '.join(sections)}, {time.perf_counter() - start:.2f} 秒)")
@@ -0,0 +1,342 @@
+# src/openlogi_ai_faq/batch.py (JSONLの質問一覧にまとめて回答する一括処理)
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from . import qa_app
+from .answerer import load_corpus_answerer
+from .corpus import CorpusConfig, load_corpora, select_corpus
+from .faq_io import JsonlWriter, iter_faq_records
+from .model_backend import MODEL_BACKENDS, create_backend, estimate_tokens, is_rate_limit_error
+from .ratelimit import TokenBucket
+
+# --- 設定 ---
+# 一括処理でのFAQ情報の渡し方 (デフォルトは質問ごとに関連FAQを検索する 'retrieval')
+BATCH_CONTEXT_MODE = 'retrieval'
+# 同時に実行するワーカー数
+BATCH_WORKERS = 4
+# 1分あたりのリクエスト数・トークン数の上限 (使用するモデル・プランのレート制限に合わせて変更する。0 の場合は制限しない)
+BATCH_REQUESTS_PER_MINUTE = 60
+BATCH_TOKENS_PER_MINUTE = 1000000
+# レート制限の超過 (429 / ResourceExhausted) を再試行する最大回数と、最初の待機秒数 (再試行ごとに2倍にする)
+BATCH_MAX_RETRIES = 5
+BATCH_RETRY_DELAY = 5.0
+# 進捗を表示する間隔 (件数)
+BATCH_PROGRESS_INTERVAL = 50
+# --- 設定ここまで ---
+
+
+class ModelRateLimiter:
+    """
+    モデル呼び出しの1分あたりのリクエスト数 (RPM) とトークン数 (TPM) の制限。
+    送信前にリクエスト1回分と、プロンプトの推定トークン数を取得し、
+    応答後に応答のトークン数と推定との差を差し引く。スレッドセーフ。
+    """
+
+    def __init__(self, requests_per_minute=BATCH_REQUESTS_PER_MINUTE, tokens_per_minute=BATCH_TOKENS_PER_MINUTE):
+        # リクエストは一定間隔で送り、トークンは1分間分までまとめて使えるようにする
+        self.requests = TokenBucket(requests_per_minute / 60.0, 1) if requests_per_minute > 0 else None
+        self.tokens = TokenBucket(tokens_per_minute / 60.0, tokens_per_minute) if tokens_per_minute > 0 else None
+        self.waited = 0.0
+
+    def acquire(self, prompt):
+        """プロンプトを送信する前に呼び出す (必要なら待機する)。推定トークン数を返す。"""
+        estimated = estimate_tokens(prompt)
+        if self.requests is not None:
+            self.waited += self.requests.acquire()
+        if self.tokens is not None:
+            self.waited += self.tokens.acquire(estimated)
+        return estimated
+
+    def settle(self, estimated, used):
+        """応答を受け取った後に、実際に使用したトークン数 (プロンプト + 応答) を反映する。"""
+        if self.tokens is not None and used:
+            self.tokens.consume(used - estimated)
+
+    def pause(self, seconds):
+        """
+        レート制限の超過を受けた場合に、すべてのワーカーの送信を seconds 秒止める
+        (待機は各ワーカーの次の acquire() で行われる)。
+
+        Returns:
+            bool: 止めたかどうか (リクエスト数・トークン数とも制限しない設定の場合はFalse)。
+        """
+        paused = False
+        for bucket in (self.requests, self.tokens):
+            if bucket is not None:
+                bucket.pause(seconds)
+                paused = True
+        return paused
+
+
+def load_questions(filename):
+    """
+    質問ファイル (JSONL または JSON配列) を読み込む。
+    各レコードは {"id": ..., "question": "...", "expected_url": "..."} (id・expected_url は省略可) または質問の文字列。
+    id がない場合はファイル内の順番 (0始まり) を使う。
+
+    Returns:
+        list[dict]: {'id', 'question', 'expected_url'} のリスト。質問が空のレコードは除く。
+
+    Raises:
+        FileNotFoundError, json.JSONDecodeError, ValueError: ファイルを読み込めない場合。
+    """
+    items = []
+    for index, record in enumerate(iter_faq_records(filename)):
+        if isinstance(record, str):
+            record = {'question': record}
+        if not isinstance(record, dict):
+            continue
+        question = str(record.get('question') or '').strip()
+        if not question:
+            continue
+        items.append({'id': record.get('id', index), 'question': question, 'expected_url': record.get('expected_url')})
+    return items
+
+
+def scan_results(filename):
+    """
+    途中まで書き出した結果ファイルを読み、再開に必要な情報を返す。
+    最後の不完全な行 (書き込み途中で中断された行) は無視する。
+
+    Returns:
+        tuple[set, int]: (正常に回答済みの id の集合, 完全な行の末尾のバイト位置)
+    """
+    done = set()
+    end = 0
+    try:
+        with open(filename, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    record = json.loads(line)
+                except (UnicodeDecodeError, json.JSONDecodeError):
+                    break
+                end += len(line)
+                if isinstance(record, dict) and not record.get('error'):
+                    done.add(json.dumps(record.get('id')))
+    except FileNotFoundError:
+        pass
+    return done, end
+
+
+def answer_item(answerer, limiter, item, max_retries=BATCH_MAX_RETRIES, retry_delay=BATCH_RETRY_DELAY):
+    """
+    1件の質問に回答し、結果ファイルに書き出すレコードを返す (例外は送出せず 'error' に記録する)。
+    レート制限の超過は、待機時間を倍にしながら max_retries 回まで再試行する。
+    """
+    record = {'id': item['id'], 'question': item['question']}
+    estimated = []
+
+    def before_call(prompt):
+        estimated.append(limiter.acquire(prompt))
+
+    start = time.monotonic()
+    for attempt in range(1, max_retries + 2):
+        estimated.clear()
+        try:
+            result = answerer.answer(item['question'], before_call=before_call)
+        except Exception as e:
+            if is_rate_limit_error(e) and attempt <= max_retries:
+                delay = retry_delay * (2 ** (attempt - 1)) * random.uniform(1.0, 1.5)
+                # すべてのワーカーの送信を止める。このワーカーも次の試行の acquire() で待機するため、
+                # ここで待つのはレートを制限していない (止めるバケットがない) 場合だけ
+                if not limiter.pause(delay):
+                    time.sleep(delay)
+                continue
+            record.update({'error': f"{type(e).__name__}: {e}", 'attempts': attempt,
+                           'latency': round(time.monotonic() - start, 3)})
+            return record
+        if estimated:
+            limiter.settle(estimated[0], result['prompt_tokens'] + result['response_tokens'])
+        record.update(result)
+        record['latency'] = round(result['latency'] or 0.0, 3)
+        record['total_latency'] = round(time.monotonic() - start, 3)
+        record['attempts'] = attempt
+        if item.get('expected_url'):
+            record['expected_url'] = item['expected_url']
+            record['url_match'] = result['reference_url'] == item['expected_url']
+        return record
+
+
+class BatchSummary:
+    """一括処理の集計。"""
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.cached = 0
+        self.retried = 0
+        self.unknown_urls = 0
+        self.url_checked = 0
+        self.url_mismatches = 0
+        self.prompt_tokens = 0
+        self.response_tokens = 0
+        self.latencies = []
+
+    def add(self, record):
+        self.count += 1
+        if record.get('error'):
+            self.errors += 1
+            return
+        self.cached += record['cached']
+        self.retried += record['attempts'] > 1
+        self.unknown_urls += not record['reference_known']
+        if 'url_match' in record:
+            self.url_checked += 1
+            self.url_mismatches += not record['url_match']
+        self.prompt_tokens += record['prompt_tokens']
+        self.response_tokens += record['response_tokens']
+        if not record['cached'] and record['latency']:
+            self.latencies.append(record['latency'])
+
+    def format(self, elapsed, waited):
+        lines = [f"  処理件数: {self.count} (エラー {self.errors}, キャッシュ {self.cached}, 再試行あり {self.retried})",
+                 f"  トークン数: プロンプト {self.prompt_tokens}, 応答 {self.response_tokens}, "
+                 f"合計 {self.prompt_tokens + self.response_tokens}"]
+        if self.latencies:
+            latencies = sorted(self.latencies)
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            lines.append(f"  応答時間: 平均 {sum(latencies) / len(latencies):.2f} 秒, 95パーセンタイル {p95:.2f} 秒")
+        lines.append(f"  経過時間: {elapsed:.1f} 秒 ({self.count / elapsed if elapsed else 0.0:.2f} 件/秒), "
+                     f"レート制限による待機 (合計): {waited:.1f} 秒")
+        if self.url_checked:
+            lines.append(f"  参照URLの一致: {self.url_checked - self.url_mismatches}/{self.url_checked} 件")
+        if self.unknown_urls:
+            lines.append(f"  警告: FAQデータにない参照URLを含む回答が {self.unknown_urls} 件ありました。")
+        return "\n".join(lines)
+
+
+def run_batch(answerer, items, output_filename, workers=BATCH_WORKERS, limiter=None, resume=False,
+              progress_interval=BATCH_PROGRESS_INTERVAL):
+    """
+    質問の一覧にワーカープールで回答し、完了した順に結果を JSONL で書き出す。
+
+    Args:
+        answerer (FaqAnswerer): 回答に使う FaqAnswerer。
+        items (list[dict]): load_questions() の結果。
+        output_filename (str): 結果の JSONL ファイル名。
+        workers (int): 同時に実行するワーカー数。
+        limiter (ModelRateLimiter | None): レート制限。Noneの場合は設定値で作成する。
+        resume (bool): Trueの場合は、結果ファイルで回答済みの質問を飛ばして追記する
+                       (エラーになった質問は再実行し、同じ id の新しい行を追記する)。
+
+    Returns:
+        BatchSummary: 今回処理した分の集計。
+    """
+    limiter = limiter or ModelRateLimiter()
+    append_at = None
+    if resume:
+        done, append_at = scan_results(output_filename)
+        remaining = [item for item in items if json.dumps(item['id']) not in done]
+        print(f"回答済みの {len(items) - len(remaining)} 件を飛ばして再開します。")
+        items = remaining
+
+    summary = BatchSummary()
+    start = time.monotonic()
+    pending = set()
+    queue = iter(items)
+    with JsonlWriter(output_filename, append_at=append_at) as writer, \
+            ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        try:
+            while True:
+                # 結果を書き出す前に溜め込みすぎないよう、投入する件数をワーカー数の数倍までにする
+                while len(pending) < workers * 4:
+                    item = next(queue, None)
+                    if item is None:
+                        break
+                    pending.add(executor.submit(answer_item, answerer, limiter, item))
+                if not pending:
+                    break
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    record = future.result()
+                    writer.write(record)
+                    summary.add(record)
+                    if record.get('error'):
+                        print(f"エラー: id={record['id']} - {record['error']}")
+                    if progress_interval and summary.count % progress_interval == 0:
+                        print(f"  {summary.count}/{len(items)} 件を処理しました。")
+        except KeyboardInterrupt:
+            for future in pending:
+                future.cancel()
+            print("\n中断しました。--resume を指定して再実行すると、続きから処理します。")
+    elapsed = time.monotonic() - start
+    print(f"\n--- 一括処理の結果 ({output_filename}) ---")
+    print(summary.format(elapsed, limiter.waited))
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="JSONLの質問一覧にまとめて回答し、結果をJSONLで書き出す")
+    parser.add_argument("questions", help="質問ファイル (1行1件の JSONL: {\"id\", \"question\", \"expected_url\"})")
+    parser.add_argument("output", help="結果を書き出す JSONL ファイル")
+    parser.add_argument("--resume", action="store_true", help="結果ファイルで回答済みの質問を飛ばして続きから処理する")
+    parser.add_argument("--corpus", help="回答に使うコーパスの名前 (デフォルト: corpus.DEFAULT_CORPUS)")
+    parser.add_argument("--corpora-file", help="コーパスの定義ファイル (デフォルト: あれば corpus.CORPORA_FILE)")
+    parser.add_argument("--data", help="FAQデータファイル (コーパスの定義ファイルの設定より優先する)")
+    parser.add_argument("--mode", choices=qa_app.CONTEXT_MODES, default=BATCH_CONTEXT_MODE,
+                        help=f"FAQ情報の渡し方 (デフォルト: {BATCH_CONTEXT_MODE})")
+    parser.add_argument("--engine", choices=qa_app.RETRIEVAL_ENGINES, default=qa_app.RETRIEVAL_ENGINE,
+                        help=f"retrieval モードの検索方法 (デフォルト: {qa_app.RETRIEVAL_ENGINE})")
+    parser.add_argument("--top-k", type=int, default=qa_app.RETRIEVAL_TOP_K,
+                        help=f"retrieval モードで1回の質問に含めるFAQの件数 (デフォルト: {qa_app.RETRIEVAL_TOP_K})")
+    parser.add_argument("--backend", choices=MODEL_BACKENDS, default=qa_app.MODEL_BACKEND,
+                        help=f"モデルのバックエンド (デフォルト: {qa_app.MODEL_BACKEND})")
+    parser.add_argument("--fake-latency", type=float, default=0.0, help="fake バックエンドの1回の応答にかかる秒数")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS,
+                        help=f"同時に実行するワーカー数 (デフォルト: {BATCH_WORKERS})")
+    parser.add_argument("--rpm", type=float, default=BATCH_REQUESTS_PER_MINUTE,
+                        help=f"1分あたりのリクエスト数の上限 (デフォルト: {BATCH_REQUESTS_PER_MINUTE}、0 で無制限)")
+    parser.add_argument("--tpm", type=float, default=BATCH_TOKENS_PER_MINUTE,
+                        help=f"1分あたりのトークン数の上限 (デフォルト: {BATCH_TOKENS_PER_MINUTE}、0 で無制限)")
+    parser.add_argument("--no-cache", dest="cache", action="store_false", default=qa_app.ANSWER_CACHE_ENABLED,
+                        help="回答キャッシュを使わない")
+    parser.add_argument("--no-artifact", dest="artifact", action="store_false", default=qa_app.USE_ARTIFACT,
+                        help="アーティファクト (artifact.py) を使わず、FAQデータファイルから準備する")
+    parser.add_argument("--passages", action="store_true", default=qa_app.PASSAGE_CHUNKING,
+                        help="長いFAQの回答をパッセージに分割し、関連するパッセージだけをプロンプトに含める")
+    args = parser.parse_args()
+
+    try:
+        items = load_questions(args.questions)
+    except (IOError, OSError, ValueError) as e:
+        print(f"エラー: 質問ファイルの読み込みに失敗しました - {args.questions}\n{e}")
+        sys.exit(1)
+    if not items:
+        print(f"エラー: {args.questions} に質問がありません。")
+        sys.exit(1)
+    if args.resume and not os.path.exists(args.output):
+        print(f"警告: {args.output} がないため、最初から処理します。")
+
+    try:
+        corpus_config = select_corpus(load_corpora(args.corpora_file, qa_app.FAQ_DATA_FILE), args.corpus)
+    except (IOError, OSError, ValueError) as e:
+        print(f"エラー: コーパスの設定を読み込めませんでした。\n{e}")
+        sys.exit(1)
+    if args.data:
+        corpus_config = CorpusConfig(corpus_config.name, args.data, corpus_config.start_url,
+                                     corpus_config.prompt_prefix)
+    try:
+        backend = create_backend(args.backend, qa_app.MODEL_NAME, args.fake_latency)
+    except Exception as e:
+        print(f"エラー: モデルのバックエンド ({args.backend}) の初期化に失敗しました。\n{e}")
+        sys.exit(1)
+    try:
+        answerer = load_corpus_answerer(corpus_config, None, backend, mode=args.mode, engine=args.engine,
+                                        top_k=args.top_k, use_cache=args.cache, use_artifact=args.artifact,
+                                        passages=args.passages)
+    except ValueError as e:
+        print(f"エラー: {e} FAQデータを確認してください。")
+        sys.exit(1)
+
+    print(f"{len(items)} 件の質問に回答します。(ワーカー {args.workers}, RPM {args.rpm:g}, TPM {args.tpm:g})")
+    try:
+        run_batch(answerer, items, args.output, args.workers, ModelRateLimiter(args.rpm, args.tpm), args.resume)
+    finally:
+        answerer.close()
@@ -0,0 +1,508 @@
+# src/openlogi_ai_faq/benchmark.py (性能計測用スクリプト)
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urljoin, urlparse
+
+from . import crawler
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# --- 設定 (suite サブコマンド) ---
+# 合成ヘルプサイトのページ数 (トップページを除く)
+SUITE_PAGES = 500
+# 1ページから他のページへのリンク数
+SUITE_FANOUT = 5
+# FAQページ (faq_qstCont_ttl / faq_answer_contents を含むページ) の割合
+SUITE_FAQ_DENSITY = 0.6
+# load_faq_data / format_faq_context の計測に使う合成FAQデータの件数
+SUITE_RECORDS = 10000
+# 合成データの乱数のシード (同じ値なら同じサイト・データが生成される)
+SUITE_SEED = 1
+# 計測時のクロールの並行数とホストごとのレート制限 (ローカルサーバーなので実質無制限にする)
+SUITE_CONCURRENCY = 8
+SUITE_RATE_LIMIT = 100000
+# 解析時間の計測で全ページを解析する回数
+SUITE_PARSE_REPEAT = 3
+# 結果のJSONの形式のバージョン
+SUITE_RESULT_VERSION = 1
+
+
+def load_html_fixtures(paths, base_url=crawler.DEFAULT_START_URL):
+    """
+    保存済みのHTMLファイルを読み込み、(URL, HTML文字列) のリストを返す。
+    URL はファイル名を base_url に連結したもの (リンクの正規化に使われる)。
+    """
+    fixtures = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            raw = f.read()
+        fixtures.append((urljoin(base_url, os.path.basename(path)), raw.decode('utf-8', errors='replace')))
+    return fixtures
+
+
+def check_extract_parity(fixtures, backends=crawler.PARSER_BACKENDS):
+    """
+    各解析バックエンドの抽出結果 (faq_info とリンク集合) が一致するか確認する。
+
+    Returns:
+        list: 不一致のあった (URL, バックエンド名) のリスト。空なら全て一致。
+    """
+    mismatches = []
+    reference_backend = backends[0]
+    for url, html in fixtures:
+        expected = crawler.extract_page(html, url, reference_backend)
+        for backend in backends[1:]:
+            if crawler.extract_page(html, url, backend) != expected:
+                mismatches.append((url, backend))
+    return mismatches
+
+
+def bench_extract(fixtures, backends=crawler.PARSER_BACKENDS, repeat=5):
+    """
+    解析バックエンドごとに、fixtures を repeat 回解析したときのページ/秒を計測する。
+
+    Returns:
+        dict: バックエンド名 -> {'pages', 'seconds', 'pages_per_sec'}
+    """
+    results = {}
+    for backend in backends:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for url, html in fixtures:
+                crawler.extract_page(html, url, backend)
+        elapsed = time.perf_counter() - start
+        pages = len(fixtures) * repeat
+        results[backend] = {
+            'pages': pages,
+            'seconds': elapsed,
+            'pages_per_sec': pages / elapsed if elapsed > 0 else 0.0,
+        }
+    return results
+
+
+def run_extract_benchmark(paths, base_url=crawler.DEFAULT_START_URL, repeat=5):
+    """HTMLファイルを使って解析バックエンドの一致確認と速度比較を行い、結果を表示する。"""
+    fixtures = load_html_fixtures(paths, base_url)
+    if not fixtures:
+        print("エラー: HTMLファイルが指定されていません。")
+        return False
+
+    mismatches = check_extract_parity(fixtures)
+    if mismatches:
+        print(f"警告: {len(mismatches)} 件で抽出結果が一致しませんでした。")
+        for url, backend in mismatches:
+            print(f"  {backend}: {url}")
+    else:
+        print(f"{len(fixtures)} ページすべてで抽出結果が一致しました。")
+
+    results = bench_extract(fixtures, repeat=repeat)
+    print("-" * 30)
+    for backend, result in results.items():
+        print(f"  {backend:<12} {result['pages_per_sec']:10.1f} ページ/秒 ({result['pages']} ページ, {result['seconds']:.3f} 秒)")
+    print("-" * 30)
+    return not mismatches
+
+
+# 合成FAQの文面の材料
+_TOPICS = ["在庫", "出荷", "入荷", "返品", "請求書", "配送", "倉庫", "商品登録", "API連携", "送り状",
+           "ラッピング", "同梱物", "セット商品", "ロット管理", "賞味期限", "国際配送", "店舗連携", "CSV取込"]
+_ACTIONS = ["登録", "確認", "変更", "キャンセル", "設定", "取り消し", "ダウンロード", "一括更新"]
+_QUESTION_FORMS = ["{topic}の{action}方法を教えてください", "{topic}を{action}できますか？",
+                   "{topic}の{action}ができない場合はどうすればよいですか？", "{topic}の{action}に時間はかかりますか？"]
+_SENTENCES = ["管理画面の「{topic}」メニューから{action}できます。",
+              "{action}の操作は、ステータスが「{status}」の間のみ行えます。",
+              "{topic}の{action}は、CSVファイルで一括して行うこともできます。",
+              "反映までに最大{minutes}分ほどかかる場合があります。",
+              "詳しくは「{topic}について」のページをご確認ください。",
+              "{status}の{topic}は{action}の対象外です。",
+              "APIをご利用の場合は、{topic}のエンドポイントから{action}してください。",
+              "ご不明な点は、サポート窓口までお問い合わせください (受付番号: {number})。"]
+_STATUSES = ["未処理", "処理中", "出荷待ち", "出荷済み", "保留中", "入荷予定"]
+
+
+def synthetic_faq(rng, index):
+    """
+    合成FAQの (質問, 回答) を返す。同じ乱数の状態からは同じ文面になる。
+    質問には番号を含め、回答は文の組み合わせを変えて、重複に近いFAQが偏って生じないようにする。
+    """
+    topic, action = rng.choice(_TOPICS), rng.choice(_ACTIONS)
+    question = f"{rng.choice(_QUESTION_FORMS).format(topic=topic, action=action)} (No.{index})"
+    sentences = rng.sample(_SENTENCES, rng.randint(3, 6))
+    answer = "\n".join(sentence.format(topic=topic, action=action, status=rng.choice(_STATUSES),
+                                         minutes=rng.randint(5, 60), number=rng.randint(10000, 99999))
+                         for sentence in sentences)
+    return question, answer
+
+
+def synthetic_page_path(index, is_faq):
+    return f"/hc/ja/articles/{index}" if is_faq else f"/hc/ja/sections/{index}"
+
+
+def generate_site(pages=SUITE_PAGES, fanout=SUITE_FANOUT, faq_density=SUITE_FAQ_DENSITY, seed=SUITE_SEED):
+    """
+    クローラーの計測用に、ヘルプサイトを模した合成サイトを生成する。
+    FAQページはヘルプサイトと同じ h2.faq_qstCont_ttl と div#faq_answer_contents を持つ。
+    各ページは次のページ (全ページに到達できるようにするため) と、ランダムに選んだ fanout - 1 ページへリンクする。
+
+    Returns:
+        tuple[dict[str, bytes], int]: (パス -> HTML のバイト列, FAQページの数)。トップページのパスは "/"。
+    """
+    rng = random.Random(seed)
+    is_faq = [rng.random() < faq_density for _ in range(pages)]
+    paths = [synthetic_page_path(i, is_faq[i]) for i in range(pages)]
+    navigation = "".join(f'<li><a href="{paths[i]}">カテゴリ {i}</a></li>' for i in range(min(pages, 10)))
+    site = {}
+    for i in range(pages):
+        links = {paths[i + 1]} if i + 1 < pages else set()
+        while pages > 1 and len(links) < min(fanout, pages - 1):
+            target = rng.randrange(pages)
+            if target != i:
+                links.add(paths[target])
+        related = "".join(f'<li><a href="{path}">関連記事</a></li>' for path in sorted(links))
+        if is_faq[i]:
+            question, answer = synthetic_faq(rng, i)
+            paragraphs = "".join(f"<p>{line}</p>" for line in answer.split("\n"))
+            body = (f'<h2 class="faq_qstCont_ttl">{question}</h2>'
+                    f'<div id="faq_answer_contents">{paragraphs}</div>')
+        else:
+            body = f"<h1>セクション {i}</h1><p>このセクションの記事の一覧です。</p>"
+        site[paths[i]] = (
+            '<!DOCTYPE html><html lang="ja"><head><meta charset="utf-8">'
+            f'<title>ヘルプセンター {i}</title><script>var page = {i};</script></head>'
+            f'<body><header><nav><ul>{navigation}</ul></nav></header>'
+            f'<main>{body}<ul class="related">{related}</ul></main>'
+            '<footer><a href="/">ヘルプセンター トップ</a> <a href="/files/manual.pdf">マニュアル</a></footer>'
+            '</body></html>').encode('utf-8')
+    if pages:
+        site["/"] = (f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>トップ</title></head>'
+                     f'<body><a href="{paths[0]}">はじめに</a></body></html>').encode('utf-8')
+    return site, sum(is_faq)
+
+
+def generate_faq_records(count=SUITE_RECORDS, seed=SUITE_SEED, base_url="https://help.example.com"):
+    """load_faq_data / format_faq_context の計測用に、合成FAQレコードのリストを生成する。"""
+    rng = random.Random(seed)
+    records = []
+    for i in range(count):
+        question, answer = synthetic_faq(rng, i)
+        records.append({'question': question, 'answer': answer, 'url': f"{base_url}{synthetic_page_path(i, True)}"})
+    return records
+
+
+class SiteServer:
+    """
+    generate_site() のサイトをバックグラウンドのスレッドで配信するローカルHTTPサーバー。
+    with 文で使うと、終了時にサーバーを停止する。ポートは空いているものを自動で選ぶ。
+    """
+
+    def __init__(self, site, host="127.0.0.1"):
+        self.requests = 0
+        counter_lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                with counter_lock:
+                    server.requests += 1
+                body = site.get(urlparse(self.path).path)
+                self.send_response(200 if body is not None else 404)
+                body = body if body is not None else b"Not Found"
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer((host, 0), Handler)
+        self._httpd.daemon_threads = True
+        self.base_url = f"http://{host}:{self._httpd.server_address[1]}/"
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+def peak_rss_mb():
+    """このプロセスの最大常駐メモリ (MB)。取得できない環境では None。"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux は KB 単位、macOS はバイト単位
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def _crawl_phase(start_url, output_filename, concurrency, parser_backend):
+    with open(os.devnull, 'w', encoding='utf-8') as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        ok = crawler.crawl_site_for_faq(start_url, output_filename, concurrency=concurrency,
+                                        rate_limit=SUITE_RATE_LIMIT, checkpoint_interval=0,
+                                        parser_backend=parser_backend)
+        elapsed = time.perf_counter() - start
+    from .faq_io import iter_faq_records
+    faqs = sum(1 for _ in iter_faq_records(output_filename)) if ok else 0
+    return {'ok': bool(ok), 'seconds': elapsed, 'faqs': faqs, 'peak_rss_mb': peak_rss_mb()}
+
+
+def _load_phase(data_filename):
+    from . import qa_app
+    results = {}
+    with open(os.devnull, 'w', encoding='utf-8') as devnull, contextlib.redirect_stdout(devnull):
+        # 1回目は重複検出の結果のキャッシュがない状態、2回目はキャッシュがある状態
+        for label in ('cold', 'cached'):
+            start = time.perf_counter()
+            faq_data = qa_app.load_faq_data(data_filename)
+            results[f'load_{label}_seconds'] = time.perf_counter() - start
+        start = time.perf_counter()
+        context, _ = qa_app.format_faq_context(faq_data)
+        results['format_seconds'] = time.perf_counter() - start
+    results.update({'records': len(faq_data), 'context_chars': len(context), 'peak_rss_mb': peak_rss_mb()})
+    return results
+
+
+def _package_env():
+    """このパッケージを読み込めるよう PYTHONPATH を設定した、子プロセス用の環境変数。"""
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [package_root, os.environ.get('PYTHONPATH')])))
+
+
+def _run_qa_app(workdir, *options):
+    """
+    workdir でQ&Aアプリを新しいプロセスとして起動し (fake バックエンド, データの更新はしない)、すぐに終了させる。
+
+    Returns:
+        tuple[float, float]: (アプリが報告した起動時間, プロセスの開始から終了までの時間) (秒)。
+    """
+    metrics_filename = os.path.join(workdir, "startup_metrics.json")
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-m', 'openlogi_ai_faq.qa_app', '--backend', 'fake', '--session', 'stateless',
+                    '--no-cache', '--metrics-file', metrics_filename, *options],
+                   input="n\nquit\n", capture_output=True, text=True, cwd=workdir, env=_package_env(), check=True)
+    elapsed = time.perf_counter() - start
+    with open(metrics_filename, 'r', encoding='utf-8') as f:
+        samples = json.load(f)['metrics']['qa_startup_seconds']['samples']
+    return samples[0]['value'], elapsed
+
+
+def _startup_phase(workdir, faq_data):
+    """
+    Q&Aアプリ ('full' モード) を新しいプロセスで起動し、最初の質問を受け付けられるまでの時間を計測する。
+    アーティファクトを使わない場合 (重複検出の結果はキャッシュ済み)、アーティファクトを作成する初回、
+    アーティファクトがある場合の3通りと、qa_app モジュールの読み込み時間を計測する。
+    """
+    from .faq_io import DEFAULT_FAQ_FILENAME
+    appdir = os.path.join(workdir, "qa_startup")
+    os.makedirs(appdir, exist_ok=True)
+    with open(os.path.join(appdir, DEFAULT_FAQ_FILENAME), 'w', encoding='utf-8') as f:
+        json.dump(faq_data, f, ensure_ascii=False, indent=4)
+
+    results = {}
+    _run_qa_app(appdir, '--no-artifact')  # 重複検出の結果のキャッシュを作る
+    for label, options in (('without_artifact', ('--no-artifact',)), ('artifact_build', ()), ('with_artifact', ())):
+        startup, elapsed = _run_qa_app(appdir, *options)
+        results[f'{label}_seconds'] = startup
+        results[f'{label}_process_seconds'] = elapsed
+    output = subprocess.run(
+        [sys.executable, '-c', 'import time; start = time.perf_counter(); import openlogi_ai_faq.qa_app; '
+                               'print(time.perf_counter() - start)'],
+        capture_output=True, text=True, check=True, cwd=appdir, env=_package_env())
+    results['import_seconds'] = float(output.stdout.strip())
+    results['records'] = len(faq_data)
+    return results
+
+
+def _run_isolated(function, *args):
+    """
+    function(*args) を新しいプロセスで実行して結果を返す。
+    最大常駐メモリを計測ごとに分けて測るため、計測の段階ごとにプロセスを分ける。
+    """
+    with multiprocessing.get_context('spawn').Pool(1) as pool:
+        return pool.apply(function, args)
+
+
+def git_commit():
+    """作業ツリーの git のコミットID (取得できない場合は None)。"""
+    try:
+        result = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, timeout=10,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return result.stdout.strip() or None
+
+
+def run_suite(pages=SUITE_PAGES, fanout=SUITE_FANOUT, faq_density=SUITE_FAQ_DENSITY, records=SUITE_RECORDS,
+              seed=SUITE_SEED, concurrency=SUITE_CONCURRENCY, parser_backend=crawler.PARSER_BACKEND,
+              repeat=SUITE_PARSE_REPEAT):
+    """
+    合成ヘルプサイトと合成FAQデータでクローラーとQ&Aアプリの性能を計測する。
+    クロール (ページ/秒)、1ページあたりの解析時間 (バックエンドごと)、load_faq_data と
+    format_faq_context の時間、各段階の最大常駐メモリ、Q&Aアプリの起動時間 (アーティファクトの有無別) を計測する。
+
+    Returns:
+        dict: JSON に変換できる計測結果 (実行環境・パラメーター・結果)。
+    """
+    site, faq_pages = generate_site(pages, fanout, faq_density, seed)
+    result = {
+        'version': SUITE_RESULT_VERSION,
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'params': {'pages': pages, 'fanout': fanout, 'faq_density': faq_density, 'records': records,
+                   'seed': seed, 'concurrency': concurrency, 'parser_backend': parser_backend,
+                   'parse_repeat': repeat},
+    }
+
+    with tempfile.TemporaryDirectory(prefix="faq_bench_") as workdir:
+        with SiteServer(site) as server:
+            crawl = _run_isolated(_crawl_phase, server.base_url, os.path.join(workdir, "crawl.json"),
+                                  concurrency, parser_backend)
+            fetched = server.requests
+        crawl.update({'requests': fetched, 'faq_pages': faq_pages,
+                      'pages_per_sec': fetched / crawl['seconds'] if crawl['seconds'] > 0 else 0.0})
+        result['crawl'] = crawl
+
+        fixtures = [(urljoin(server.base_url, path), html.decode('utf-8')) for path, html in site.items()]
+        result['parse'] = {backend: dict(stats, ms_per_page=1000 * stats['seconds'] / stats['pages'] if stats['pages'] else 0.0)
+                           for backend, stats in bench_extract(fixtures, repeat=repeat).items()}
+
+        faq_data = generate_faq_records(records, seed)
+        for fmt in ('json', 'jsonl'):
+            data_filename = os.path.join(workdir, f"faq_data.{fmt}")
+            with open(data_filename, 'w', encoding='utf-8') as f:
+                if fmt == 'json':
+                    json.dump(faq_data, f, ensure_ascii=False, indent=4)
+                else:
+                    f.writelines(json.dumps(faq, ensure_ascii=False) + "\n" for faq in faq_data)
+            result[f'qa_{fmt}'] = _run_isolated(_load_phase, data_filename)
+        result['qa_startup'] = _startup_phase(workdir, faq_data)
+    return result
+
+
+def print_suite_summary(result):
+    """run_suite() の結果を人が読める形で表示する。"""
+    crawl = result['crawl']
+    print("-" * 30)
+    print(f"クロール: {crawl['pages_per_sec']:.1f} ページ/秒 ({crawl['requests']} リクエスト, FAQ {crawl['faqs']} 件, "
+          f"{crawl['seconds']:.2f} 秒, 最大メモリ {crawl['peak_rss_mb']} MB)")
+    for backend, stats in result['parse'].items():
+        print(f"解析 ({backend}): {stats['ms_per_page']:.3f} ミリ秒/ページ")
+    for fmt in ('json', 'jsonl'):
+        qa = result[f'qa_{fmt}']
+        print(f"読み込み ({fmt}, {qa['records']} 件): load_faq_data {qa['load_cold_seconds']:.3f} 秒 "
+              f"(キャッシュあり {qa['load_cached_seconds']:.3f} 秒), format_faq_context {qa['format_seconds']:.3f} 秒, "
+              f"最大メモリ {qa['peak_rss_mb']} MB")
+    startup = result.get('qa_startup')
+    if startup:
+        print(f"起動 ({startup['records']} 件, full モード): アーティファクトなし {startup['without_artifact_seconds']:.3f} 秒, "
+              f"アーティファクトの作成 {startup['artifact_build_seconds']:.3f} 秒, "
+              f"アーティファクトあり {startup['with_artifact_seconds']:.3f} 秒 "
+              f"(qa_app の読み込み {startup['import_seconds']:.3f} 秒)")
+    print("-" * 30)
+
+
+def _flatten(value, prefix=""):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from _flatten(item, f"{prefix}{key}.")
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        yield prefix[:-1], value
+
+
+def compare_results(base, current):
+    """
+    2回の run_suite() の結果の数値を比べ、(項目名, 前回, 今回, 比率) のリストを返す。
+    パラメーターなど計測値でない項目は含めない。
+    """
+    base_values = dict(_flatten({k: v for k, v in base.items() if k not in ('params', 'version', 'cpu_count')}))
+    rows = []
+    for key, value in _flatten({k: v for k, v in current.items() if k not in ('params', 'version', 'cpu_count')}):
+        if key in base_values:
+            previous = base_values[key]
+            rows.append((key, previous, value, value / previous if previous else None))
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="クローラーの性能計測")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    extract_parser = subparsers.add_parser("extract", help="保存済みHTMLで解析バックエンドを比較する")
+    extract_parser.add_argument("html_files", nargs="+", help="保存済みのHTMLファイル")
+    extract_parser.add_argument("--base-url", default=crawler.DEFAULT_START_URL, help="HTMLファイルのURLとみなすベースURL")
+    extract_parser.add_argument("--repeat", type=int, default=5, help="計測の繰り返し回数")
+
+    suite_parser = subparsers.add_parser("suite", help="合成ヘルプサイトでクロールとQ&Aアプリの性能を計測する")
+    suite_parser.add_argument("--pages", type=int, default=SUITE_PAGES, help=f"合成サイトのページ数 (デフォルト: {SUITE_PAGES})")
+    suite_parser.add_argument("--fanout", type=int, default=SUITE_FANOUT, help=f"1ページあたりのリンク数 (デフォルト: {SUITE_FANOUT})")
+    suite_parser.add_argument("--faq-density", type=float, default=SUITE_FAQ_DENSITY,
+                              help=f"FAQページの割合 (デフォルト: {SUITE_FAQ_DENSITY})")
+    suite_parser.add_argument("--records", type=int, default=SUITE_RECORDS,
+                              help=f"読み込みの計測に使うFAQの件数 (デフォルト: {SUITE_RECORDS})")
+    suite_parser.add_argument("--seed", type=int, default=SUITE_SEED, help="合成データの乱数のシード")
+    suite_parser.add_argument("--concurrency", type=int, default=SUITE_CONCURRENCY,
+                              help=f"クロールの並行数 (デフォルト: {SUITE_CONCURRENCY})")
+    suite_parser.add_argument("--parser", choices=crawler.PARSER_BACKENDS, default=crawler.PARSER_BACKEND,
+                              help="クロールで使うHTML解析バックエンド")
+    suite_parser.add_argument("--repeat", type=int, default=SUITE_PARSE_REPEAT, help="解析時間の計測の繰り返し回数")
+    suite_parser.add_argument("--output", help="計測結果のJSONの保存先 (省略時は標準出力に出力する)")
+
+    compare_parser = subparsers.add_parser("compare", help="suite の2つの計測結果を比べる")
+    compare_parser.add_argument("base", help="比較元の計測結果のJSONファイル")
+    compare_parser.add_argument("current", help="比較先の計測結果のJSONファイル")
+
+    args = parser.parse_args()
+    if args.command == "extract":
+        ok = run_extract_benchmark(args.html_files, args.base_url, args.repeat)
+        sys.exit(0 if ok else 1)
+    elif args.command == "suite":
+        result = run_suite(args.pages, args.fanout, args.faq_density, args.records, args.seed,
+                           args.concurrency, args.parser, args.repeat)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(result, f, ensure_ascii=False, indent=2)
+            print_suite_summary(result)
+            print(f"計測結果を保存しました: {args.output}")
+        else:
+            print(json.dumps(result, ensure_ascii=False, indent=2))
+        sys.exit(0 if result['crawl']['ok'] else 1)
+    elif args.command == "compare":
+        try:
+            with open(args.base, 'r', encoding='utf-8') as f:
+                base = json.load(f)
+            with open(args.current, 'r', encoding='utf-8') as f:
+                current = json.load(f)
+        except (IOError, OSError, json.JSONDecodeError) as e:
+            print(f"エラー: 計測結果の読み込みに失敗しました\n{e}")
+            sys.exit(1)
+        print(f"比較元: {base.get('git_commit')} ({base.get('timestamp')})")
+        print(f"比較先: {current.get('git_commit')} ({current.get('timestamp')})")
+        if base.get('params') != current.get('params'):
+            print("警告: 計測のパラメーターが異なります。")
+        for key, previous, value, ratio in compare_results(base, current):
+            change = f"{ratio:6.2f}x" if ratio is not None else "     -"
+            print(f"  {key:<40} {previous:>14.4f} -> {value:>14.4f}  {change}")
@@ -0,0 +1,231 @@
+# src/openlogi_ai_faq/chunking.py (長いFAQの回答のパッセージ分割: 見出し・段落・文字数の上限で区切る)
+import argparse
+import re
+import sys
+
+from . import metrics
+from .context_packing import heuristic_tokens
+from .faq_io import DEFAULT_FAQ_FILENAME
+
+# --- 設定 ---
+# パッセージの最大文字数 (これより長い回答は見出し・段落 (行) の区切りで分け、それでも長い行は文の区切りで分ける)
+PASSAGE_MAX_CHARS = 400
+# パッセージの最小文字数 (見出しの直後でも、ここまでは次の行と同じパッセージにする。見出しだけのパッセージを作らないため)
+PASSAGE_MIN_CHARS = 80
+# 見出しとみなす行の先頭 (■・【】・「STEP 1」・「1.」・「①」など。この行の前でパッセージを区切る)
+HEADING_RE = re.compile(r'(?:[■□●◆◇▼▽▶▷★☆【]|(?:STEP|Step|step|ステップ|手順)\s*[0-9０-９]+|[0-9０-９]+[.．)）](?![0-9０-９])\s*\S|[①-⑳])')
+# 1つのFAQから1回のプロンプトに含めるパッセージの最大数 ('retrieval' モード)
+PASSAGES_PER_FAQ = 2
+# 省略した部分の代わりに回答に入れる印
+OMISSION_MARK = "(…)"
+# --- 設定ここまで ---
+
+PASSAGE_ANSWER_TOKENS = metrics.counter(
+    'passage_answer_tokens_total',
+    "パッセージ単位で選んだFAQの回答の推定トークン数 (kind: passages / whole (回答全体を含めた場合))")
+
+# 1行 (改行を含まない連続した文字)
+_LINE_RE = re.compile(r'[^\n]+')
+# 文の終わり (句点・感嘆符・疑問符と、続く閉じ括弧)
+_SENTENCE_END_RE = re.compile(r'[。．！？!?][」』)）]*')
+
+
+def _segments(answer, max_chars):
+    """
+    回答を、パッセージの最小単位 (行。max_chars より長い行は文、さらに長い文は max_chars 文字ごと) に分ける。
+
+    Returns:
+        Iterator[tuple[int, int, bool]]: (開始位置, 終了位置, 見出しの行か)。
+    """
+    for line in _LINE_RE.finditer(answer):
+        start, end = line.span()
+        heading = HEADING_RE.match(answer, start, end) is not None
+        if end - start <= max_chars:
+            yield start, end, heading
+            continue
+        breaks = [m.end() for m in _SENTENCE_END_RE.finditer(answer, start, end)]
+        if not breaks or breaks[-1] != end:
+            breaks.append(end)
+        for stop in breaks:
+            while stop - start > max_chars:
+                yield start, start + max_chars, heading
+                start, heading = start + max_chars, False
+            if stop > start:
+                yield start, stop, heading
+                start, heading = stop, False
+
+
+def split_answer(answer, max_chars=PASSAGE_MAX_CHARS, min_chars=PASSAGE_MIN_CHARS):
+    """
+    回答をパッセージに分割する。
+    見出しの行の前 (直前のパッセージが min_chars 以上の場合) と、max_chars を超える前の行・文の区切りで区切る。
+    最後のパッセージが min_chars より短い場合は、直前のパッセージにまとめる。
+
+    Args:
+        answer (str): FAQの回答。
+        max_chars (int): パッセージの最大文字数。これ以下の回答は分割しない。
+        min_chars (int): パッセージの最小文字数。
+
+    Returns:
+        list[tuple[int, int]]: パッセージの回答の中での (開始位置, 終了位置)。回答の順。
+    """
+    if len(answer) <= max_chars:
+        return [(0, len(answer))]
+    spans = []
+    start = end = None
+    for seg_start, seg_end, heading in _segments(answer, max_chars):
+        if start is not None and ((heading and end - start >= min_chars) or seg_end - start > max_chars):
+            spans.append((start, end))
+            start = None
+        if start is None:
+            start = seg_start
+        end = seg_end
+    if start is not None:
+        spans.append((start, end))
+    if len(spans) > 1 and spans[-1][1] - spans[-1][0] < min_chars:
+        spans[-2:] = [(spans[-2][0], spans[-1][1])]
+    return spans
+
+
+def chunk_records(faq_data, max_chars=PASSAGE_MAX_CHARS, min_chars=PASSAGE_MIN_CHARS):
+    """
+    FAQデータをパッセージのリストにする。
+    パッセージはFAQレコードと同じ形式 ('question', 'answer', 'url') なので、検索インデックスの作成や
+    context_packing.record_priorities にそのまま渡せる。質問・URL・カテゴリは親のFAQのもの。
+
+    Returns:
+        list[dict]: パッセージ {'question', 'answer' (パッセージの本文), 'url', 'parent' (faq_data での位置),
+                    'start', 'end' (親の回答の中での文字位置)}。質問・回答・URLが揃っていないFAQは含めない。
+    """
+    passages = []
+    for parent, faq in enumerate(faq_data):
+        question, answer, url = faq.get('question'), faq.get('answer'), faq.get('url')
+        if not (question and answer and url):
+            continue
+        for start, end in split_answer(answer, max_chars, min_chars):
+            passage = {'question': question, 'answer': answer[start:end], 'url': url,
+                       'parent': parent, 'start': start, 'end': end}
+            if faq.get('category') is not None:
+                passage['category'] = faq.get('category')
+            passages.append(passage)
+    return passages
+
+
+def merge_passages(faq_data, passages):
+    """
+    選んだパッセージを親のFAQごとにまとめて、プロンプトに含めるFAQレコードにする。
+    同じFAQのパッセージは回答の中の順に並べ、含めなかった部分は OMISSION_MARK の1行にする
+    (質問と参照URLは親のFAQのまま)。
+
+    Args:
+        faq_data (list[dict]): chunk_records に渡したFAQデータ。
+        passages (list[dict]): 選んだパッセージ (優先する順)。
+
+    Returns:
+        list[dict]: {'question', 'answer', 'url', 'parent'}。最初にパッセージが選ばれたFAQの順。
+    """
+    groups = {}
+    for passage in passages:
+        groups.setdefault(passage['parent'], []).append(passage)
+    records = []
+    for parent, group in groups.items():
+        faq = faq_data[parent]
+        answer = faq['answer']
+        parts = []
+        position = 0
+        for passage in sorted(group, key=lambda p: p['start']):
+            if passage['start'] < position:
+                continue
+            gap = answer[position:passage['start']]
+            # 隣り合うパッセージの間は元の改行のまま、含めなかった部分は省略の印にする
+            parts.append(("\n" if parts else "") + OMISSION_MARK + "\n" if gap.strip() else gap)
+            parts.append(answer[passage['start']:passage['end']])
+            position = passage['end']
+        if answer[position:].strip():
+            parts.append("\n" + OMISSION_MARK)
+        records.append({'question': faq['question'], 'answer': "".join(parts), 'url': faq['url'], 'parent': parent})
+    return records
+
+
+def retrieve_passages(index, faq_data, passages, question, top_k, passages_per_faq=PASSAGES_PER_FAQ):
+    """
+    質問に関連するパッセージを検索し、親のFAQごとにまとめて返す (retrieval.retrieve_faqs のパッセージ版)。
+    関連度の高い順に、親のFAQが top_k 件になるまで、1つのFAQにつき passages_per_faq 件までのパッセージを集める。
+
+    Args:
+        index: passages から作った BM25Index または vector_search.VectorIndex。
+        faq_data (list[dict]): chunk_records に渡したFAQデータ。
+        passages (list[dict]): chunk_records の結果。
+        question (str): 質問文。
+        top_k (int): 含めるFAQの最大件数。
+        passages_per_faq (int): 1つのFAQから含めるパッセージの最大数。
+
+    Returns:
+        list[dict]: merge_passages の結果 (関連度の高い順)。
+    """
+    counts = {}
+    chosen = []
+    for doc_id, _ in index.search(question, top_k * passages_per_faq * 2):
+        parent = passages[doc_id]['parent']
+        if counts.get(parent, 0) >= passages_per_faq or (parent not in counts and len(counts) >= top_k):
+            continue
+        counts[parent] = counts.get(parent, 0) + 1
+        chosen.append(passages[doc_id])
+    return merge_passages(faq_data, chosen)
+
+
+def answer_tokens(faq_data, merged):
+    """
+    パッセージをまとめたFAQの回答の推定トークン数を、回答全体を含めた場合と比べる。
+    結果は計測値 (passage_answer_tokens_total) にも加える。
+
+    Returns:
+        tuple[int, int]: (回答全体の場合のトークン数, パッセージだけの場合のトークン数)。
+    """
+    whole = passages = 0
+    for record in merged:
+        whole += round(heuristic_tokens(faq_data[record['parent']]['answer']))
+        passages += round(heuristic_tokens(record['answer']))
+    PASSAGE_ANSWER_TOKENS.inc(whole, kind='whole')
+    PASSAGE_ANSWER_TOKENS.inc(passages, kind='passages')
+    return whole, passages
+
+
+def format_savings(whole, passages):
+    """answer_tokens の結果 (の合計) を表示用の文字列にする。"""
+    saved = whole - passages
+    rate = saved / whole if whole else 0.0
+    return f"パッセージ: 回答の推定 {passages:,} トークン (回答全体の場合 {whole:,} トークン, 削減 {saved:,}, {rate:.0%})"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="FAQの回答をパッセージに分割した結果を表示する")
+    parser.add_argument("query", nargs='?', help="検索する質問文 (指定した場合は、選ばれるパッセージと削減できるトークン数を表示する)")
+    parser.add_argument("--data", default=DEFAULT_FAQ_FILENAME, help="FAQデータファイル")
+    parser.add_argument("--top-k", type=int, default=5, help="検索で選ぶFAQの件数 (デフォルト: 5)")
+    parser.add_argument("--max-chars", type=int, default=PASSAGE_MAX_CHARS,
+                        help=f"パッセージの最大文字数 (デフォルト: {PASSAGE_MAX_CHARS})")
+    parser.add_argument("--min-chars", type=int, default=PASSAGE_MIN_CHARS,
+                        help=f"パッセージの最小文字数 (デフォルト: {PASSAGE_MIN_CHARS})")
+    args = parser.parse_args()
+
+    # Q&Aアプリと同じ手順 (重複の除去を含む) で読み込む
+    from .qa_app import load_faq_data
+    faq_data = load_faq_data(args.data)
+    if faq_data is None:
+        print(f"エラー: FAQデータの読み込みに失敗しました - {args.data}")
+        sys.exit(1)
+    passages = chunk_records(faq_data, args.max_chars, args.min_chars)
+    split = {}
+    for passage in passages:
+        split[passage['parent']] = split.get(passage['parent'], 0) + 1
+    print(f"FAQ {len(split)} 件 -> パッセージ {len(passages)} 件 "
+          f"(分割したFAQ {sum(1 for count in split.values() if count > 1)} 件, 最大 {max(split.values(), default=0)} 個)")
+
+    if args.query:
+        from .retrieval import BM25Index
+        merged = retrieve_passages(BM25Index.build(passages), faq_data, passages, args.query, args.top_k)
+        for record in merged:
+            print(f"--- {record['question']}  {record['url']}")
+            print(record['answer'])
+        print(format_savings(*answer_tokens(faq_data, merged)))
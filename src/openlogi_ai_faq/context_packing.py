@@ -0,0 +1,407 @@
+# src/openlogi_ai_faq/context_packing.py ('full' モードのコンテキストに含めるFAQの選択: トークン数の見積もりと優先度)
+import argparse
+import hashlib
+import json
+import random
+import re
+import sys
+from datetime import timezone
+from email.utils import parsedate_to_datetime
+
+from .faq_io import page_cache_filename, write_json_atomic
+from .retrieval import BM25Index
+
+# モデルごとのコンテキストの上限 (トークン数)
+MODEL_CONTEXT_TOKENS = {
+    "gemini-1.5-flash-latest": 1048576,
+    "gemini-1.5-pro-latest": 2097152,
+    "gemini-2.5-pro-exp-03-25": 1048576,
+    "gemini-2.5-pro-preview-03-25": 1048576,
+}
+# 上記にないモデルのコンテキストの上限
+DEFAULT_CONTEXT_TOKENS = 1000000
+# コンテキストの上限のうち、会話履歴・質問・回答のために空けておくトークン数
+CONTEXT_RESERVED_TOKENS = 50000
+
+# トークン数の簡易見積もりに使う係数 (count_tokens の実測値で補正する前の初期値)
+#   ASCII 以外の文字 (かな・漢字・全角文字など) は1文字あたり TOKENS_PER_CJK_CHAR トークン、
+#   英数字は CHARS_PER_ASCII_TOKEN 文字で1トークン、ASCII の記号・改行は1文字1トークン、空白は0とみなす
+TOKENS_PER_CJK_CHAR = 0.8
+CHARS_PER_ASCII_TOKEN = 4
+# 実測したトークン数のキャッシュファイルの接尾辞 (FAQデータファイルと同じ場所に保存する)
+TOKEN_COUNTS_SUFFIX = ".tokens.json"
+TOKEN_COUNTS_VERSION = 1
+# 補正係数を計算するのに必要な実測済みレコードの最小件数
+CALIBRATION_MIN_SAMPLES = 5
+# 実測値が CALIBRATION_MIN_SAMPLES 件に満たない場合の補正係数。簡易見積もりが実際より少なくても上限を超えないよう、
+# かな・漢字を1文字1トークンとみなす程度に大きめに見積もる (予算に含められるFAQは実測した場合より少なくなる)
+UNCALIBRATED_SCALE = 1.25
+# 実測値がない場合に、Q&Aアプリ・サーバー・一括処理の起動時に実測するFAQの件数 (0 の場合は実測しない)
+AUTO_CALIBRATE_SAMPLES = 10
+
+# 優先度の重み (関連度、新しさ、カテゴリ)。優先度の高いFAQから順にコンテキストに入れる
+PRIORITY_WEIGHTS = {'relevance': 1.0, 'freshness': 0.3, 'category': 0.5}
+# 関連度の計算に使う質問 (よく聞かれる質問など)。--focus-file でも指定できる
+FOCUS_QUERIES = []
+# 1つの質問について関連度を与えるFAQの件数
+FOCUS_TOP_K = 20
+# カテゴリの重み: URLに一致する正規表現 -> 0〜1 の重み (レコードに 'category' がある場合はカテゴリ名でも指定できる)
+# 例: {r'/faq/shipping': 1.0, r'/faq/billing': 0.5}
+CATEGORY_WEIGHTS = {}
+
+_ASCII_ALNUM = b'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789'
+# 英数字以外の ASCII 文字 (英数字の数を数えるときに削除する)
+_ASCII_NON_ALNUM = bytes(c for c in range(128) if c not in _ASCII_ALNUM)
+# 英数字と改行以外の空白 (記号と改行の数を数えるときに削除する)
+_ASCII_ALNUM_AND_SPACE = _ASCII_ALNUM + b' \t\r\x0b\x0c'
+
+
+def context_budget(model_name, reserved=CONTEXT_RESERVED_TOKENS):
+    """モデルのコンテキストのうち、FAQ情報に使えるトークン数を返す。"""
+    return max(0, MODEL_CONTEXT_TOKENS.get(model_name, DEFAULT_CONTEXT_TOKENS) - reserved)
+
+
+def heuristic_tokens(text):
+    """文字の種類ごとの係数でトークン数を見積もる (補正前)。"""
+    # 正規表現より速いため、ASCII 部分をバイト列にして文字の種類ごとの数を数える
+    ascii_bytes = text.encode('ascii', 'ignore')
+    non_ascii = len(text) - len(ascii_bytes)
+    alnum = len(ascii_bytes.translate(None, _ASCII_NON_ALNUM))
+    symbols = len(ascii_bytes.translate(None, _ASCII_ALNUM_AND_SPACE))
+    return non_ascii * TOKENS_PER_CJK_CHAR + alnum / CHARS_PER_ASCII_TOKEN + symbols
+
+
+def token_counts_filename(data_filename):
+    """FAQデータファイル名に対応するトークン数キャッシュのファイル名を返す。"""
+    return data_filename + TOKEN_COUNTS_SUFFIX
+
+
+def _text_key(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:20]
+
+
+class TokenEstimator:
+    """
+    テキストのトークン数を見積もる。
+    モデルの count_tokens で実測したトークン数をテキストのハッシュごとにキャッシュし、
+    実測済みのテキストはその値を、それ以外は簡易見積もりに「実測値 / 簡易見積もり」の比 (補正係数) を掛けた値を返す。
+    実測値が少ない間は、補正係数の代わりに UNCALIBRATED_SCALE を掛けて大きめに見積もる。
+    トークナイザーはモデルによって異なるため、キャッシュはモデル名ごとに持つ。
+    """
+
+    def __init__(self, model_name, filename=None):
+        """
+        Args:
+            model_name (str): トークン数を実測するモデル名。
+            filename (str | None): 実測値のキャッシュファイル名。Noneの場合は保存しない。
+        """
+        self.model_name = model_name
+        self.filename = filename
+        self._counts = {}   # テキストのハッシュ -> [実測値, 簡易見積もり]
+        self.scale = UNCALIBRATED_SCALE
+        if filename:
+            self._load()
+        self._update_scale()
+
+    def _load(self):
+        try:
+            with open(self.filename, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (json.JSONDecodeError, IOError, OSError) as e:
+            print(f"警告: トークン数のキャッシュの読み込みに失敗しました - {self.filename}\n{e}")
+            return
+        if not isinstance(data, dict) or data.get('version') != TOKEN_COUNTS_VERSION:
+            return
+        counts = data.get('models', {}).get(self.model_name, {})
+        if isinstance(counts, dict):
+            self._counts = {key: value for key, value in counts.items() if isinstance(value, list) and len(value) == 2}
+
+    def save(self):
+        """実測値をキャッシュファイルに保存する (他のモデルの実測値は残す)。"""
+        if not self.filename:
+            return False
+        try:
+            with open(self.filename, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if not isinstance(data, dict) or data.get('version') != TOKEN_COUNTS_VERSION:
+                raise ValueError
+        except (FileNotFoundError, json.JSONDecodeError, ValueError, IOError, OSError):
+            data = {'version': TOKEN_COUNTS_VERSION, 'models': {}}
+        data.setdefault('models', {})[self.model_name] = self._counts
+        try:
+            write_json_atomic(self.filename, data)
+            return True
+        except (IOError, OSError) as e:
+            print(f"警告: トークン数のキャッシュの保存に失敗しました - {self.filename}\n{e}")
+            return False
+
+    def _update_scale(self):
+        if not self.calibrated:
+            self.scale = UNCALIBRATED_SCALE
+            return
+        actual = sum(value[0] for value in self._counts.values())
+        estimated = sum(value[1] for value in self._counts.values())
+        self.scale = actual / estimated if estimated else 1.0
+
+    @property
+    def calibrated_count(self):
+        """実測済みのテキストの件数。"""
+        return len(self._counts)
+
+    @property
+    def calibrated(self):
+        """補正係数を計算できるだけの実測値があるかどうか。"""
+        return len(self._counts) >= CALIBRATION_MIN_SAMPLES
+
+    def count(self, text):
+        """
+        テキストのトークン数を返す。
+
+        Returns:
+            tuple[int, bool]: (トークン数, 実測値かどうか)
+        """
+        cached = self._counts.get(_text_key(text))
+        if cached is not None:
+            return cached[0], True
+        return max(1, round(heuristic_tokens(text) * self.scale)), False
+
+    def estimate(self, text):
+        """テキストのトークン数を返す (実測値があればそれを使う)。"""
+        return self.count(text)[0]
+
+    def calibrate(self, texts, counter, samples):
+        """
+        まだ実測していないテキストから最大 samples 件を無作為に選び、counter(text) で実測してキャッシュする。
+
+        Args:
+            texts (Iterable[str]): 候補のテキスト。
+            counter (callable): テキストのトークン数を返す関数 (GeminiBackend.count_tokens など)。
+            samples (int): 実測する最大件数。
+
+        Returns:
+            int: 実測した件数。
+
+        Raises:
+            Exception: counter が失敗した場合 (それまでの実測値は保存される)。
+        """
+        candidates = list({_text_key(text): text for text in texts if _text_key(text) not in self._counts}.items())
+        chosen = random.sample(candidates, min(samples, len(candidates)))
+        measured = 0
+        try:
+            for key, text in chosen:
+                self._counts[key] = [int(counter(text)), heuristic_tokens(text)]
+                measured += 1
+        finally:
+            self._update_scale()
+            if measured:
+                self.save()
+        return measured
+
+
+def load_focus_queries(filename):
+    """
+    関連度の計算に使う質問をファイルから読み込む。
+    1行に1つの質問 (テキスト) か、batch.py の質問ファイルと同じ {"question": ...} 形式の JSONL。
+    """
+    queries = []
+    with open(filename, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                record = line
+            if isinstance(record, dict):
+                record = record.get('question') or ''
+            if isinstance(record, str) and record.strip():
+                queries.append(record.strip())
+    return queries
+
+
+def load_page_timestamps(data_filename):
+    """
+    クロール時のページキャッシュから、URLごとの更新日時 (サイトマップの lastmod または Last-Modified) を返す。
+
+    Returns:
+        dict[str, float]: URL -> UNIX 時刻。ページキャッシュがない場合は空の辞書。
+    """
+    # クローラー (requests, BeautifulSoup, lxml) の読み込みは、Q&Aアプリの起動を遅くしないよう必要になるまで遅らせる
+    from .crawler import load_page_cache
+    from .sitemap import parse_lastmod
+
+    timestamps = {}
+    for url, entry in load_page_cache(page_cache_filename(data_filename)).items():
+        if not isinstance(entry, dict):
+            continue
+        modified = parse_lastmod(entry.get('lastmod'))
+        if modified is None and entry.get('last_modified'):
+            try:
+                modified = parsedate_to_datetime(entry['last_modified'])
+            except (TypeError, ValueError):
+                modified = None
+        if modified is not None:
+            if modified.tzinfo is None:
+                modified = modified.replace(tzinfo=timezone.utc)
+            timestamps[url] = modified.timestamp()
+    return timestamps
+
+
+def _category_weight(faq, category_weights):
+    weight = 0.0
+    for pattern, value in category_weights.items():
+        if faq.get('category') == pattern or re.search(pattern, faq.get('url', '')):
+            weight = max(weight, value)
+    return weight
+
+
+def record_priorities(faq_data, focus_queries=(), timestamps=None, category_weights=None,
+                      weights=None, focus_top_k=FOCUS_TOP_K):
+    """
+    FAQごとのコンテキストへの優先度を計算する (値が大きいほど優先)。
+
+    - 関連度: focus_queries の各質問で BM25 検索し、上位のFAQにスコア (1位を 1 とした比) を足したもの。
+    - 新しさ: timestamps の更新日時を、最も古いものを 0、最も新しいものを 1 とした値。
+    - カテゴリ: category_weights の重み。
+    各値を 0〜1 に揃えてから weights の重みを掛けて合計する。いずれの情報もない場合はすべて 0 (元の順番のまま)。
+
+    Returns:
+        list[float]: faq_data と同じ順番の優先度。
+    """
+    weights = weights or PRIORITY_WEIGHTS
+    category_weights = CATEGORY_WEIGHTS if category_weights is None else category_weights
+    timestamps = timestamps or {}
+    priorities = [0.0] * len(faq_data)
+
+    if focus_queries:
+        index = BM25Index.build(faq_data)
+        relevance = [0.0] * len(faq_data)
+        for query in focus_queries:
+            results = index.search(query, focus_top_k)
+            if results:
+                top_score = results[0][1]
+                for doc_id, score in results:
+                    relevance[doc_id] += score / top_score
+        highest = max(relevance)
+        if highest > 0:
+            for i, value in enumerate(relevance):
+                priorities[i] += weights.get('relevance', 0.0) * value / highest
+
+    if timestamps:
+        known = [timestamps[faq.get('url')] for faq in faq_data if faq.get('url') in timestamps]
+        if known:
+            oldest, newest = min(known), max(known)
+            span = newest - oldest
+            for i, faq in enumerate(faq_data):
+                modified = timestamps.get(faq.get('url'))
+                if modified is not None:
+                    priorities[i] += weights.get('freshness', 0.0) * ((modified - oldest) / span if span else 1.0)
+
+    if category_weights:
+        for i, faq in enumerate(faq_data):
+            priorities[i] += weights.get('category', 0.0) * _category_weight(faq, category_weights)
+    return priorities
+
+
+class PackingReport:
+    """コンテキストに含めたFAQとトークン数の内訳。"""
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.used_tokens = 0
+        self.candidates = 0      # 質問・回答・URLが揃っているFAQの件数
+        self.included = 0
+        self.skipped = 0         # 予算に収まらず含めなかった件数
+        self.measured = 0        # 含めたFAQのうち、トークン数が実測値のもの
+        self.scale = 1.0
+
+    @property
+    def limited(self):
+        return self.skipped > 0
+
+    def format(self):
+        usage = self.used_tokens / self.budget if self.budget else 0.0
+        return (f"コンテキスト: 推定 {self.used_tokens:,} / {self.budget:,} トークン ({usage:.1%}), "
+                f"FAQ {self.included}/{self.candidates} 件 "
+                f"(トークン数の実測 {self.measured} 件, 補正係数 {self.scale:.2f})")
+
+
+def pack_records(entries, budget, fixed_tokens, estimator, priorities=None):
+    """
+    優先度の高い順に、トークン数の合計が予算に収まるだけのエントリを選ぶ。
+    収まらないエントリは飛ばして、より小さいエントリで残りの予算を埋める。
+
+    Args:
+        entries (list[str]): 整形済みのFAQテキスト。
+        budget (int): 使えるトークン数。
+        fixed_tokens (int): ヘッダー・フッターなど必ず含めるテキストのトークン数。
+        estimator (TokenEstimator): トークン数の見積もりに使う。
+        priorities (list[float] | None): entries と同じ順番の優先度。Noneの場合は元の順番。
+
+    Returns:
+        tuple[list[int], PackingReport]: 選んだエントリの位置 (優先度の高い順) と内訳。
+    """
+    report = PackingReport(budget)
+    report.candidates = len(entries)
+    report.scale = estimator.scale
+    report.used_tokens = fixed_tokens
+    order = range(len(entries))
+    if priorities is not None:
+        # 優先度が同じ場合は元の順番を保つ
+        order = sorted(order, key=lambda i: -priorities[i])
+    selected = []
+    for i in order:
+        tokens, measured = estimator.count(entries[i])
+        if report.used_tokens + tokens > budget:
+            report.skipped += 1
+            continue
+        selected.append(i)
+        report.used_tokens += tokens
+        report.measured += measured
+    report.included = len(selected)
+    return selected, report
+
+
+if __name__ == "__main__":
+    from . import qa_app
+    from .model_backend import MODEL_BACKENDS, create_backend
+
+    parser = argparse.ArgumentParser(description="'full' モードのコンテキストに含めるFAQとトークン数を確認する")
+    parser.add_argument("--data", default=qa_app.FAQ_DATA_FILE, help="FAQデータファイル")
+    parser.add_argument("--budget", type=int, help="FAQ情報に使えるトークン数 (デフォルト: モデルのコンテキストの上限から計算)")
+    parser.add_argument("--focus-file", help="関連度の計算に使う質問のファイル (1行1問、または JSONL)")
+    parser.add_argument("--calibrate", type=int, default=0, metavar="N",
+                        help="モデルの count_tokens で N 件のFAQのトークン数を実測してキャッシュする")
+    parser.add_argument("--backend", choices=MODEL_BACKENDS, default=qa_app.MODEL_BACKEND,
+                        help=f"トークン数を実測するバックエンド (デフォルト: {qa_app.MODEL_BACKEND})")
+    args = parser.parse_args()
+
+    faq_data = qa_app.load_faq_data(args.data)
+    if faq_data is None:
+        print(f"エラー: FAQデータの読み込みに失敗しました。({args.data} を確認してください)")
+        sys.exit(1)
+    model_name = qa_app.MODEL_NAME if args.backend == 'gemini' else args.backend
+    estimator = TokenEstimator(model_name, token_counts_filename(args.data))
+    if args.calibrate:
+        try:
+            backend = create_backend(args.backend, qa_app.MODEL_NAME)
+            texts = [qa_app.format_faq_entry(faq) for faq in faq_data
+                     if faq.get('question') and faq.get('answer') and faq.get('url')]
+            measured = estimator.calibrate(texts, backend.count_tokens, args.calibrate)
+        except Exception as e:
+            print(f"エラー: トークン数の実測に失敗しました。\n{e}")
+            sys.exit(1)
+        print(f"{measured} 件のFAQのトークン数を実測しました。(実測済み {estimator.calibrated_count} 件, "
+              f"補正係数 {estimator.scale:.2f})")
+
+    focus_queries = list(FOCUS_QUERIES)
+    if args.focus_file:
+        focus_queries += load_focus_queries(args.focus_file)
+    budget = args.budget if args.budget is not None else context_budget(model_name)
+    priorities = record_priorities(faq_data, focus_queries, load_page_timestamps(args.data))
+    context, limited = qa_app.format_faq_context(faq_data, budget, estimator, priorities)
+    if context is None:
+        sys.exit(1)
@@ -0,0 +1,79 @@
+# src/openlogi_ai_faq/conversation.py (件数を制限した会話履歴)
+from collections import deque
+
+# プロンプトにそのまま含める直近の会話の往復数
+HISTORY_TURNS = 3
+# それより古い会話を要約として残す文字数の上限 (0 の場合は要約を残さない)
+HISTORY_SUMMARY_CHARS = 600
+# 要約に残す1回分の質問・回答の文字数
+SUMMARY_SNIPPET_CHARS = 60
+
+_HISTORY_HEADER = "--- これまでの会話 (参考) ---\n"
+_HISTORY_FOOTER = "--- 会話ここまで ---\n\n"
+
+
+def _snippet(text, limit=SUMMARY_SNIPPET_CHARS):
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit] + "…"
+
+
+def _format_turn(question, answer):
+    return f"ユーザー: {question}\nアシスタント: {answer}\n"
+
+
+class BoundedHistory:
+    """
+    プロンプトに含める会話履歴。
+    直近 max_turns 往復だけを全文で持ち、それより古い往復は質問と回答の冒頭だけの
+    短い要約 (合計 summary_chars 文字まで、古いものから捨てる) に縮める。
+    ChatSession と違って履歴が際限なく増えないため、長い会話でもプロンプトの大きさが一定に保たれる。
+    """
+
+    def __init__(self, max_turns=HISTORY_TURNS, summary_chars=HISTORY_SUMMARY_CHARS):
+        self.max_turns = max(0, max_turns)
+        self.summary_chars = max(0, summary_chars)
+        self._turns = deque()     # 直近の (質問, 回答)
+        self._summary = deque()   # 古い往復の要約 (1往復1行)
+        self._summary_len = 0
+        # 全往復を全文で並べた場合の文字数 (履歴をすべて送信した場合との比較用)
+        self._all_turns_chars = 0
+
+    def __len__(self):
+        return len(self._turns)
+
+    def add(self, question, answer):
+        """1往復分の質問と回答を追加する。"""
+        self._all_turns_chars += len(_format_turn(question, answer))
+        self._turns.append((question, answer))
+        while len(self._turns) > self.max_turns:
+            old_question, old_answer = self._turns.popleft()
+            self._compact(old_question, old_answer)
+
+    def _compact(self, question, answer):
+        if not self.summary_chars:
+            return
+        line = f"- 質問: {_snippet(question)} / 回答: {_snippet(answer)}\n"
+        self._summary.append(line)
+        self._summary_len += len(line)
+        while self._summary and self._summary_len > self.summary_chars:
+            self._summary_len -= len(self._summary.popleft())
+
+    def format(self):
+        """
+        プロンプトに含める会話履歴のテキストを返す。履歴がない場合は空文字列。
+        """
+        if not self._turns and not self._summary:
+            return ""
+        parts = [_HISTORY_HEADER]
+        if self._summary:
+            parts.append("以前の会話の要約:\n")
+            parts.extend(self._summary)
+        parts.extend(_format_turn(question, answer) for question, answer in self._turns)
+        parts.append(_HISTORY_FOOTER)
+        return "".join(parts)
+
+    def unbounded_chars(self):
+        """すべての往復を全文で含めた場合の、format() の文字数。"""
+        if not self._all_turns_chars:
+            return 0
+        return len(_HISTORY_HEADER) + self._all_turns_chars + len(_HISTORY_FOOTER)
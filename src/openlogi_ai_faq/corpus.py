@@ -0,0 +1,292 @@
+# src/openlogi_ai_faq/corpus.py (名前付きの複数のFAQコーパス: 設定・コンパクトなレコード・遅延読み込みと解放)
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from . import metrics
+from .faq_io import DEFAULT_FAQ_FILENAME
+
+# --- 設定 ---
+# コーパスの定義ファイル (JSON)。存在する場合は組み込みのコーパス (DEFAULT_CORPUS) に加えて読み込む (同じ名前は置き換える)
+#   {"名前": {"start_url": "https://...", "data_file": "faq_data_xxx.json", "prompt_prefix": "..."}, ...}
+CORPORA_FILE = "corpora.json"
+# コーパスを指定しない場合に使うコーパスの名前
+DEFAULT_CORPUS = "openlogi"
+# 定義ファイルで data_file を省略した場合のFAQデータファイル名 ({name} はコーパスの名前)
+CORPUS_DATA_FILE_FORMAT = "faq_data_{name}.json"
+# 同時に読み込んでおくコーパスの最大数 (超えた場合は最も長く使われていないものを解放する)
+MAX_LOADED_CORPORA = 4
+# この秒数のあいだ使われなかったコーパスを解放する (0 の場合は使われていなくても解放しない)
+CORPUS_IDLE_SECONDS = 1800
+# --- 設定ここまで ---
+
+LOADED_CORPORA = metrics.gauge('corpora_loaded', "読み込み済みのコーパスの数")
+CORPUS_LOADS = metrics.counter('corpus_loads_total', "コーパスを読み込んだ回数")
+CORPUS_EVICTIONS = metrics.counter('corpus_evictions_total', "コーパスを解放した回数 (reason: idle / capacity)")
+
+
+class CorpusConfig:
+    """名前付きのFAQコーパスの設定 (クロールの開始URL・FAQデータファイル・プロンプトの前置き)。"""
+
+    def __init__(self, name, data_file, start_url=None, prompt_prefix=""):
+        """
+        Args:
+            name (str): コーパスの名前。
+            data_file (str): FAQデータファイル (クローラーの出力先・Q&Aアプリの読み込み元)。
+            start_url (str | None): クロールの開始URL。Noneの場合はクローラーの DEFAULT_START_URL。
+            prompt_prefix (str): モデルへの指示 (回答ルール) の前に置くテキスト (製品名の説明など)。
+        """
+        self.name = name
+        self.data_file = data_file
+        self.start_url = start_url
+        self.prompt_prefix = prompt_prefix
+
+    def __repr__(self):
+        return f"CorpusConfig({self.name!r}, {self.data_file!r})"
+
+
+def load_corpora(filename=None, default_data_file=DEFAULT_FAQ_FILENAME):
+    """
+    コーパスの定義を読み込む。
+
+    Args:
+        filename (str | None): 定義ファイル。Noneの場合は CORPORA_FILE を (あれば) 読み込む。
+                               明示的に指定したファイルがない場合はエラーになる。
+        default_data_file (str): 定義ファイルがなくても使える組み込みのコーパス (DEFAULT_CORPUS、
+                                 従来の単一のヘルプサイト) のFAQデータファイル。
+
+    Returns:
+        dict[str, CorpusConfig]: 名前 -> 設定 (組み込みのコーパスを含む)。
+
+    Raises:
+        IOError, OSError: 指定した定義ファイルを読み込めない場合。
+        ValueError: 定義の形式が正しくない場合。
+    """
+    corpora = {DEFAULT_CORPUS: CorpusConfig(DEFAULT_CORPUS, default_data_file)}
+    path = filename or CORPORA_FILE
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            definitions = json.load(f)
+    except FileNotFoundError:
+        if filename:
+            raise
+        return corpora
+    except json.JSONDecodeError as e:
+        raise ValueError(f"コーパスの定義ファイルが正しい JSON ではありません - {path}: {e}")
+
+    if not isinstance(definitions, dict):
+        raise ValueError(f"コーパスの定義は {{名前: 設定}} の形式で指定してください - {path}")
+    for name, definition in definitions.items():
+        if not isinstance(definition, dict):
+            raise ValueError(f"コーパス {name} の設定はオブジェクトで指定してください - {path}")
+        for key in ('data_file', 'start_url', 'prompt_prefix'):
+            if definition.get(key) is not None and not isinstance(definition[key], str):
+                raise ValueError(f"コーパス {name} の {key} は文字列で指定してください - {path}")
+        corpora[name] = CorpusConfig(name, definition.get('data_file') or CORPUS_DATA_FILE_FORMAT.format(name=name),
+                                     definition.get('start_url'), definition.get('prompt_prefix') or "")
+    return corpora
+
+
+def select_corpus(corpora, name=None):
+    """
+    名前でコーパスを選ぶ。name がNoneの場合は DEFAULT_CORPUS。
+
+    Raises:
+        ValueError: 定義されていない名前の場合。
+    """
+    name = name or DEFAULT_CORPUS
+    if name not in corpora:
+        raise ValueError(f"コーパス {name} は定義されていません。(定義済み: {', '.join(sorted(corpora))})")
+    return corpora[name]
+
+
+_MISSING = object()
+
+
+class FaqRecord:
+    """
+    FAQレコード1件のコンパクトな表現。
+    dict の代わりに __slots__ で値を持ち (レコードの入れ物の大きさが dict の6割程度になる)、URL は intern して、
+    同じURL (alternate_urls や、同じページを含む複数のコーパス) で1つの文字列を共有する。
+    faq['question'] / faq.get('url') のように dict と同じく参照できるので、整形・検索の関数にそのまま渡せる。
+    (intern した文字列はコーパスを解放してもプロセス内に残るが、URL は短いので問題にならない)
+    """
+
+    __slots__ = ('question', 'answer', 'url', 'alternate_urls', 'extra')
+    FIELDS = ('question', 'answer', 'url', 'alternate_urls')
+
+    def __init__(self, question, answer, url, alternate_urls=None, extra=None):
+        self.question = question
+        self.answer = answer
+        self.url = sys.intern(url) if isinstance(url, str) else url
+        self.alternate_urls = (tuple(sys.intern(u) if isinstance(u, str) else u for u in alternate_urls)
+                               if alternate_urls else None)
+        self.extra = extra or None  # 上記以外のキー (category など)
+
+    @classmethod
+    def from_dict(cls, faq):
+        extra = {sys.intern(key): value for key, value in faq.items() if key not in cls.FIELDS}
+        return cls(faq.get('question'), faq.get('answer'), faq.get('url'), faq.get('alternate_urls'), extra)
+
+    def get(self, key, default=None):
+        if key in FaqRecord.FIELDS:
+            value = getattr(self, key)
+            return default if value is None else value
+        return self.extra.get(key, default) if self.extra else default
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def to_dict(self):
+        """JSON に書き出せる dict に戻す。"""
+        data = {key: self.get(key) for key in FaqRecord.FIELDS if self.get(key) is not None}
+        if self.alternate_urls:
+            data['alternate_urls'] = list(self.alternate_urls)
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def __repr__(self):
+        return f"FaqRecord({self.question!r}, url={self.url!r})"
+
+
+def compact_records(faq_data):
+    """FAQレコード (dict) のリストを FaqRecord のリストにする。dict でない要素はそのまま残す。"""
+    return [FaqRecord.from_dict(faq) if isinstance(faq, dict) else faq for faq in faq_data]
+
+
+class _LoadedCorpus:
+    def __init__(self, config, value):
+        self.config = config
+        self.value = value
+        self.last_used = time.monotonic()
+
+
+class CorpusRegistry:
+    """
+    名前付きのコーパスを、最初に使われたときに読み込み、使われなくなったものを解放する。スレッドセーフ。
+
+    - 読み込みは loader(config, shared) で行う。shared は、同じFAQデータファイルを使う読み込み済みの
+      コーパスの値 (なければNone)。レコードや検索インデックスを共有して、同じデータを2回読み込まないために使う。
+    - 読み込み済みのコーパスが max_loaded を超えた場合は、最も長く使われていないものを解放する。
+    - idle_seconds 秒使われなかったコーパスは evict_idle() (get() のたびにも呼ばれる) で解放する。
+    - 解放する値に close() があれば呼び出す。
+    """
+
+    def __init__(self, corpora, loader, max_loaded=MAX_LOADED_CORPORA, idle_seconds=CORPUS_IDLE_SECONDS):
+        self.corpora = corpora
+        self.loader = loader
+        self.max_loaded = max(1, max_loaded)
+        self.idle_seconds = idle_seconds
+        self._loaded = OrderedDict()   # 名前 -> _LoadedCorpus (古く使われたものが先頭)
+        self._load_locks = {}          # 名前 -> 読み込み中の重複を防ぐロック
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        """
+        コーパスの値を返す (読み込まれていなければ読み込む)。
+
+        Raises:
+            ValueError: 定義されていない名前の場合。
+            Exception: loader が送出した例外 (読み込みに失敗した場合)。
+        """
+        config = select_corpus(self.corpora, name)
+        value = self._touch(config.name)
+        if value is not None:
+            self.evict_idle()
+            return value
+
+        with self._lock:
+            load_lock = self._load_locks.setdefault(config.name, threading.Lock())
+        with load_lock:
+            # 待っている間に他のスレッドが読み込んだ場合はそれを使う
+            value = self._touch(config.name)
+            if value is not None:
+                return value
+            with metrics.span('corpus.load', corpus=config.name):
+                value = self.loader(config, self._shared(config))
+            with self._lock:
+                self._loaded[config.name] = _LoadedCorpus(config, value)
+                evicted = []
+                while len(self._loaded) > self.max_loaded:
+                    evicted.append(self._loaded.popitem(last=False))
+                LOADED_CORPORA.set(len(self._loaded))
+            CORPUS_LOADS.inc(corpus=config.name)
+        for evicted_name, entry in evicted:
+            CORPUS_EVICTIONS.inc(corpus=evicted_name, reason='capacity')
+            _close(entry.value)
+        self.evict_idle()
+        return value
+
+    def _touch(self, name):
+        with self._lock:
+            entry = self._loaded.get(name)
+            if entry is None:
+                return None
+            entry.last_used = time.monotonic()
+            self._loaded.move_to_end(name)
+            return entry.value
+
+    def _shared(self, config):
+        data_file = os.path.abspath(config.data_file)
+        with self._lock:
+            for entry in self._loaded.values():
+                if os.path.abspath(entry.config.data_file) == data_file:
+                    return entry.value
+        return None
+
+    def evict_idle(self, now=None):
+        """
+        idle_seconds 秒以上使われていないコーパスを解放する。
+
+        Returns:
+            list[str]: 解放したコーパスの名前。
+        """
+        if self.idle_seconds <= 0:
+            return []
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            idle = [name for name, entry in self._loaded.items() if now - entry.last_used >= self.idle_seconds]
+            evicted = [(name, self._loaded.pop(name)) for name in idle]
+            LOADED_CORPORA.set(len(self._loaded))
+        for name, entry in evicted:
+            CORPUS_EVICTIONS.inc(corpus=name, reason='idle')
+            _close(entry.value)
+        return [name for name, _ in evicted]
+
+    def loaded(self):
+        """読み込み済みのコーパスの (名前, 値) のリスト。"""
+        with self._lock:
+            return [(name, entry.value) for name, entry in self._loaded.items()]
+
+    def status(self):
+        """コーパスごとの読み込み状態 (名前 -> {'loaded', 'idle_seconds'})。"""
+        now = time.monotonic()
+        with self._lock:
+            loaded = {name: now - entry.last_used for name, entry in self._loaded.items()}
+        return {name: {'loaded': name in loaded, 'idle_seconds': round(loaded[name], 1) if name in loaded else None}
+                for name in sorted(self.corpora)}
+
+    def close(self):
+        """読み込み済みのコーパスをすべて解放する。"""
+        with self._lock:
+            evicted = list(self._loaded.values())
+            self._loaded.clear()
+            LOADED_CORPORA.set(0)
+        for entry in evicted:
+            _close(entry.value)
+
+
+def _close(value):
+    close = getattr(value, 'close', None)
+    if close is not None:
+        close()
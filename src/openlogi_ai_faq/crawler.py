@@ -1,27 +1,97 @@
 # src/openlogi_ai_faq/crawler.py (デフォルトURL設定・関数化)
 import requests
+from requests.compat import chardet
 from bs4 import BeautifulSoup
+import lxml.etree
+import lxml.html
 import json
+import hashlib
 from urllib.parse import urlparse, urljoin, urldefrag, urlunparse
 import time
 import sys
 import re
-from collections import deque
+import argparse
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
 import os # ファイルパス操作用
 
+from . import metrics
+from .corpus import DEFAULT_CORPUS, load_corpora, select_corpus
+from .fetcher import Fetcher
+from .dedup import dedup_file, dedup_records
+from .faq_io import (DEFAULT_FAQ_FILENAME, JsonlWriter, is_jsonl_filename, page_cache_filename,
+                     write_json_atomic)
+from .frontier import UrlFrontier
+from .sitemap import collect_sitemap_entries, parse_lastmod
+
 # --- 設定 ---
 # デフォルトの出力ファイル名を指定 (qa_app.py と合わせる)
-DEFAULT_OUTPUT_FILENAME = "faq_data_openlogi.json"
+DEFAULT_OUTPUT_FILENAME = DEFAULT_FAQ_FILENAME
 # デフォルトの開始URL
 DEFAULT_START_URL = "https://help.openlogi.com/"
 REQUEST_DELAY = 1
+# 同時に処理するリクエスト数 (1 の場合は従来通り1件ずつ順番に取得する)
+CONCURRENCY = 1
+# ホストごとのレート制限 (1秒あたりのリクエスト数)。デフォルトは REQUEST_DELAY と同等の間隔
+RATE_LIMIT_PER_HOST = 1 / REQUEST_DELAY
+# レート制限のバースト許容量 (連続して即時に送れるリクエスト数)
+RATE_LIMIT_BURST = 1
+# タイムアウトや 429 / 5xx 応答を再試行する最大回数 (ジッター付き指数バックオフ)
+MAX_RETRIES = 3
 HEADERS = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
 }
 MAX_PAGES = 10000
+# ページが削除されたとみなすHTTPステータス (差分更新で「削除」として数え、ページキャッシュから除く)
+GONE_STATUS_CODES = (404, 410)
+# チェックポイントを書き出す間隔 (処理済みページ数)。0 以下でチェックポイントを無効化
+CHECKPOINT_INTERVAL = 100
+# チェックポイントファイル名の接尾辞 (出力ファイル名の後ろに付ける)
+CHECKPOINT_SUFFIX = ".checkpoint.json"
+# 処理済みページ (探索順・ページキャッシュ) をチェックポイントごとに追記するファイルの接尾辞 (チェックポイントファイル名の後ろに付ける)
+CHECKPOINT_PAGES_SUFFIX = ".pages.jsonl"
+# JSONL 形式で書き出し中のファイル名の接尾辞 (完了時に出力ファイル名へ置き換える)
+PARTIAL_SUFFIX = ".part"
+# HTML解析バックエンド: 'html.parser' (BeautifulSoup, 従来通り) または 'lxml' (高速)
+PARSER_BACKENDS = ('html.parser', 'lxml')
+PARSER_BACKEND = 'html.parser'
+# HTML解析を行うプロセス数。0 の場合は取得したスレッド内で解析する
+PARSE_WORKERS = 0
+# 解析待ちにできるページ数の上限 (0 の場合は PARSE_WORKERS の2倍)。上限に達すると取得を待たせる
+PARSE_QUEUE_SIZE = 0
+# URLの発見方法: 'links' (リンクをたどる), 'sitemap+links' (サイトマップのURLから始めてリンクもたどる),
+# 'sitemap' (サイトマップのURLだけを取得する)。サイトマップがない場合はリンクをたどる
+DISCOVERY_MODES = ('links', 'sitemap+links', 'sitemap')
+DISCOVERY_MODE = 'links'
+# True の場合、FAQページらしいURLから優先して取得する (False は従来通りの幅優先)
+FRONTIER_PRIORITY = False
+# 優先度モードでのURLパスのパターンと加点 (正規表現, 加点)。負の値で後回しにする
+FAQ_URL_PATTERNS = [
+    (r'faq', 2.0),
+    (r'/(articles?|questions?|qa)/', 1.0),
+    (r'/\d+/?$', 0.5),
+    (r'/(search|tags?|login|signup|users?)(/|$)', -2.0),
+]
+# 優先度モードで、リンク元ページのFAQ的中率に掛ける重み
+PARENT_HIT_RATE_WEIGHT = 1.0
+# True の場合、保存前に重複に近いFAQ (同じ回答が複数のURLにあるものなど) を1件にまとめる (dedup.py)。
+# 料金や日付だけが異なるFAQもまとめられてしまうため、デフォルトではクロール結果をそのまま保存する
+# (Q&Aアプリは読み込み時に重複をまとめる (qa_app.DEDUP_ON_LOAD))
+DEDUP_ON_CRAWL = False
 IGNORE_EXTENSIONS = ['.pdf', '.jpg', '.jpeg', '.png', '.gif', '.zip', '.css', '.js', '.xml', '.svg', '.ico', '.mp4', '.mp3', '.avi']
+# 計測値のファイル (--metrics-file) を書き出す間隔 (秒)
+METRICS_FLUSH_INTERVAL = 10
 # --- 設定ここまで ---
 
+PAGES_PROCESSED = metrics.counter('crawler_pages_total', "処理したページ数 (change: added / updated / unchanged)")
+FAQS_FOUND = metrics.counter('crawler_faqs_total', "見つけたFAQの件数 (重複の除去前)")
+PAGE_ERRORS = metrics.counter('crawler_page_errors_total', "取得・解析に失敗したページ数 (kind: エラーの種類)")
+PARSE_SECONDS = metrics.histogram('crawler_parse_seconds', "1ページの解析時間 (秒, 文字コードの推定を含む)",
+                                  buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0))
+QUEUE_DEPTH = metrics.gauge('crawler_queue_depth', "未処理のURLの数")
+IN_FLIGHT_PAGES = metrics.gauge('crawler_in_flight_pages', "取得中のページ数")
+PARSE_BACKLOG = metrics.gauge('crawler_parse_backlog', "解析プロセスの処理待ち・処理中のページ数")
+FAQS_PER_SECOND = metrics.gauge('crawler_faqs_per_second', "クロール開始からの1秒あたりのFAQの発見数")
+
 # is_valid_url, normalize_url, extract_specific_faq_and_links, save_data 関数は変更なし
 # (ただし、save_data はファイル名を引数で受け取るようにする)
 def is_valid_url(url):
@@ -47,27 +117,22 @@ def normalize_url(base_url, link):
     except Exception:
         return None
 
-def extract_specific_faq_and_links(soup, url):
-    faq_info = None
-    question_text = ""
-    answer_text = ""
-    question_h2 = soup.find('h2', class_='faq_qstCont_ttl')
-    if question_h2:
-        question_text = question_h2.get_text(strip=True)
-    answer_div = soup.find('div', id='faq_answer_contents')
-    if answer_div:
-        answer_text = answer_div.get_text(separator='\n', strip=True)
-        answer_text = re.sub(r'\n\s*\n+', '\n', answer_text)
+def build_faq_info(question_text, answer_text, url):
+    """質問と回答のテキストからFAQ情報の辞書を作る。どちらかが空の場合はNone。"""
+    answer_text = re.sub(r'\n\s*\n+', '\n', answer_text)
     if question_text and answer_text:
-        faq_info = {
+        return {
             'question': question_text,
             'answer': answer_text,
             'url': url
         }
+    return None
+
+def filter_internal_links(url, hrefs):
+    """href のリストを正規化し、同じドメイン内で対象拡張子以外のリンクだけを返す。"""
     internal_links = set()
     base_domain = urlparse(url).netloc
-    for a_tag in soup.find_all('a', href=True):
-        href = a_tag['href']
+    for href in hrefs:
         normalized_link_url = normalize_url(url, href)
         if normalized_link_url:
             link_domain = urlparse(normalized_link_url).netloc
@@ -75,8 +140,104 @@ def extract_specific_faq_and_links(soup, url):
                  path = urlparse(normalized_link_url).path.lower()
                  if not any(path.endswith(ext) for ext in IGNORE_EXTENSIONS):
                       internal_links.add(normalized_link_url)
+    return internal_links
+
+def extract_specific_faq_and_links(soup, url):
+    question_text = ""
+    answer_text = ""
+    question_h2 = soup.find('h2', class_='faq_qstCont_ttl')
+    if question_h2:
+        question_text = question_h2.get_text(strip=True)
+    answer_div = soup.find('div', id='faq_answer_contents')
+    if answer_div:
+        answer_text = answer_div.get_text(separator='\n', strip=True)
+    faq_info = build_faq_info(question_text, answer_text, url)
+    internal_links = filter_internal_links(url, (a_tag['href'] for a_tag in soup.find_all('a', href=True)))
     return faq_info, internal_links
 
+# BeautifulSoup の get_text() と同様に、テキストとして扱わない要素
+_LXML_SKIP_TEXT_TAGS = frozenset(['script', 'style', 'template', 'rt', 'rp'])
+
+def _lxml_strings(element):
+    """
+    要素配下のテキストを文書順に返す (BeautifulSoup の get_text() 相当)。
+    コメントや script/style/ルビ (rt, rp) 内のテキストは除外し、子要素の後ろのテキスト (tail) は含める。
+    """
+    if not isinstance(element.tag, str) or element.tag in _LXML_SKIP_TEXT_TAGS:
+        return
+    if element.text:
+        yield element.text
+    for child in element:
+        yield from _lxml_strings(child)
+        if child.tail:
+            yield child.tail
+
+def _lxml_get_text(element, separator=''):
+    return separator.join(text.strip() for text in _lxml_strings(element) if text.strip())
+
+def extract_specific_faq_and_links_lxml(html, url, encoding=None):
+    """
+    extract_specific_faq_and_links の lxml 版。BeautifulSoup の木を作らず、
+    lxml (C実装) で解析して必要な要素 (h2, div, a) だけを1回の走査で取り出す。
+    戻り値は extract_specific_faq_and_links と同じ。
+
+    Args:
+        html (str | bytes): ページのHTML。
+        url (str): ページのURL (リンクの正規化とFAQ情報に使用)。
+        encoding (str | None): html がバイト列の場合の文字コード。
+    """
+    try:
+        if isinstance(html, bytes) and encoding:
+            root = lxml.html.document_fromstring(html, parser=lxml.html.HTMLParser(encoding=encoding))
+        else:
+            root = lxml.html.document_fromstring(html)
+    except ValueError:
+        # エンコーディング宣言付きの文字列は lxml が受け付けないため、バイト列にして再解析する
+        if not isinstance(html, str):
+            raise
+        root = lxml.html.document_fromstring(html.encode('utf-8'),
+                                             parser=lxml.html.HTMLParser(encoding='utf-8'))
+    except lxml.etree.ParserError:
+        # 空のドキュメントなど
+        return None, set()
+
+    question_h2 = None
+    answer_div = None
+    hrefs = []
+    for element in root.iter('h2', 'div', 'a'):
+        tag = element.tag
+        if tag == 'a':
+            href = element.get('href')
+            if href is not None:
+                hrefs.append(href)
+        elif tag == 'h2':
+            if question_h2 is None and 'faq_qstCont_ttl' in (element.get('class') or '').split():
+                question_h2 = element
+        elif answer_div is None and element.get('id') == 'faq_answer_contents':
+            answer_div = element
+
+    question_text = _lxml_get_text(question_h2) if question_h2 is not None else ""
+    answer_text = _lxml_get_text(answer_div, separator='\n') if answer_div is not None else ""
+    faq_info = build_faq_info(question_text, answer_text, url)
+    return faq_info, filter_internal_links(url, hrefs)
+
+def extract_page(html, url, backend=None):
+    """
+    指定された解析バックエンドでページを解析し、FAQ情報と内部リンクを抽出する。
+
+    Args:
+        html (str): ページのHTML。
+        url (str): ページのURL。
+        backend (str | None): PARSER_BACKENDS のいずれか。Noneの場合は PARSER_BACKEND を使用。
+    """
+    backend = backend or PARSER_BACKEND
+    if backend == 'lxml':
+        return extract_specific_faq_and_links_lxml(html, url)
+    if backend == 'html.parser':
+        soup = BeautifulSoup(html, 'html.parser')
+        return extract_specific_faq_and_links(soup, url)
+    raise ValueError(f"未対応の解析バックエンドです: {backend}")
+
 def save_data(data_list, filename):
     """ページ情報のリストを指定されたファイル名でJSONファイルに保存する。"""
     if not isinstance(data_list, list):
@@ -103,10 +264,276 @@ def save_data(data_list, filename):
         return False # 保存失敗
 
 
-def crawl_site_for_faq(start_url, output_filename):
+def checkpoint_filename(output_filename):
+    """出力ファイル名に対応するチェックポイントファイル名を返す。"""
+    return output_filename + CHECKPOINT_SUFFIX
+
+
+def checkpoint_pages_filename(checkpoint_file):
+    """チェックポイントに対応する処理済みページのログのファイル名を返す。"""
+    return checkpoint_file + CHECKPOINT_PAGES_SUFFIX
+
+
+def save_checkpoint(filename, state):
+    """
+    クロールの途中状態 (未訪問キュー、件数、処理済みページのログの位置など) をファイルに書き出す。
+    処理済みページそのものは、ファイル全体を毎回書き直さないよう、ログ (checkpoint_pages_filename) に追記する。
+    """
+    try:
+        write_json_atomic(filename, state)
+        return True
+    except (IOError, OSError) as e:
+        print(f"エラー: チェックポイントの保存に失敗しました - {filename}\n{e}")
+        return False
+
+
+def load_checkpoint(filename):
+    """
+    チェックポイントファイルを読み込む。
+
+    Returns:
+        dict | None: 保存されていたクロール状態。ファイルがない場合や壊れている場合はNone。
+    """
+    try:
+        with open(filename, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (json.JSONDecodeError, IOError, OSError) as e:
+        print(f"エラー: チェックポイントの読み込みに失敗しました - {filename}\n{e}")
+        return None
+    if not isinstance(state, dict) or 'urls_to_visit' not in state or 'pages_offset' not in state:
+        print(f"エラー: チェックポイントの形式が正しくありません - {filename}")
+        return None
+    return state
+
+
+def load_checkpoint_pages(filename, offset):
+    """
+    処理済みページのログを、チェックポイントに記録された位置 offset まで読み込む
+    (それより後ろは、チェックポイントを書き出す前に中断した分なので読まない)。
+
+    Returns:
+        list[dict] | None: {'url', 'order', 'page' (ページキャッシュのエントリ。取得に失敗したページはNone)}。
+                           ファイルがない場合や壊れている場合はNone。
+    """
+    entries = []
+    try:
+        with open(filename, 'rb') as f:
+            for line in f.read(offset).splitlines():
+                if line.strip():
+                    entries.append(json.loads(line))
+    except FileNotFoundError:
+        print(f"エラー: チェックポイントの処理済みページのログがありません - {filename}")
+        return None
+    except (json.JSONDecodeError, UnicodeDecodeError, IOError, OSError) as e:
+        print(f"エラー: チェックポイントの処理済みページのログの読み込みに失敗しました - {filename}\n{e}")
+        return None
+    return entries
+
+
+def remove_checkpoint(filename):
+    """クロール完了後に不要になったチェックポイントファイル (と処理済みページのログ) を削除する。"""
+    for path in (filename, checkpoint_pages_filename(filename)):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"警告: チェックポイントの削除に失敗しました - {path}\n{e}")
+
+
+def load_page_cache(filename):
+    """
+    前回のクロールで保存したページキャッシュを読み込む。
+
+    Returns:
+        dict: URL -> {'etag', 'last_modified', 'content_hash', 'faq', 'links'}。
+              ファイルがない場合や壊れている場合は空の辞書。
+    """
+    try:
+        with open(filename, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (json.JSONDecodeError, IOError, OSError) as e:
+        print(f"警告: ページキャッシュの読み込みに失敗しました。全ページを取得し直します - {filename}\n{e}")
+        return {}
+    if not isinstance(cache, dict):
+        return {}
+    return cache
+
+
+def save_page_cache(filename, cache):
+    """ページキャッシュを保存する。次回の差分更新クロールで使用される。"""
+    try:
+        write_json_atomic(filename, cache)
+        return True
+    except (IOError, OSError) as e:
+        print(f"警告: ページキャッシュの保存に失敗しました - {filename}\n{e}")
+        return False
+
+
+def detect_encoding(raw):
+    """requests の apparent_encoding と同じ方法でHTMLの文字コードを推定する。"""
+    return chardet.detect(raw)['encoding'] or 'utf-8'
+
+
+def parse_page(raw, url, parser_backend=None):
+    """
+    取得したページのバイト列を解析し、FAQ情報と内部リンクを抽出する。
+    文字コードの推定も含めてCPU負荷の高い処理をまとめており、プロセスプールからも呼び出される。
+
+    Returns:
+        tuple: (faq_info, internal_links)
+    """
+    encoding = detect_encoding(raw)
+    if (parser_backend or PARSER_BACKEND) == 'lxml':
+        # lxml にはバイト列のまま渡し、デコード済み文字列のコピーを作らない
+        try:
+            return extract_specific_faq_and_links_lxml(raw, url, encoding)
+        except LookupError:
+            # libxml2 が対応していない文字コードの場合は Python 側でデコードする
+            pass
+    try:
+        html = str(raw, encoding, errors='replace')
+    except LookupError:
+        html = str(raw, 'utf-8', errors='replace')
+    return extract_page(html, url, parser_backend)
+
+
+def timed_parse_page(raw, url, parser_backend=None):
+    """
+    parse_page を実行し、(結果, 解析にかかった秒数) を返す。
+    解析プロセスで計測した時間を、親プロセスの計測値 (PARSE_SECONDS) に集計するために使う。
+    """
+    start = time.perf_counter()
+    result = parse_page(raw, url, parser_backend)
+    return result, time.perf_counter() - start
+
+
+def download_page(url, fetcher=None, cached=None):
+    """
+    1ページを取得する (解析は行わない)。ワーカースレッドから呼び出される。
+    fetcher (Fetcher) が渡された場合は、接続の再利用・再試行・レート制限を Fetcher に任せる。
+
+    cached (前回のページキャッシュ) が渡された場合は If-None-Match / If-Modified-Since 付きで
+    取得し、304 応答または内容ハッシュが同じ場合は前回の結果を再利用する。
+
+    Returns:
+        tuple | None: (raw, cache_entry, change)。HTML以外のページの場合はNone。
+                      変更がなかった場合は raw が None で、cache_entry に前回の 'faq' と 'links' が入る。
+                      change は 'unchanged', 'updated', 'added' のいずれか。
+    """
+    conditional_headers = {}
+    if cached:
+        if cached.get('etag'):
+            conditional_headers['If-None-Match'] = cached['etag']
+        if cached.get('last_modified'):
+            conditional_headers['If-Modified-Since'] = cached['last_modified']
+
+    with metrics.span('crawl.fetch'):
+        if fetcher is not None:
+            response = fetcher.get(url, headers=conditional_headers or None)
+        else:
+            response = requests.get(url, headers={**HEADERS, **conditional_headers}, timeout=20)
+    response.raise_for_status()
+
+    if cached and response.status_code == 304:
+        return None, cached, 'unchanged'
+
+    content_type = response.headers.get('content-type', '').lower()
+    if 'text/html' not in content_type:
+        return None
+
+    raw = response.content
+    content_hash = hashlib.sha256(raw).hexdigest()
+    cache_entry = {
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+        'content_hash': content_hash,
+    }
+    if cached and cached.get('content_hash') == content_hash:
+        cache_entry['faq'] = cached.get('faq')
+        cache_entry['links'] = cached.get('links', [])
+        return None, cache_entry, 'unchanged'
+
+    return raw, cache_entry, ('updated' if cached else 'added')
+
+
+def fetch_page(url, fetcher=None, cached=None, parser_backend=None):
+    """
+    1ページを取得し、FAQ情報と内部リンクを抽出する (download_page + parse_page)。
+
+    Returns:
+        tuple | None: (faq_info, internal_links, cache_entry, change)。HTML以外のページの場合はNone。
+    """
+    downloaded = download_page(url, fetcher, cached)
+    if downloaded is None:
+        return None
+    raw, cache_entry, change = downloaded
+    if raw is None:
+        return cache_entry.get('faq'), set(cache_entry.get('links', [])), cache_entry, change
+    with metrics.span('crawl.parse'):
+        (faq_info, internal_links), parse_seconds = timed_parse_page(raw, url, parser_backend)
+    PARSE_SECONDS.observe(parse_seconds)
+    cache_entry['faq'] = faq_info
+    cache_entry['links'] = sorted(internal_links)
+    return faq_info, internal_links, cache_entry, change
+
+
+def lastmod_unchanged(lastmod, previous_lastmod):
+    """サイトマップの lastmod が前回のクロール時の lastmod から進んでいなければTrue。"""
+    if not lastmod or not previous_lastmod:
+        return False
+    current, previous = parse_lastmod(lastmod), parse_lastmod(previous_lastmod)
+    if current is None or previous is None:
+        return lastmod.strip() == previous_lastmod.strip()
+    return current <= previous
+
+
+def crawl_site_for_faq(start_url, output_filename, concurrency=CONCURRENCY, rate_limit=RATE_LIMIT_PER_HOST,
+                       resume=False, checkpoint_interval=CHECKPOINT_INTERVAL, refresh=False,
+                       parser_backend=PARSER_BACKEND, parse_workers=PARSE_WORKERS,
+                       parse_queue_size=PARSE_QUEUE_SIZE, frontier_priority=FRONTIER_PRIORITY,
+                       discovery=DISCOVERY_MODE, dedup=DEDUP_ON_CRAWL):
     """
     指定された開始URLからサイト内を再帰的にクロールし、
     特定の形式のFAQページの質問と回答を指定されたファイル名で収集・保存する。
+
+    concurrency が 2 以上の場合は、ワーカースレッドで複数ページを並行して取得する。
+    リクエスト間隔はホストごとのトークンバケット (最大 rate_limit 件/秒) で制御し、
+    429 / Retry-After / 応答時間の悪化に応じて自動的に速度を落とす。
+    タイムアウトや 429 / 5xx 応答は MAX_RETRIES 回まで再試行する。
+    保存されるFAQの並び順は、並行数に関わらずURLの探索順になる。
+
+    checkpoint_interval ページごとに途中状態をチェックポイントファイルへ書き出す。
+    resume=True の場合は、チェックポイントがあればその状態から再開する
+    (取得済みのページは再取得しない)。
+
+    refresh=True の場合は前回のページキャッシュを使って条件付きGETを行い、
+    変更のないページは解析を省略して前回のFAQレコードを再利用する (差分更新)。
+    ページキャッシュはモードに関わらずクロール完了時に保存される。今回処理しなかったページ (MAX_PAGES での打ち切りや
+    取得の失敗) は前回のキャッシュを引き継ぎ、404 / 410 が返ったページと、キューを最後まで処理しても
+    訪問しなかったページだけを削除されたものとして除く。
+
+    output_filename の拡張子が .jsonl の場合は、FAQを見つけた時点で1件ずつ書き出し
+    (JSONL 形式)、全件をメモリに保持しない。この場合のFAQの並び順は処理の完了順になる。
+
+    parser_backend で HTML 解析バックエンド ('html.parser' または 'lxml') を選択する。
+    parse_workers が1以上の場合は、取得 (スレッド) と解析 (プロセスプール) をパイプライン化する。
+    解析待ちのページは parse_queue_size 件までに抑え、メモリ使用量を一定に保つ。
+
+    URLキューは追加時に重複を排除する。frontier_priority=True の場合は、URLのパターンと
+    リンク元ページのFAQ的中率から、FAQページらしいURLを優先して取得する。
+
+    discovery が 'sitemap+links' または 'sitemap' の場合は、robots.txt と sitemap.xml
+    (サイトマップインデックス・gzip圧縮を含む) からURLを集めてキューに入れる。'sitemap' では
+    ページ内のリンクはたどらない。lastmod が前回のクロールから進んでいないページは取得せず、
+    前回の結果を再利用する。サイトマップがない場合はリンクをたどるクロールになる。
+
+    dedup=True の場合は、保存前に重複に近いFAQ (MinHash + LSH) を最初に見つけたレコードにまとめ、
+    他のURLを 'alternate_urls' に残す。
     """
     normalized_start_url = normalize_url(start_url, start_url)
     if not normalized_start_url:
@@ -118,77 +545,305 @@ def crawl_site_for_faq(start_url, output_filename):
          print(f"エラー: 開始URLからドメインを取得できませんでした - {normalized_start_url}")
          return False
 
+    concurrency = max(1, int(concurrency))
+    parse_workers = max(0, int(parse_workers))
+
     print("-" * 30)
     print(f"クロールを開始します...")
     print(f"  対象ドメイン: {start_domain}")
     print(f"  開始URL: {start_url}") # ユーザーが入力した（またはデフォルトの）URLを表示
     print(f"  正規化URL: {normalized_start_url}")
-    print(f"  出力ファイル: {output_filename}")
+    stream_output = is_jsonl_filename(output_filename)
+    print(f"  出力ファイル: {output_filename} ({'JSONL形式, 逐次書き出し' if stream_output else 'JSON形式'})")
     print(f"  最大探索ページ数 (安全装置): {MAX_PAGES}")
+    print(f"  並行リクエスト数: {concurrency}, レート制限: {rate_limit} 件/秒 (ホストごと)")
+    print(f"  差分更新モード: {'有効' if refresh else '無効'}")
+    print(f"  解析バックエンド: {parser_backend}, 解析プロセス数: {parse_workers if parse_workers else 'なし (取得スレッド内で解析)'}")
+    print(f"  URLの発見方法: {discovery}")
+    print(f"  URLキュー: {'優先度順 (FAQページらしいURLを優先)' if frontier_priority else '幅優先'}")
     print(f"  FAQ形式: <h2 class='faq_qstCont_ttl'>(質問), <div id='faq_answer_contents'>(回答)")
     print("-" * 30)
+    crawl_started = time.monotonic()
+    last_metrics_flush = crawl_started
 
 
-    urls_to_visit = deque([normalized_start_url])
+    urls_to_visit = UrlFrontier(priority=frontier_priority, patterns=FAQ_URL_PATTERNS,
+                                parent_weight=PARENT_HIT_RATE_WEIGHT)
+    urls_to_visit.push(normalized_start_url)
     visited_urls = set()
+    visit_order = {}    # URL -> 探索順 (並行取得時も出力順を安定させるため)
+    logged_urls = set() # チェックポイントの処理済みページのログに書き出したURL
+    gone_urls = set()   # 取得して GONE_STATUS_CODES が返ったURL
     all_faq_data = []
     page_count = 0
     faq_found_count = 0
     processed_unique_urls = 0
+    # 接続プール・再試行・ホストごとの適応的なレート制限を備えたHTTP取得レイヤー
+    fetcher = Fetcher(HEADERS, rate=rate_limit, burst=RATE_LIMIT_BURST, pool_size=concurrency,
+                      max_retries=MAX_RETRIES)
 
-    while urls_to_visit and page_count < MAX_PAGES:
-        current_normalized_url = urls_to_visit.popleft()
+    # 差分更新用: 前回のページキャッシュと、今回のクロールで作るページキャッシュ
+    # (前回のページキャッシュは、サイトマップの lastmod の比較と、今回処理しなかったページの引き継ぎにも使う)
+    cache_file = page_cache_filename(output_filename)
+    previous_cache = load_page_cache(cache_file)
+    page_cache = {}
+    change_counts = {'unchanged': 0, 'updated': 0, 'added': 0}
 
-        if current_normalized_url in visited_urls:
-            continue
+    checkpoint_file = checkpoint_filename(output_filename)
+    checkpoint_pages_file = checkpoint_pages_filename(checkpoint_file)
+    partial_file = output_filename + PARTIAL_SUFFIX
+    output_offset = None  # JSONL 出力の再開位置 (バイト)
+    pages_offset = None   # 処理済みページのログの再開位置 (バイト)
+    restored = False      # チェックポイントから状態を復元したか
+    follow_links = True   # ページ内のリンクをたどるか ('sitemap' モードではたどらない)
+    sitemap_lastmod = {}  # サイトマップから得たURL -> lastmod
+    if resume:
+        state = load_checkpoint(checkpoint_file)
+        page_entries = None
+        if state is not None and state.get('start_url') == normalized_start_url:
+            page_entries = load_checkpoint_pages(checkpoint_pages_file, state['pages_offset'])
+        if state is None:
+            print("再開できるチェックポイントがないため、最初からクロールします。")
+        elif state.get('start_url') != normalized_start_url:
+            print(f"警告: チェックポイントの開始URL ({state.get('start_url')}) が異なるため、最初からクロールします。")
+        elif page_entries is None:
+            print("警告: チェックポイントの処理済みページを読み込めないため、最初からクロールします。")
+        else:
+            urls_to_visit = UrlFrontier(priority=frontier_priority, patterns=FAQ_URL_PATTERNS,
+                                        parent_weight=PARENT_HIT_RATE_WEIGHT)
+            for entry in page_entries:
+                url = entry['url']
+                visited_urls.add(url)
+                logged_urls.add(url)
+                urls_to_visit.mark_seen(url)
+                visit_order[url] = entry['order']
+                if entry.get('gone'):
+                    gone_urls.add(url)
+                if entry.get('page') is not None:
+                    page_cache[url] = entry['page']
+                    # JSON 出力では、収集済みFAQもページキャッシュから復元する (JSONL 出力は書き出し済みのファイルを使う)
+                    if not stream_output and entry['page'].get('faq'):
+                        all_faq_data.append(entry['page']['faq'])
+            for url in state['urls_to_visit']:
+                urls_to_visit.push(url)
+            change_counts.update(state.get('change_counts', {}))
+            page_count = processed_unique_urls = len(visited_urls)
+            faq_found_count = state.get('faq_found_count', len(all_faq_data))
+            output_offset = state.get('output_offset') if stream_output else None
+            pages_offset = state['pages_offset']
+            follow_links = state.get('follow_links', True)
+            sitemap_lastmod = state.get('sitemap_lastmod', {})
+            restored = True
+            print(f"チェックポイントから再開します: 処理済み {processed_unique_urls} URL, 収集済みFAQ {faq_found_count} 件, 残りキュー {len(urls_to_visit)}")
 
-        visited_urls.add(current_normalized_url)
-        processed_unique_urls += 1
-        page_count += 1
+    # JSONL 出力では、見つけたFAQを書き出し中のファイルへ逐次追記する
+    writer = JsonlWriter(partial_file, append_at=output_offset) if stream_output else None
+    # 処理済みページのログ (チェックポイントのたびに、前回のチェックポイント以降に処理したページだけを追記する)
+    pages_writer = (JsonlWriter(checkpoint_pages_file, append_at=pages_offset, sync_interval=checkpoint_interval)
+                    if checkpoint_interval > 0 else None)
 
-        if processed_unique_urls % 10 == 0:
-            print(f"--- 処理済みユニークURL: {processed_unique_urls}, 発見済みFAQ: {faq_found_count}, 残りキュー: {len(urls_to_visit)} ---")
+    in_flight = {}   # Future -> URL (取得中・解析中のページ)
+    parse_jobs = {}  # 解析ステージの Future -> (cache_entry, change)
 
-        try:
-            time.sleep(REQUEST_DELAY)
-            # print(f"[{processed_unique_urls}/{MAX_PAGES}*] ページ取得中: {current_normalized_url}") # 少し冗長なのでコメントアウト
+    def record_page(url, faq_info, internal_links, cache_entry, change):
+        """処理が完了したページの結果を記録し、リンクをキューに追加する。FAQページならTrueを返す。"""
+        nonlocal faq_found_count
+        if url in sitemap_lastmod:
+            # 使い終わったものは取り除き、チェックポイントに残りのURLの分だけを保存する
+            cache_entry['lastmod'] = sitemap_lastmod.pop(url)
+        page_cache[url] = cache_entry
+        change_counts[change] += 1
+        PAGES_PROCESSED.inc(change=change)
 
-            response = requests.get(current_normalized_url, headers=HEADERS, timeout=20)
-            response.raise_for_status()
-            content_type = response.headers.get('content-type', '').lower()
-            if 'text/html' not in content_type:
-                 continue
+        if faq_info:
+            FAQS_FOUND.inc()
+            if writer is not None:
+                writer.write(faq_info)
+            else:
+                all_faq_data.append(faq_info)
+            faq_found_count += 1
+            # print(f" -> ★★★ FAQ発見 ({faq_found_count}件目): Q='{faq_info['question'][:50]}...'") # 毎回表示しない
 
-            response.encoding = response.apparent_encoding
-            soup = BeautifulSoup(response.text, 'html.parser')
+        if follow_links:
+            # 追加済みのURLはフロンティア側で重複として除外される
+            for normalized_link in internal_links:
+                if urlparse(normalized_link).netloc == start_domain:
+                    urls_to_visit.push(normalized_link, parent=url)
+        return bool(faq_info)
 
-            faq_info, internal_links = extract_specific_faq_and_links(soup, current_normalized_url)
+    # サイトマップからURLを集める (チェックポイントから再開した場合は保存済みのキューを使う)
+    if not restored and discovery != 'links':
+        sitemap_pages = []
+        with metrics.span('crawl.sitemap'):
+            for loc, lastmod in collect_sitemap_entries(normalized_start_url, fetcher):
+                url = normalize_url(loc, loc)
+                if url and urlparse(url).netloc == start_domain and filter_internal_links(url, [url]):
+                    sitemap_pages.append((url, lastmod))
 
-            if faq_info:
-                all_faq_data.append(faq_info)
-                faq_found_count += 1
-                # print(f" -> ★★★ FAQ発見 ({faq_found_count}件目): Q='{faq_info['question'][:50]}...'") # 毎回表示しない
+        if not sitemap_pages:
+            print("サイトマップが見つからないため、リンクをたどってクロールします。")
+        else:
+            follow_links = discovery != 'sitemap'
+            skipped_count = 0
+            for url, lastmod in sitemap_pages:
+                sitemap_lastmod[url] = lastmod
+                cached = previous_cache.get(url)
+                if cached and lastmod_unchanged(lastmod, cached.get('lastmod')) and url not in visited_urls:
+                    # 前回のクロールから更新されていないページは取得せず、前回の結果を再利用する
+                    urls_to_visit.mark_seen(url)
+                    visited_urls.add(url)
+                    processed_unique_urls += 1
+                    visit_order[url] = processed_unique_urls
+                    record_page(url, cached.get('faq'), set(cached.get('links', [])), cached, 'unchanged')
+                    skipped_count += 1
+                else:
+                    urls_to_visit.push(url)
+            print(f"サイトマップから {len(sitemap_pages)} 件のURLを取得しました。"
+                  f"(lastmod が前回から変わっていないため取得を省略: {skipped_count} 件)")
 
-            for normalized_link in internal_links:
-                if normalized_link not in visited_urls:
-                     if urlparse(normalized_link).netloc == start_domain:
-                        urls_to_visit.append(normalized_link)
-
-        except requests.exceptions.Timeout:
-             print(f"エラー: タイムアウトしました - {current_normalized_url}")
-        except requests.exceptions.RequestException as e:
-             if e.response is not None and e.response.status_code == 404:
-                 # 404 は頻繁に出るのでログレベルを下げる（表示しない）
-                 # print(f"情報: 404 Not Found - {current_normalized_url}")
-                 pass
-             else:
-                 print(f"エラー: ページの取得に失敗しました - {current_normalized_url}\n{e}")
-        except Exception as e:
-             print(f"エラー: ページの処理中に予期せぬエラーが発生しました - {current_normalized_url}\n{e}")
-
-        if page_count >= MAX_PAGES:
-             print("ページ数上限に達しました。")
-             break
+    def write_checkpoint():
+        # 取得中・解析中のURLは未完了として扱い、キューの先頭に戻して保存する。
+        # 処理済みのページ (訪問済みURL・探索順・ページキャッシュ・収集済みFAQ) は、前回のチェックポイント以降の
+        # 分だけをログに追記し、チェックポイントにはログと JSONL 出力の再開位置だけを書く
+        # (チェックポイントのたびに全ページを書き直すと、I/O がページ数の2乗に比例して増えるため)
+        pending = list(in_flight.values())
+        with metrics.span('crawl.checkpoint'):
+            for url in sorted(visited_urls - logged_urls - set(pending), key=visit_order.get):
+                entry = {'url': url, 'order': visit_order[url], 'page': page_cache.get(url)}
+                if url in gone_urls:
+                    entry['gone'] = True
+                pages_writer.write(entry)
+                logged_urls.add(url)
+            save_checkpoint(checkpoint_file, {
+                'start_url': normalized_start_url,
+                'urls_to_visit': pending + urls_to_visit.pending_urls(),
+                'pages_offset': pages_writer.sync(),
+                'faq_found_count': faq_found_count,
+                'output_offset': writer.sync() if writer is not None else None,
+                'change_counts': change_counts,
+                'follow_links': follow_links,
+                'sitemap_lastmod': sitemap_lastmod,
+            })
+
+    pages_since_checkpoint = 0
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    # parse_workers が1以上の場合は、取得 (スレッド) と解析 (プロセス) を別ステージに分ける
+    parse_executor = ProcessPoolExecutor(max_workers=parse_workers) if parse_workers > 0 else None
+    parse_queue_size = max(1, parse_queue_size or parse_workers * 2)
+    try:
+        while urls_to_visit or in_flight:
+            # 空いているワーカーにURLを割り当てる
+            # 解析待ちのページが parse_queue_size に達している間は新たな取得を始めない (背圧)
+            while (urls_to_visit and len(in_flight) - len(parse_jobs) < concurrency
+                   and (parse_executor is None or len(parse_jobs) < parse_queue_size)
+                   and page_count < MAX_PAGES):
+                current_normalized_url = urls_to_visit.pop()
+
+                if current_normalized_url in visited_urls:
+                    continue
+
+                visited_urls.add(current_normalized_url)
+                processed_unique_urls += 1
+                page_count += 1
+                visit_order[current_normalized_url] = processed_unique_urls
+
+                if processed_unique_urls % 10 == 0:
+                    print(f"--- 処理済みユニークURL: {processed_unique_urls}, 発見済みFAQ: {faq_found_count}, 残りキュー: {len(urls_to_visit)} ---")
+                    now = time.monotonic()
+                    FAQS_PER_SECOND.set(faq_found_count / max(now - crawl_started, 1e-9))
+                    if now - last_metrics_flush >= METRICS_FLUSH_INTERVAL:
+                        metrics.flush()
+                        last_metrics_flush = now
+
+                cached = previous_cache.get(current_normalized_url) if refresh else None
+                if parse_executor is not None:
+                    future = executor.submit(download_page, current_normalized_url, fetcher, cached)
+                else:
+                    future = executor.submit(fetch_page, current_normalized_url, fetcher, cached, parser_backend)
+                in_flight[future] = current_normalized_url
+
+            QUEUE_DEPTH.set(len(urls_to_visit))
+            IN_FLIGHT_PAGES.set(len(in_flight) - len(parse_jobs))
+            PARSE_BACKLOG.set(len(parse_jobs))
+            if not in_flight:
+                break
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                current_normalized_url = in_flight.pop(future)
+                parse_job = parse_jobs.pop(future, None)
+                is_faq = None  # 優先度モードでリンク元の的中率を更新するため
+                try:
+                    result = future.result()
+                    if parse_job is not None:
+                        # 解析ステージの完了
+                        cache_entry, change = parse_job
+                        (faq_info, internal_links), parse_seconds = result
+                        PARSE_SECONDS.observe(parse_seconds)
+                        cache_entry['faq'] = faq_info
+                        cache_entry['links'] = sorted(internal_links)
+                    elif parse_executor is not None:
+                        # 取得ステージの完了: 変更のあったページはバイト列のまま解析ステージへ渡す
+                        if result is None:
+                            continue
+                        raw, cache_entry, change = result
+                        if raw is not None:
+                            parse_future = parse_executor.submit(timed_parse_page, raw, current_normalized_url, parser_backend)
+                            in_flight[parse_future] = current_normalized_url
+                            parse_jobs[parse_future] = (cache_entry, change)
+                            continue
+                        faq_info, internal_links = cache_entry.get('faq'), set(cache_entry.get('links', []))
+                    else:
+                        if result is None:
+                            continue
+                        faq_info, internal_links, cache_entry, change = result
+
+                    is_faq = record_page(current_normalized_url, faq_info, internal_links, cache_entry, change)
+
+                except requests.exceptions.Timeout:
+                     PAGE_ERRORS.inc(kind='timeout')
+                     print(f"エラー: タイムアウトしました - {current_normalized_url}")
+                except requests.exceptions.RequestException as e:
+                     PAGE_ERRORS.inc(kind=f"http_{e.response.status_code}" if e.response is not None else 'request')
+                     if e.response is not None and e.response.status_code in GONE_STATUS_CODES:
+                         gone_urls.add(current_normalized_url)
+                     if e.response is not None and e.response.status_code == 404:
+                         # 404 は頻繁に出るのでログレベルを下げる（表示しない）
+                         # print(f"情報: 404 Not Found - {current_normalized_url}")
+                         pass
+                     else:
+                         print(f"エラー: ページの取得に失敗しました - {current_normalized_url}\n{e}")
+                except Exception as e:
+                     PAGE_ERRORS.inc(kind='unexpected')
+                     print(f"エラー: ページの処理中に予期せぬエラーが発生しました - {current_normalized_url}\n{e}")
+                finally:
+                    if current_normalized_url not in in_flight.values():
+                        urls_to_visit.record_result(current_normalized_url, is_faq)
+                        pages_since_checkpoint += 1
+
+            # 一定ページごとに途中状態を保存する
+            if checkpoint_interval > 0 and pages_since_checkpoint >= checkpoint_interval:
+                write_checkpoint()
+                pages_since_checkpoint = 0
+
+            if page_count >= MAX_PAGES and not in_flight:
+                 print("ページ数上限に達しました。")
+                 break
+    except KeyboardInterrupt:
+        # Ctrl-C で中断された場合は、その時点の状態を保存して終了する
+        print("\nクロールが中断されました。途中状態をチェックポイントに保存します。")
+        if checkpoint_interval > 0:
+            write_checkpoint()
+            print(f"  チェックポイント: {checkpoint_file} (--resume で再開できます)")
+        return False
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        if parse_executor is not None:
+            parse_executor.shutdown(wait=False, cancel_futures=True)
+        if writer is not None:
+            writer.close()
+        if pages_writer is not None:
+            pages_writer.close()
 
     print("-" * 30)
     if page_count >= MAX_PAGES:
@@ -199,30 +854,117 @@ def crawl_site_for_faq(start_url, output_filename):
          print("クロールを終了します。")
 
     print(f"\nクロール完了。合計 {processed_unique_urls} のユニークURLを処理し、{faq_found_count} 件の指定形式FAQ情報を収集しました。")
+    FAQS_PER_SECOND.set(faq_found_count / max(time.monotonic() - crawl_started, 1e-9))
+    QUEUE_DEPTH.set(len(urls_to_visit))
+    IN_FLIGHT_PAGES.set(0)
+    PARSE_BACKLOG.set(0)
+    frontier_stats = urls_to_visit.stats()
+    print(f"URLキュー: 登録 {frontier_stats['enqueued']} 件, 重複スキップ {frontier_stats['duplicates']} 件, "
+          f"最大キュー長 {frontier_stats['max_size']}, 未処理 {frontier_stats['queued']} 件")
+    # 前回のページキャッシュにあり、今回は結果を得られなかったページ:
+    # 削除されたとみなすのは、取得して GONE_STATUS_CODES が返ったページと、キューを最後まで処理しても
+    # (リンクされておらず) 訪問しなかったページだけ。MAX_PAGES での打ち切りや取得の失敗で結果がないページは、
+    # 次回の差分更新で使えるよう前回のキャッシュを引き継ぐ
+    frontier_exhausted = not urls_to_visit
+    removed_urls = set()
+    carried_count = 0
+    for url, entry in previous_cache.items():
+        if url in page_cache:
+            continue
+        if url in gone_urls or (frontier_exhausted and url not in visited_urls):
+            removed_urls.add(url)
+        else:
+            page_cache[url] = entry
+            carried_count += 1
+    if refresh:
+        print(f"差分更新: 変更なし {change_counts['unchanged']} ページ, 更新 {change_counts['updated']} ページ, "
+              f"追加 {change_counts['added']} ページ, 削除 {len(removed_urls)} ページ, "
+              f"未処理 (前回の結果を保持) {carried_count} ページ")
+    print("HTTPステータス別の件数:")
+    print(fetcher.format_stats() or "  (なし)")
+    save_page_cache(cache_file, page_cache)
+
+    # JSONL 出力は書き出し済みのファイルを出力ファイル名に置き換えて完了とする
+    if stream_output:
+        if faq_found_count:
+            saved_count = faq_found_count
+            try:
+                if dedup:
+                    # 書き出し済みのファイルを読み直して、重複を除いたファイルに置き換える
+                    deduplicated_file = partial_file + ".dedup"
+                    with metrics.span('crawl.dedup'):
+                        dedup_report = dedup_file(partial_file, deduplicated_file, jsonl=True)
+                    print(dedup_report.format())
+                    os.replace(deduplicated_file, partial_file)
+                    saved_count = dedup_report.after
+                os.replace(partial_file, output_filename)
+            except (OSError, ValueError) as e:
+                print(f"エラー: ファイルへの保存に失敗しました - {output_filename}\n{e}")
+                return False
+            print(f"データを {output_filename} に保存しました。({saved_count} 件)")
+            remove_checkpoint(checkpoint_file)
+            return True
+        try:
+            os.remove(partial_file)
+        except OSError:
+            pass
+
+    # 並行取得では完了順がばらつくため、探索順に並べ直す
+    all_faq_data.sort(key=lambda faq: visit_order.get(faq['url'], 0))
+    if dedup and all_faq_data:
+        with metrics.span('crawl.dedup'):
+            all_faq_data, dedup_report = dedup_records(all_faq_data)
+        print(dedup_report.format())
 
     # 結果の保存
     if all_faq_data:
-        save_success = save_data(all_faq_data, output_filename)
+        with metrics.span('crawl.save'):
+            save_success = save_data(all_faq_data, output_filename)
+        if save_success:
+            remove_checkpoint(checkpoint_file)
         return save_success # 保存の成否を返す
     else:
         print("指定形式のFAQデータが見つからなかったため、ファイルは保存されませんでした。")
+        remove_checkpoint(checkpoint_file)
         # FAQが見つからなくても、クロール自体は正常終了したとみなすか？
         # ここではデータがない場合も True (処理は正常完了) を返すことにする
         # 必要であれば False に変更
         return True
 
 
-def run_crawl(start_url: str | None = None, output_filename: str = DEFAULT_OUTPUT_FILENAME):
+def run_crawl(start_url: str | None = None, output_filename: str = DEFAULT_OUTPUT_FILENAME,
+              concurrency: int = CONCURRENCY, rate_limit: float = RATE_LIMIT_PER_HOST,
+              resume: bool = False, checkpoint_interval: int = CHECKPOINT_INTERVAL,
+              refresh: bool = False, parser_backend: str = PARSER_BACKEND,
+              parse_workers: int = PARSE_WORKERS, frontier_priority: bool = FRONTIER_PRIORITY,
+              discovery: str = DISCOVERY_MODE, dedup: bool = DEDUP_ON_CRAWL):
     """
     クローラーを実行するメイン関数。URLが指定されなければ入力を促す。
 
     Args:
         start_url (str | None): 開始URL。Noneの場合はユーザーに入力を求める。
         output_filename (str): 出力ファイル名。
+        concurrency (int): 同時に処理するリクエスト数。
+        rate_limit (float): ホストごとのレート制限 (1秒あたりのリクエスト数)。
+        resume (bool): Trueの場合、前回のチェックポイントからクロールを再開する。
+                       開始URLが指定されていなければチェックポイントの開始URLを使用する。
+        checkpoint_interval (int): チェックポイントを書き出す間隔 (ページ数)。0以下で無効。
+        refresh (bool): Trueの場合、前回のページキャッシュを使った差分更新クロールを行う。
+        parser_backend (str): HTML解析バックエンド ('html.parser' または 'lxml')。
+        parse_workers (int): HTML解析を行うプロセス数。0の場合は取得スレッド内で解析する。
+        frontier_priority (bool): Trueの場合、FAQページらしいURLから優先して取得する。
+        discovery (str): URLの発見方法 ('links', 'sitemap+links', 'sitemap')。
+        dedup (bool): Trueの場合、保存前に重複に近いFAQを1件にまとめる。
 
     Returns:
         bool: クロールと保存が正常に完了した場合はTrue、失敗した場合はFalse。
     """
+    if start_url is None and resume:
+        # 再開時はチェックポイントに記録された開始URLを使い、入力を求めない
+        state = load_checkpoint(checkpoint_filename(output_filename))
+        if state is not None:
+            start_url = state.get('start_url')
+
     if start_url is None:
         start_url_input = input(f"探索を開始するサイトのURLを入力してください (デフォルト: {DEFAULT_START_URL}): ")
         # 入力が空ならデフォルトURLを使用
@@ -239,7 +981,13 @@ def run_crawl(start_url: str | None = None, output_filename: str = DEFAULT_OUTPU
         return False
 
     # クロール本体の実行
-    success = crawl_site_for_faq(start_url_to_use, output_filename)
+    success = crawl_site_for_faq(start_url_to_use, output_filename,
+                                 concurrency=concurrency, rate_limit=rate_limit,
+                                 resume=resume, checkpoint_interval=checkpoint_interval,
+                                 refresh=refresh, parser_backend=parser_backend,
+                                 parse_workers=parse_workers, frontier_priority=frontier_priority,
+                                 discovery=discovery, dedup=dedup)
+    metrics.flush()
 
     print("-" * 30)
     if success:
@@ -251,7 +999,76 @@ def run_crawl(start_url: str | None = None, output_filename: str = DEFAULT_OUTPU
 
 # スクリプトとして直接実行された場合の処理
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="FAQコンテンツ探索・保存スクリプト")
+    parser.add_argument("--start-url", default=None, help="開始URL (省略時は入力を求める)")
+    parser.add_argument("--output", default=None, help=f"出力ファイル名 (デフォルト: {DEFAULT_OUTPUT_FILENAME})")
+    parser.add_argument("--corpus", action="append",
+                        help="クロールするコーパスの名前 (複数指定可)。コーパスの定義の開始URLから、定義の出力ファイルに保存する")
+    parser.add_argument("--corpora-file", help="コーパスの定義ファイル (デフォルト: あれば corpus.CORPORA_FILE)")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="同時に処理するリクエスト数")
+    parser.add_argument("--rate", type=float, default=RATE_LIMIT_PER_HOST, help="ホストごとの1秒あたりのリクエスト数")
+    parser.add_argument("--resume", action="store_true", help="前回のチェックポイントからクロールを再開する")
+    parser.add_argument("--checkpoint-interval", type=int, default=CHECKPOINT_INTERVAL,
+                        help="チェックポイントを書き出す間隔 (ページ数, 0で無効)")
+    parser.add_argument("--refresh", action="store_true",
+                        help="前回のクロール結果を使い、変更されたページだけを取得し直す (差分更新)")
+    parser.add_argument("--parser", choices=PARSER_BACKENDS, default=PARSER_BACKEND,
+                        help="HTML解析バックエンド (lxml の方が高速)")
+    parser.add_argument("--parse-workers", type=int, default=PARSE_WORKERS,
+                        help="HTML解析を行うプロセス数 (0で取得スレッド内で解析)")
+    parser.add_argument("--priority", action="store_true",
+                        help="FAQページらしいURLから優先して取得する (MAX_PAGES で打ち切る場合に有効)")
+    parser.add_argument("--discovery", choices=DISCOVERY_MODES, default=DISCOVERY_MODE,
+                        help="URLの発見方法 (sitemap+links: サイトマップから始めてリンクもたどる, sitemap: サイトマップのURLのみ)")
+    parser.add_argument("--dedup", dest="dedup", action="store_true", default=DEDUP_ON_CRAWL,
+                        help="重複に近いFAQを1件にまとめて保存する (他のURLは alternate_urls に残す)")
+    parser.add_argument("--no-dedup", dest="dedup", action="store_false",
+                        help="重複に近いFAQをまとめずにすべて保存する (DEDUP_ON_CRAWL が True の場合に使う)")
+    parser.add_argument("--metrics-file",
+                        help="計測値 (取得時間・受信バイト数・解析時間・キューの長さなど) の書き出し先 (.prom: Prometheus 形式, それ以外: JSON)")
+    parser.add_argument("--trace-file", help="処理段階ごとのスパン (所要時間) を JSONL 形式で追記するファイル")
+    args = parser.parse_args()
+    if args.concurrency <= 0:
+        parser.error("--concurrency には 1 以上を指定してください")
+    if args.rate <= 0:
+        parser.error("--rate には 0 より大きい値を指定してください")
+    if args.corpus and (args.start_url or args.output):
+        parser.error("--corpus は --start-url / --output と同時に指定できません (コーパスの定義で指定してください)")
+
+    crawl_targets = [(args.start_url, args.output or DEFAULT_OUTPUT_FILENAME)]
+    if args.corpus:
+        try:
+            corpora = load_corpora(args.corpora_file, DEFAULT_OUTPUT_FILENAME)
+            configs = [select_corpus(corpora, name) for name in dict.fromkeys(args.corpus)]
+        except (IOError, OSError, ValueError) as e:
+            print(f"エラー: コーパスの設定を読み込めませんでした。\n{e}")
+            sys.exit(1)
+        missing = [config.name for config in configs if config.start_url is None and config.name != DEFAULT_CORPUS]
+        if missing:
+            print(f"エラー: コーパスの定義に start_url がありません - {', '.join(missing)}")
+            sys.exit(1)
+        # 1つのプロセスで、指定したコーパスを順にクロールする (組み込みのコーパスはデフォルトの開始URL)
+        crawl_targets = [(config.start_url or DEFAULT_START_URL, config.data_file) for config in configs]
+
+    try:
+        metrics.configure(args.metrics_file, args.trace_file)
+    except (IOError, OSError) as e:
+        print(f"エラー: トレースファイルを開けませんでした - {args.trace_file}\n{e}")
+        sys.exit(1)
+
     print("FAQコンテンツ探索・保存スクリプト")
     print("-" * 30)
-    # 直接実行時はデフォルトファイル名を使用
-    run_crawl(start_url=None, output_filename=DEFAULT_OUTPUT_FILENAME)
\ No newline at end of file
+    failed = []
+    for start_url, output_filename in crawl_targets:
+        if args.corpus:
+            print(f"コーパスのクロール: {start_url} -> {output_filename}")
+        if not run_crawl(start_url=start_url, output_filename=output_filename,
+                         concurrency=args.concurrency, rate_limit=args.rate,
+                         resume=args.resume, checkpoint_interval=args.checkpoint_interval,
+                         refresh=args.refresh, parser_backend=args.parser,
+                         parse_workers=args.parse_workers, frontier_priority=args.priority,
+                         discovery=args.discovery, dedup=args.dedup):
+            failed.append(output_filename)
+    if args.corpus and failed:
+        print(f"エラー: {len(failed)} 件のコーパスのクロールに失敗しました - {', '.join(failed)}")
+        sys.exit(1)
\ No newline at end of file
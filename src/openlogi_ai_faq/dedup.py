@@ -0,0 +1,295 @@
+# src/openlogi_ai_faq/dedup.py (MinHash と LSH による重複に近いFAQの検出と除去)
+import argparse
+import hashlib
+import json
+import sys
+import unicodedata
+
+import numpy as np
+
+from .faq_io import file_hash, iter_faq_records, write_faq_records, write_json_atomic
+
+# 重複の判定に使う文字 n-gram (シングル) の長さ
+SHINGLE_SIZE = 3
+# MinHash の署名の長さ (ハッシュ関数の数)
+MINHASH_PERMUTATIONS = 64
+# LSH のバンド数 (1バンドあたり MINHASH_PERMUTATIONS // LSH_BANDS 個の値)。
+# 1つでもバンドが一致したFAQの組だけを候補として比較するため、全組み合わせを比較せずに済む
+LSH_BANDS = 16
+# 重複とみなす類似度 (シングルの Jaccard 係数の推定値) の下限
+DUPLICATE_THRESHOLD = 0.8
+# True の場合、類似度に加えて回答が (正規化後に) 同じFAQだけをまとめる。
+# 料金や日付だけが異なるFAQは類似度が高くなるため、False にするとそれらの一方が失われることがある
+SAME_ANSWER_ONLY = True
+# 1つのバケットから比較の候補にするFAQの最大件数 (同じバケットに大量のFAQが集まった場合の安全装置)
+MAX_BUCKET_CANDIDATES = 50
+# ハッシュ関数の係数を作る乱数のシード (変えると署名が変わる)
+MINHASH_SEED = 1
+# 重複の検出結果のキャッシュファイルの接尾辞 (FAQデータファイルと同じ場所に保存する)
+DEDUP_SUFFIX = ".dedup.json"
+DEDUP_VERSION = 2
+
+_PRIME = (1 << 31) - 1
+_rng = np.random.default_rng(MINHASH_SEED)
+_HASH_A = _rng.integers(1, _PRIME, size=(MINHASH_PERMUTATIONS, 1), dtype=np.uint64)
+_HASH_B = _rng.integers(0, _PRIME, size=(MINHASH_PERMUTATIONS, 1), dtype=np.uint64)
+_MIX = np.uint64(0x9E3779B1)
+
+
+def _normalize(text):
+    return "".join(unicodedata.normalize('NFKC', text).lower().split())
+
+
+def _normalized_text(faq):
+    """質問と回答を、全角・半角と大文字・小文字を揃えて空白を除いた1つの文字列にする。"""
+    return _normalize(f"{faq.get('question', '')}|{faq.get('answer', '')}")
+
+
+def _answer_digest(faq):
+    """正規化した回答のダイジェスト (回答が同じかどうかの比較用。回答の全文はメモリに残さない)。"""
+    return hashlib.sha1(_normalize(faq.get('answer', '')).encode('utf-8')).digest()
+
+
+def minhash_signature(text, shingle_size=SHINGLE_SIZE):
+    """
+    文字列の文字 n-gram の集合に対する MinHash の署名を返す。
+
+    Returns:
+        numpy.ndarray: 長さ MINHASH_PERMUTATIONS の uint32 配列。
+    """
+    codes = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+    if len(codes) < shingle_size:
+        codes = np.concatenate([codes, np.zeros(shingle_size - len(codes), dtype=np.uint64)])
+    # 連続する shingle_size 文字の文字コードを1つの値にまとめる (桁あふれは 2^64 を法として切り捨てる)
+    count = len(codes) - shingle_size + 1
+    shingles = codes[:count].copy()
+    with np.errstate(over='ignore'):
+        for offset in range(1, shingle_size):
+            shingles = shingles * _MIX + codes[offset:offset + count]
+    shingles = np.unique(shingles % np.uint64(_PRIME))
+    # ハッシュ関数 (a * x + b) mod p ごとの最小値。a, b, x < 2^31 なので uint64 で桁あふれしない
+    return ((_HASH_A * shingles + _HASH_B) % np.uint64(_PRIME)).min(axis=1).astype(np.uint32)
+
+
+def _is_usable(faq):
+    return isinstance(faq, dict) and bool(faq.get('question') and faq.get('answer'))
+
+
+def find_duplicates(records, threshold=DUPLICATE_THRESHOLD, bands=LSH_BANDS, same_answer=SAME_ANSWER_ONLY):
+    """
+    重複に近いFAQのクラスターを探す。
+    各FAQの MinHash 署名を LSH のバンドに分けてバケットに入れ、同じバケットに入ったFAQとだけ
+    署名の一致率 (Jaccard 係数の推定値) を比べる。threshold 以上の組を同じクラスターにまとめる。
+    質問または回答のないレコードは対象にしない。
+
+    Args:
+        records (Iterable[dict]): FAQレコード (iter_faq_records などのイテレーターでもよい)。
+        same_answer (bool): Trueの場合、回答が (正規化後に) 同じ組だけをまとめる。
+
+    Returns:
+        tuple[dict[int, list[int]], int]: (代表レコードの位置 -> 重複するレコードの位置のリスト, レコードの件数)。
+                                          代表はクラスター内で最初に現れたレコード。
+    """
+    rows = MINHASH_PERMUTATIONS // bands
+    buckets = [{} for _ in range(bands)]
+    signatures = {}
+    answer_digests = {}
+    parent = {}
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    count = 0
+    for position, faq in enumerate(records):
+        count += 1
+        if not _is_usable(faq):
+            continue
+        signature = minhash_signature(_normalized_text(faq))
+        signatures[position] = signature
+        if same_answer:
+            answer_digests[position] = _answer_digest(faq)
+        parent[position] = position
+        candidates = set()
+        for band in range(bands):
+            key = signature[band * rows:(band + 1) * rows].tobytes()
+            members = buckets[band].setdefault(key, [])
+            candidates.update(members[-MAX_BUCKET_CANDIDATES:])
+            members.append(position)
+        for other in sorted(candidates):
+            root, other_root = find(position), find(other)
+            if root == other_root:
+                continue
+            if same_answer and answer_digests[other] != answer_digests[position]:
+                continue
+            if np.count_nonzero(signatures[other] == signature) / MINHASH_PERMUTATIONS >= threshold:
+                # 先に現れたレコードを代表にする
+                parent[max(root, other_root)] = min(root, other_root)
+
+    clusters = {}
+    for position in parent:
+        root = find(position)
+        if root != position:
+            clusters.setdefault(root, []).append(position)
+    return clusters, count
+
+
+def merge_alternate_urls(canonical, duplicates):
+    """
+    代表レコードのコピーに、重複するレコードのURLを 'alternate_urls' として加える
+    (以前の重複除去で付けた 'alternate_urls' も引き継ぐ)。
+    """
+    merged = dict(canonical)
+    urls = []
+    for faq in [canonical] + list(duplicates):
+        for url in [faq.get('url')] + list(faq.get('alternate_urls') or []):
+            if url and url != canonical.get('url') and url not in urls:
+                urls.append(url)
+    if urls:
+        merged['alternate_urls'] = urls
+    return merged
+
+
+class DedupReport:
+    """重複除去の前後の件数。"""
+
+    def __init__(self, before, clusters):
+        self.before = before
+        self.clusters = len(clusters)
+        self.removed = sum(len(duplicates) for duplicates in clusters.values())
+        self.after = before - self.removed
+
+    def format(self):
+        return (f"重複に近いFAQの除去: {self.before} 件 -> {self.after} 件 "
+                f"(重複のまとまり {self.clusters} 個, 除去 {self.removed} 件)")
+
+
+def apply_clusters(faq_data, clusters):
+    """
+    find_duplicates の結果に従って、重複するレコードを除き、代表レコードに 'alternate_urls' を加えたリストを返す。
+    """
+    if not clusters:
+        return list(faq_data)
+    removed = {position for duplicates in clusters.values() for position in duplicates}
+    result = []
+    for position, faq in enumerate(faq_data):
+        if position in removed:
+            continue
+        if position in clusters:
+            faq = merge_alternate_urls(faq, [faq_data[i] for i in clusters[position]])
+        result.append(faq)
+    return result
+
+
+def dedup_records(faq_data, threshold=DUPLICATE_THRESHOLD, same_answer=SAME_ANSWER_ONLY):
+    """
+    FAQデータのリストから重複に近いレコードを除く。
+
+    Returns:
+        tuple[list[dict], DedupReport]: 重複を除いたリストと件数の内訳。
+    """
+    clusters, count = find_duplicates(faq_data, threshold, same_answer=same_answer)
+    return apply_clusters(faq_data, clusters), DedupReport(count, clusters)
+
+
+def dedup_file(src_filename, dst_filename, threshold=DUPLICATE_THRESHOLD, jsonl=None, same_answer=SAME_ANSWER_ONLY):
+    """
+    FAQデータファイルから重複に近いレコードを除いて dst_filename に書き出す。
+    jsonl は faq_io.write_faq_records と同じ (Noneの場合は dst_filename の拡張子で形式を決める)。
+    1回目の読み込みで署名だけを作ってクラスターを求め、2回目で重複レコードのURLを集め、3回目でレコードを書き出すため、
+    JSONL 形式のファイルでも全レコードをメモリに載せない。
+
+    Returns:
+        DedupReport: 件数の内訳。
+
+    Raises:
+        IOError, OSError, ValueError: ファイルの読み書きに失敗した場合。
+    """
+    clusters, count = find_duplicates(iter_faq_records(src_filename), threshold, same_answer=same_answer)
+    duplicate_of = {position: root for root, duplicates in clusters.items() for position in duplicates}
+    # 代表レコードより後に現れる重複レコードの情報を先に集めておく
+    duplicate_records = {}
+    if duplicate_of:
+        for position, faq in enumerate(iter_faq_records(src_filename)):
+            if position in duplicate_of:
+                duplicate_records.setdefault(duplicate_of[position], []).append(
+                    {'url': faq.get('url'), 'alternate_urls': faq.get('alternate_urls')})
+
+    def deduplicated():
+        for position, faq in enumerate(iter_faq_records(src_filename)):
+            if position in duplicate_of:
+                continue
+            if position in duplicate_records:
+                faq = merge_alternate_urls(faq, duplicate_records[position])
+            yield faq
+
+    write_faq_records(deduplicated(), dst_filename, jsonl)
+    return DedupReport(count, clusters)
+
+
+def dedup_cache_filename(data_filename):
+    """FAQデータファイル名に対応する重複検出結果のキャッシュファイル名を返す。"""
+    return data_filename + DEDUP_SUFFIX
+
+
+def load_deduplicated(data_filename, faq_data, threshold=DUPLICATE_THRESHOLD):
+    """
+    読み込んだFAQデータから重複に近いレコードを除く。
+    検出結果は FAQデータファイルのハッシュとともにキャッシュし、ファイルが変わっていなければ再計算しない。
+
+    Returns:
+        tuple[list[dict], DedupReport]: 重複を除いたリストと件数の内訳。
+    """
+    data_hash = file_hash(data_filename)
+    params = [SHINGLE_SIZE, MINHASH_PERMUTATIONS, LSH_BANDS, threshold, MINHASH_SEED, SAME_ANSWER_ONLY]
+    cache_file = dedup_cache_filename(data_filename)
+    clusters = None
+    try:
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+        if (isinstance(cached, dict) and cached.get('version') == DEDUP_VERSION and cached.get('data_hash') == data_hash
+                and cached.get('params') == params and cached.get('count') == len(faq_data)):
+            clusters = {int(root): duplicates for root, duplicates in cached['clusters'].items()}
+    except FileNotFoundError:
+        pass
+    except (json.JSONDecodeError, KeyError, TypeError, ValueError, IOError, OSError) as e:
+        print(f"警告: 重複検出の結果の読み込みに失敗しました。検出し直します - {cache_file}\n{e}")
+
+    if clusters is None:
+        clusters, _ = find_duplicates(faq_data, threshold)
+        data = {'version': DEDUP_VERSION, 'data_hash': data_hash, 'params': params, 'count': len(faq_data),
+                'clusters': {str(root): duplicates for root, duplicates in clusters.items()}}
+        try:
+            write_json_atomic(cache_file, data)
+        except (IOError, OSError) as e:
+            print(f"警告: 重複検出の結果の保存に失敗しました - {cache_file}\n{e}")
+    return apply_clusters(faq_data, clusters), DedupReport(len(faq_data), clusters)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="FAQデータファイルから重複に近いFAQを除く (MinHash + LSH)")
+    parser.add_argument("src", help="FAQデータファイル")
+    parser.add_argument("dst", nargs="?", help="重複を除いたデータの出力先 (省略時は検出結果の表示のみ)")
+    parser.add_argument("--threshold", type=float, default=DUPLICATE_THRESHOLD,
+                        help=f"重複とみなす類似度の下限 (デフォルト: {DUPLICATE_THRESHOLD})")
+    parser.add_argument("--similar-answers", dest="same_answer", action="store_false", default=SAME_ANSWER_ONLY,
+                        help="回答が異なっていても類似度だけでまとめる (料金や日付だけが異なるFAQもまとめられる)")
+    args = parser.parse_args()
+
+    try:
+        if args.dst:
+            report = dedup_file(args.src, args.dst, args.threshold, same_answer=args.same_answer)
+        else:
+            faq_data = list(iter_faq_records(args.src))
+            clusters, _ = find_duplicates(faq_data, args.threshold, same_answer=args.same_answer)
+            for root, duplicates in sorted(clusters.items()):
+                print(f"{faq_data[root].get('question')}  {faq_data[root].get('url')}")
+                for position in duplicates:
+                    print(f"    = {faq_data[position].get('question')}  {faq_data[position].get('url')}")
+            report = DedupReport(len(faq_data), clusters)
+    except (IOError, OSError, ValueError) as e:
+        print(f"エラー: FAQデータの処理に失敗しました - {args.src}\n{e}")
+        sys.exit(1)
+    print(report.format())
@@ -0,0 +1,238 @@
+# src/openlogi_ai_faq/faq_io.py (FAQデータファイルの読み書き: JSON配列 / JSONL)
+import argparse
+import hashlib
+import json
+import os
+import sys
+import tempfile
+
+# FAQデータファイルのデフォルトのファイル名 (クローラーの出力先・Q&Aアプリの読み込み元)
+DEFAULT_FAQ_FILENAME = "faq_data_openlogi.json"
+# JSONL 出力で flush + fsync を行う間隔 (レコード数)
+JSONL_SYNC_INTERVAL = 50
+# クローラーの差分更新用のページキャッシュ (ETag, Last-Modified, 内容ハッシュ) のファイル名接尾辞
+PAGE_CACHE_SUFFIX = ".pagecache.json"
+
+
+def is_jsonl_filename(filename):
+    """ファイル名の拡張子が JSONL 形式 (.jsonl) かどうかを返す。"""
+    return filename.lower().endswith('.jsonl')
+
+
+def page_cache_filename(output_filename):
+    """出力ファイル名に対応するページキャッシュのファイル名を返す。"""
+    return output_filename + PAGE_CACHE_SUFFIX
+
+
+def file_hash(filename):
+    """ファイル内容の SHA-256 ハッシュ (16進文字列) を返す。"""
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _umask():
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+# 新しく作るファイルの権限 (mkstemp の一時ファイルは 0600 で作られるため、置き換える前に通常のファイルと同じにする)
+_FILE_MODE = 0o666 & ~_umask()
+
+
+def _temp_file_for(filename):
+    """
+    filename を置き換えるための一時ファイルを同じディレクトリに作り、その名前を返す。
+    名前は呼び出しごとに異なり、権限は filename (なければ新しいファイル) と同じにする。
+    """
+    directory, basename = os.path.split(os.path.abspath(filename))
+    fd, tmp_filename = tempfile.mkstemp(prefix=basename + ".", suffix=".tmp", dir=directory)
+    try:
+        try:
+            mode = os.stat(filename).st_mode & 0o777
+        except OSError:
+            mode = _FILE_MODE
+        os.fchmod(fd, mode)
+    finally:
+        os.close(fd)
+    return tmp_filename
+
+
+def _remove_quietly(filename):
+    try:
+        os.remove(filename)
+    except OSError:
+        pass
+
+
+def write_json_atomic(filename, data):
+    """
+    書き込み途中で中断されても壊れないよう、一時ファイルに書いてから置き換える。
+    一時ファイルは呼び出しごとに別の名前で作るため、複数のスレッド・プロセスが同じファイルに書き込んでも
+    互いの一時ファイルを置き換えてしまうことはない (最後に置き換えた内容が残る)。
+    """
+    tmp_filename = _temp_file_for(filename)
+    try:
+        with open(tmp_filename, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_filename, filename)
+    except BaseException:
+        _remove_quietly(tmp_filename)
+        raise
+
+
+def _detect_format(f):
+    """ファイル先頭の空白以外の文字を見て 'json' (配列) か 'jsonl' かを判定する。"""
+    while True:
+        ch = f.read(1)
+        if not ch:
+            return 'jsonl'  # 空ファイルはレコード0件のJSONLとして扱う
+        if not ch.isspace():
+            f.seek(0)
+            return 'json' if ch == '[' else 'jsonl'
+
+
+def iter_faq_records(filename):
+    """
+    FAQデータファイルからレコードを1件ずつ返すジェネレーター。
+    JSONL 形式は1行ずつ読み込むため、ファイル全体をメモリに載せない。
+    従来の JSON 配列形式も読み込める (この場合は配列全体を読み込んでから返す)。
+
+    Raises:
+        FileNotFoundError: ファイルが存在しない場合。
+        json.JSONDecodeError: JSONとして解析できない場合。
+        ValueError: JSON配列形式でトップレベルがリストではない場合。
+    """
+    with open(filename, 'r', encoding='utf-8') as f:
+        if _detect_format(f) == 'json':
+            data = json.load(f)
+            if not isinstance(data, list):
+                raise ValueError(f"{filename} のデータ形式がリストではありません。")
+            yield from data
+            return
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+class JsonlWriter:
+    """
+    FAQレコードを1件ずつ JSONL ファイルに書き出す。
+    sync_interval 件ごとに flush と fsync を行い、中断時に失われるレコードを抑える。
+    """
+
+    def __init__(self, filename, append_at=None, sync_interval=JSONL_SYNC_INTERVAL):
+        """
+        Args:
+            filename (str): 出力ファイル名。
+            append_at (int | None): 指定した場合は既存ファイルをこのバイト位置で切り詰めて追記する
+                                    (チェックポイントからの再開用)。Noneの場合は新規作成。
+            sync_interval (int): flush + fsync を行う間隔 (レコード数)。
+        """
+        self.filename = filename
+        self.sync_interval = max(1, sync_interval)
+        self.count = 0
+        self._unsynced = 0
+        if append_at is not None and os.path.exists(filename):
+            self._file = open(filename, 'r+b')
+            self._file.truncate(append_at)
+            self._file.seek(append_at)
+        else:
+            self._file = open(filename, 'wb')
+
+    def write(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n')
+        self.count += 1
+        self._unsynced += 1
+        if self._unsynced >= self.sync_interval:
+            self.sync()
+
+    def sync(self):
+        """書き込み済みのレコードをディスクに反映し、現在のバイト位置を返す。"""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        return self._file.tell()
+
+    def close(self):
+        if not self._file.closed:
+            self.sync()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def write_faq_records(records, filename, jsonl=None):
+    """
+    FAQレコードを1件ずつファイルに書き出す。
+
+    Args:
+        records (Iterable[dict]): 書き出すレコード。
+        filename (str): 出力ファイル名。
+        jsonl (bool | None): JSONL 形式で書き出すか。Noneの場合は filename の拡張子 (.jsonl かどうか) で決める。
+
+    Returns:
+        int: 書き出したレコード数。
+    """
+    if jsonl is None:
+        jsonl = is_jsonl_filename(filename)
+    if jsonl:
+        with JsonlWriter(filename) as writer:
+            for record in records:
+                writer.write(record)
+            return writer.count
+
+    # JSON配列形式は配列全体を一度に書き出す必要があるため、レコードを順に書き込んで括弧で囲む
+    count = 0
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write('[\n')
+        for record in records:
+            if count:
+                f.write(',\n')
+            # crawler.save_data (json.dump(..., indent=2)) と同じ字下げにする
+            f.write('  ' + json.dumps(record, ensure_ascii=False, indent=2).replace('\n', '\n  '))
+            count += 1
+        f.write('\n]\n')
+    return count
+
+
+def convert_faq_file(src_filename, dst_filename):
+    """
+    FAQデータファイルを JSON配列形式 と JSONL形式 の間で変換する。
+    出力形式は dst_filename の拡張子 (.jsonl かどうか) で決まる。
+    変換元は1件ずつ読み込むため、一時ファイルに書き出してから dst_filename を置き換える
+    (src_filename と同じファイルを指定しても、読み込む前に変換元を空にしてしまわない)。
+
+    Returns:
+        int: 変換したレコード数。
+    """
+    tmp_filename = _temp_file_for(dst_filename)
+    try:
+        count = write_faq_records(iter_faq_records(src_filename), tmp_filename, jsonl=is_jsonl_filename(dst_filename))
+        os.replace(tmp_filename, dst_filename)
+    except BaseException:
+        _remove_quietly(tmp_filename)
+        raise
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="FAQデータファイルを JSON配列形式 と JSONL形式 の間で変換する")
+    parser.add_argument("src", help="変換元のファイル")
+    parser.add_argument("dst", help="変換先のファイル (拡張子 .jsonl なら JSONL 形式、それ以外は JSON 配列形式)")
+    args = parser.parse_args()
+
+    try:
+        converted = convert_faq_file(args.src, args.dst)
+    except (IOError, OSError, ValueError) as e:
+        print(f"エラー: 変換に失敗しました - {args.src}\n{e}")
+        sys.exit(1)
+    print(f"{args.src} を {args.dst} に変換しました。({converted} 件)")
@@ -0,0 +1,167 @@
+# src/openlogi_ai_faq/fetcher.py (接続プール・再試行・適応的な速度調整付きのHTTP取得)
+import random
+import threading
+import time
+from collections import Counter
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from . import metrics
+from .ratelimit import AdaptiveHostRateLimiter
+
+# 再試行の最大回数 (最初のリクエストは含まない)
+MAX_RETRIES = 3
+# 再試行の待機時間: min(BACKOFF_MAX, BACKOFF_BASE * 2**試行回数) にジッターをかける
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+# Retry-After で指定された待機時間の上限 (秒)
+RETRY_AFTER_MAX = 300.0
+# 再試行の対象とするHTTPステータス
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+# サーバーから速度を落とすよう求められたとみなすHTTPステータス
+THROTTLE_STATUSES = frozenset([429, 503])
+REQUEST_TIMEOUT = 20
+
+FETCH_SECONDS = metrics.histogram('crawler_fetch_seconds', "HTTPリクエストの応答時間 (秒, 再試行を含む1回ごと)")
+RESPONSES = metrics.counter('crawler_http_responses_total',
+                            "HTTPステータス (または例外の種類) と結果 (ok / retried / dropped) ごとの応答数")
+DOWNLOADED_BYTES = metrics.counter('crawler_downloaded_bytes_total', "受信したレスポンスボディのバイト数 (展開後)")
+
+
+def parse_retry_after(value):
+    """Retry-After ヘッダー (秒数またはHTTP日付) を秒数に変換する。解析できない場合はNone。"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return min(float(value), RETRY_AFTER_MAX)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return min(max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds()), RETRY_AFTER_MAX)
+
+
+class Fetcher:
+    """
+    クローラー用のHTTP取得レイヤー。
+
+    - スレッドごとに requests.Session を持ち、Keep-Alive で接続を再利用する (接続プール)。
+    - gzip / deflate で圧縮された転送を受け付ける。
+    - タイムアウト・接続エラー・RETRY_STATUSES の応答は、ジッター付きの指数バックオフで
+      max_retries 回まで再試行する。Retry-After があればその秒数を優先する。
+    - ホストごとのレートは AdaptiveHostRateLimiter で調整する (429 / Retry-After / 応答時間の
+      悪化で下げ、正常な応答が続けば設定値まで戻す)。
+    - ステータス (または例外の種類) ごとに、成功・再試行・失敗の件数を数える。
+    """
+
+    def __init__(self, headers=None, rate=1.0, burst=1, pool_size=10, max_retries=MAX_RETRIES,
+                 backoff_base=BACKOFF_BASE, backoff_max=BACKOFF_MAX, timeout=REQUEST_TIMEOUT):
+        self.headers = dict(headers or {})
+        self.headers.setdefault('Accept-Encoding', 'gzip, deflate')
+        self.rate_limiter = AdaptiveHostRateLimiter(rate, burst)
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self._local = threading.local()
+        self._counts = Counter()   # (ステータス, 'ok' | 'retried' | 'dropped') -> 件数
+        self._counts_lock = threading.Lock()
+
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers.update(self.headers)
+            self._local.session = session
+        return session
+
+    def _count(self, status, outcome):
+        with self._counts_lock:
+            self._counts[(status, outcome)] += 1
+        RESPONSES.inc(status=status, outcome=outcome)
+
+    def _backoff(self, attempt):
+        # フルジッター: 0 〜 上限 の一様乱数。複数ワーカーの再試行が同時に集中しないようにする
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def get(self, url, headers=None):
+        """
+        URLを取得する。再試行しても失敗した場合は、最後の応答を返すか例外を送出する。
+        応答のステータスの確認 (raise_for_status) は呼び出し元で行う。
+
+        Raises:
+            requests.exceptions.RequestException: 再試行しても接続できなかった場合など。
+        """
+        host = urlparse(url).netloc
+        session = self._session()
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire(host)
+            start = time.monotonic()
+            try:
+                response = session.get(url, headers=headers, timeout=self.timeout)
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+                FETCH_SECONDS.observe(time.monotonic() - start)
+                kind = 'timeout' if isinstance(e, requests.exceptions.Timeout) else 'connection_error'
+                if attempt >= self.max_retries:
+                    self._count(kind, 'dropped')
+                    raise
+                self._count(kind, 'retried')
+                self.rate_limiter.on_throttle(host)
+                time.sleep(self._backoff(attempt))
+                attempt += 1
+                continue
+
+            elapsed = time.monotonic() - start
+            FETCH_SECONDS.observe(elapsed)
+            DOWNLOADED_BYTES.inc(len(response.content))
+            status = response.status_code
+            if status not in RETRY_STATUSES:
+                self.rate_limiter.on_success(host, elapsed)
+                self._count(status, 'ok' if status < 400 else 'dropped')
+                return response
+
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            if status in THROTTLE_STATUSES or retry_after is not None:
+                self.rate_limiter.on_throttle(host, retry_after)
+            if attempt >= self.max_retries:
+                self._count(status, 'dropped')
+                return response
+            self._count(status, 'retried')
+            response.close()
+            # Retry-After がある場合はレート制限側で待機させるので、ここではバックオフのみ
+            if retry_after is None:
+                time.sleep(self._backoff(attempt))
+            attempt += 1
+
+    def stats(self):
+        """
+        ステータスごとの件数を返す。
+
+        Returns:
+            dict: ステータス (int または 'timeout' / 'connection_error') -> {'ok', 'retried', 'dropped'}
+        """
+        with self._counts_lock:
+            counts = dict(self._counts)
+        result = {}
+        for (status, outcome), count in counts.items():
+            result.setdefault(status, {'ok': 0, 'retried': 0, 'dropped': 0})[outcome] = count
+        return result
+
+    def format_stats(self):
+        """stats() を表示用の文字列にする。"""
+        lines = []
+        for status, counts in sorted(self.stats().items(), key=lambda item: str(item[0])):
+            lines.append(f"  {status}: 成功 {counts['ok']}, 再試行 {counts['retried']}, 失敗 {counts['dropped']}")
+        return "\n".join(lines)
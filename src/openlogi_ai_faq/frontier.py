@@ -0,0 +1,136 @@
+# src/openlogi_ai_faq/frontier.py (重複排除・優先度付きのURLキュー)
+import hashlib
+import heapq
+import re
+from collections import deque
+from urllib.parse import urlparse
+
+
+def url_fingerprint(url):
+    """URLを8バイトのハッシュ値 (整数) に変換する。URL文字列を保持するより省メモリ。"""
+    return int.from_bytes(hashlib.blake2b(url.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+class UrlFrontier:
+    """
+    クロール対象URLのキュー (フロンティア)。
+
+    - 追加時に重複を排除する。一度追加したURLはフィンガープリント (8バイトのハッシュ値) の
+      集合で管理し、キューに同じURLが何度も入らないようにする。
+    - priority=True の場合は、FAQページらしいURLから先に取り出す。優先度は
+      URLのパスのパターン (patterns) と、リンク元ページの「FAQ的中率」から計算する。
+      FAQ的中率は、そのページからたどったリンクのうちFAQページだった割合で、
+      処理が進むにつれて更新される。
+    - priority=False の場合は従来通りの幅優先 (FIFO) になる。
+    """
+
+    def __init__(self, priority=False, patterns=(), parent_weight=1.0):
+        """
+        Args:
+            priority (bool): 優先度順に取り出すかどうか。
+            patterns (Iterable[tuple[str, float]]): (正規表現, 加点) のリスト。URLのパスに一致すると加点される。
+            parent_weight (float): リンク元ページのFAQ的中率に掛ける重み。
+        """
+        self.priority = priority
+        self.patterns = [(re.compile(pattern), weight) for pattern, weight in patterns]
+        self.parent_weight = parent_weight
+        self._seen = set()        # 追加済みURLのフィンガープリント
+        self._queue = deque()     # FIFO モード: (url, parent)
+        self._heap = []           # 優先度モード: (-priority, seq, url, parent)
+        self._seq = 0
+        self._parent_of = {}      # 取り出し済み・処理中のURL -> リンク元URL
+        self._parent_stats = {}   # リンク元URL -> [処理済みリンク数, FAQだったリンク数]
+        # 統計情報
+        self.enqueued = 0
+        self.duplicates = 0
+        self.max_size = 0
+
+    def __len__(self):
+        return len(self._heap) if self.priority else len(self._queue)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def mark_seen(self, url):
+        """キューには入れずに、追加済み (訪問済み) として登録する。"""
+        self._seen.add(url_fingerprint(url))
+
+    def path_score(self, url):
+        """URLのパスのパターンから計算した加点の合計。"""
+        path = urlparse(url).path
+        return sum(weight for pattern, weight in self.patterns if pattern.search(path))
+
+    def parent_hit_rate(self, parent):
+        """リンク元ページのFAQ的中率 (処理前は 0.5 とするラプラス平滑化)。"""
+        done, hits = self._parent_stats.get(parent, (0, 0))
+        return (hits + 1) / (done + 2)
+
+    def _score(self, url, parent):
+        return self.path_score(url) + self.parent_weight * self.parent_hit_rate(parent)
+
+    def push(self, url, parent=None):
+        """
+        URLをキューに追加する。
+
+        Returns:
+            bool: 追加した場合はTrue、追加済みのURLで重複していた場合はFalse。
+        """
+        fingerprint = url_fingerprint(url)
+        if fingerprint in self._seen:
+            self.duplicates += 1
+            return False
+        self._seen.add(fingerprint)
+        self.enqueued += 1
+        if self.priority:
+            self._seq += 1
+            heapq.heappush(self._heap, (-self._score(url, parent), self._seq, url, parent))
+        else:
+            self._queue.append((url, parent))
+        self.max_size = max(self.max_size, len(self))
+        return True
+
+    def pop(self):
+        """次に取得するURLを取り出す。キューが空の場合は IndexError。"""
+        if not self.priority:
+            url, parent = self._queue.popleft()
+        else:
+            while True:
+                neg_score, seq, url, parent = heapq.heappop(self._heap)
+                # リンク元の的中率は追加後に下がっていることがあるため、取り出し時に計算し直す
+                score = self._score(url, parent)
+                if self._heap and score < -neg_score - 1e-9 and score < -self._heap[0][0]:
+                    heapq.heappush(self._heap, (-score, seq, url, parent))
+                    continue
+                break
+        self._parent_of[url] = parent
+        return url
+
+    def record_result(self, url, is_faq):
+        """
+        取り出したURLの処理結果を記録し、リンク元ページのFAQ的中率を更新する。
+
+        Args:
+            url (str): pop() で取り出したURL。
+            is_faq (bool | None): FAQページだったかどうか。取得に失敗した場合はNone (的中率は更新しない)。
+        """
+        parent = self._parent_of.pop(url, None)
+        if parent is None or is_faq is None:
+            return
+        stats = self._parent_stats.setdefault(parent, [0, 0])
+        stats[0] += 1
+        if is_faq:
+            stats[1] += 1
+
+    def pending_urls(self):
+        """キューに残っているURLのリスト (おおよそ取り出される順)。チェックポイント保存用。"""
+        if self.priority:
+            return [entry[2] for entry in sorted(self._heap)]
+        return [url for url, _ in self._queue]
+
+    def stats(self):
+        return {
+            'queued': len(self),
+            'enqueued': self.enqueued,
+            'duplicates': self.duplicates,
+            'max_size': self.max_size,
+        }
@@ -0,0 +1,340 @@
+# src/openlogi_ai_faq/metrics.py (カウンター・ゲージ・ヒストグラムによる計測値の集計と、処理段階ごとのスパンの記録)
+import itertools
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# --- 設定 ---
+# 応答時間などのヒストグラムのバケットの上限 (秒)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Prometheus 形式で出力するときの計測値の名前の接頭辞
+METRICS_PREFIX = "openlogi_faq_"
+# 計測値のファイルを Prometheus のテキスト形式で書き出す拡張子 (それ以外は JSON)
+PROMETHEUS_EXTENSIONS = ('.prom', '.txt')
+# --- 設定ここまで ---
+
+
+class _Metric:
+    """ラベルの組み合わせごとに値を持つ計測値の基底クラス。スレッドセーフ。"""
+
+    type = None
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}  # ラベルの (名前, 値) のタプル -> 値
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(labels):
+        return tuple(sorted((name, str(value)) for name, value in labels.items())) if labels else ()
+
+    def samples(self):
+        """(ラベルの辞書, 値) のリストを返す。"""
+        with self._lock:
+            items = list(self._values.items())
+        return [(dict(key), self._export(value)) for key, value in items]
+
+    def _export(self, value):
+        return value
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(_Metric):
+    """増えるだけの値 (取得したページ数・エラー数など)。"""
+
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    """増減する現在値 (キューの長さなど)。"""
+
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Histogram(_Metric):
+    """値の分布 (応答時間など)。バケットごとの件数と合計を持つ。"""
+
+    type = 'histogram'
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [バケットごとの件数 (最後は上限なし), 件数, 合計]
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0, 0.0]
+            state[0][index] += 1
+            state[1] += 1
+            state[2] += value
+
+    def _export(self, state):
+        counts, count, total = state
+        cumulative = list(itertools.accumulate(counts))
+        return {
+            'count': count,
+            'sum': total,
+            'buckets': dict(zip([str(bound) for bound in self.buckets] + ['+Inf'], cumulative)),
+        }
+
+
+class MetricsRegistry:
+    """名前ごとの計測値の一覧。同じ名前で取得すると同じオブジェクトを返す。"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self.started = time.time()
+
+    def _get(self, cls, name, help_text, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"計測値 {name} は {metric.type} として登録済みです。")
+            return metric
+
+    def counter(self, name, help_text):
+        return self._get(Counter, name, help_text)
+
+    def gauge(self, name, help_text):
+        return self._get(Gauge, name, help_text)
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        return self._get(Histogram, name, help_text, buckets=buckets)
+
+    def metrics(self):
+        with self._lock:
+            return sorted(self._metrics.values(), key=lambda metric: metric.name)
+
+    def reset(self):
+        """すべての計測値を0に戻す (登録は残す)。"""
+        for metric in self.metrics():
+            metric.reset()
+        self.started = time.time()
+
+    def snapshot(self):
+        """
+        現在の計測値を JSON に変換できる辞書で返す。
+
+        Returns:
+            dict: {'timestamp', 'uptime_seconds', 'metrics': {名前: {'type', 'help', 'samples': [{'labels', 'value'}]}}}
+        """
+        now = time.time()
+        return {
+            'timestamp': now,
+            'uptime_seconds': now - self.started,
+            'metrics': {
+                metric.name: {
+                    'type': metric.type,
+                    'help': metric.help,
+                    'samples': [{'labels': labels, 'value': value} for labels, value in metric.samples()],
+                }
+                for metric in self.metrics()
+            },
+        }
+
+    def render_prometheus(self):
+        """現在の計測値を Prometheus のテキスト形式 (version 0.0.4) で返す。"""
+        lines = []
+        for metric in self.metrics():
+            name = METRICS_PREFIX + metric.name
+            lines.append(f"# HELP {name} {_escape_help(metric.help)}")
+            lines.append(f"# TYPE {name} {metric.type}")
+            for labels, value in metric.samples():
+                if metric.type != 'histogram':
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                    continue
+                for bound, count in value['buckets'].items():
+                    lines.append(f"{name}_bucket{_format_labels(dict(labels, le=bound))} {count}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(value['sum'])}")
+                lines.append(f"{name}_count{_format_labels(labels)} {value['count']}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape_help(text):
+    return text.replace('\\', '\\\\').replace('\n', '\\n')
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label(value)}"' for name, value in sorted(labels.items())) + "}"
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+# プロセス全体で共有する計測値の一覧
+REGISTRY = MetricsRegistry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+
+STAGE_SECONDS = histogram('stage_seconds', "処理段階ごとの所要時間 (秒)")
+
+
+class _Tracer:
+    """スパンを JSONL 形式でファイルに追記する。"""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._file = open(filename, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._local = threading.local()
+
+    def next_id(self):
+        return next(self._ids)
+
+    def stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(line)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+_metrics_file = None
+_tracer = None
+
+
+def configure(metrics_file=None, trace_file=None):
+    """
+    計測値の出力先を設定する。
+
+    Args:
+        metrics_file (str | None): flush() で計測値を書き出すファイル。拡張子が PROMETHEUS_EXTENSIONS の場合は
+                                   Prometheus のテキスト形式、それ以外は JSON。
+        trace_file (str | None): スパンを1行1件の JSON で追記するファイル。Noneの場合はスパンを記録しない
+                                 (所要時間は STAGE_SECONDS に集計する)。
+
+    Raises:
+        IOError, OSError: trace_file を開けなかった場合。
+    """
+    global _metrics_file, _tracer
+    _metrics_file = metrics_file
+    if _tracer is not None:
+        _tracer.close()
+        _tracer = None
+    if trace_file:
+        _tracer = _Tracer(trace_file)
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    処理段階の所要時間を計測するコンテキストマネージャー。
+    所要時間は STAGE_SECONDS (stage=name) に集計し、トレースが有効な場合は開始時刻・所要時間・
+    親のスパン (同じスレッドで外側にあるスパン) とともにトレースファイルへ書き出す。
+    """
+    tracer = _tracer
+    if tracer is None:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            STAGE_SECONDS.observe(time.perf_counter() - start, stage=name)
+        return
+
+    stack = tracer.stack()
+    span_id = tracer.next_id()
+    parent_id = stack[-1] if stack else None
+    stack.append(span_id)
+    started_at = time.time()
+    start = time.perf_counter()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        stack.pop()
+        STAGE_SECONDS.observe(duration, stage=name)
+        record = {'name': name, 'id': span_id, 'parent_id': parent_id, 'start': started_at,
+                  'duration': duration, 'thread': threading.current_thread().name}
+        if attributes:
+            record['attributes'] = attributes
+        if error is not None:
+            record['error'] = error
+        try:
+            tracer.write(record)
+        except (ValueError, OSError):
+            # トレースファイルが閉じられた後など。計測のために処理を止めない
+            pass
+
+
+def format_metrics(filename=None):
+    """filename の拡張子に応じて、計測値を Prometheus のテキスト形式または JSON の文字列にする。"""
+    if filename and os.path.splitext(filename)[1].lower() in PROMETHEUS_EXTENSIONS:
+        return REGISTRY.render_prometheus()
+    return json.dumps(REGISTRY.snapshot(), ensure_ascii=False, indent=2)
+
+
+def flush():
+    """
+    configure() で設定したファイルに現在の計測値を書き出す (設定されていなければ何もしない)。
+    一時ファイルに書いてから置き換えるので、読み取る側が書きかけの内容を見ることはない。
+
+    Returns:
+        bool: 書き出しに失敗した場合はFalse。
+    """
+    filename = _metrics_file
+    if not filename:
+        return True
+    temp_filename = f"{filename}.tmp{os.getpid()}"
+    try:
+        with open(temp_filename, 'w', encoding='utf-8') as f:
+            f.write(format_metrics(filename))
+        os.replace(temp_filename, filename)
+        return True
+    except (IOError, OSError) as e:
+        print(f"警告: 計測値の書き出しに失敗しました - {filename}\n{e}")
+        return False
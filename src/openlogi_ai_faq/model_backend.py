@@ -0,0 +1,315 @@
+# src/openlogi_ai_faq/model_backend.py (Q&Aアプリから呼び出すモデルの差し替え可能な実装)
+import os
+import re
+import threading
+import time
+
+from . import metrics
+from .retrieval import tokenize
+
+# APIの安全設定 (不適切なコンテンツのブロック閾値)
+SAFETY_SETTINGS = [
+    {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+    {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+    {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+    {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+]
+# 回答の生成に関する設定 (temperatureを低くして、より決定的な回答を促す)
+TEMPERATURE = 0.2
+
+# 選択できるバックエンド
+#   'gemini': Google Gemini API
+#   'fake':   APIを呼び出さずに、プロンプト中のFAQから質問に近いものを選んで回答するローカルの偽モデル (動作確認・負荷試験用)
+MODEL_BACKENDS = ('gemini', 'fake')
+
+# レート制限の超過を示す例外のクラス名 (google.api_core.exceptions の ResourceExhausted / TooManyRequests)。
+# SDK を必要になるまで読み込まないよう、クラスそのものではなく名前で判定する
+_RATE_LIMIT_ERROR_NAMES = frozenset(["ResourceExhausted", "TooManyRequests"])
+# レート制限の超過を示すHTTPステータスコード
+_RATE_LIMIT_STATUS = 429
+
+MODEL_CALLS = metrics.counter('model_calls_total', "モデルの呼び出し回数 (outcome: ok / error / rate_limited)")
+MODEL_CALL_SECONDS = metrics.histogram('model_call_seconds', "モデルの呼び出しの応答時間 (秒, 応答の受信完了まで)")
+MODEL_FIRST_TOKEN_SECONDS = metrics.histogram('model_first_token_seconds',
+                                              "ストリーミングで最初のテキストを受信するまでの時間 (秒)")
+PROMPT_TOKENS = metrics.counter('model_prompt_tokens_total', "モデルが報告したプロンプトのトークン数の合計")
+RESPONSE_TOKENS = metrics.counter('model_response_tokens_total', "モデルが報告した応答のトークン数の合計")
+
+
+def _status_code(error):
+    """例外が持つHTTPステータスコード (GoogleAPICallError.code / response.status_code)。ない場合はNone。"""
+    for code in (getattr(error, 'code', None), getattr(getattr(error, 'response', None), 'status_code', None)):
+        if isinstance(code, int):  # grpc の code() メソッドなどは対象外
+            return int(code)
+    return None
+
+
+def is_rate_limit_error(error):
+    """
+    モデルの呼び出しで発生した例外がレート制限の超過によるものかどうかを返す。
+    例外の型 (ResourceExhausted / TooManyRequests とそのサブクラス) かステータスコード 429 で判定する
+    (メッセージの文字列では判定しない。リクエストIDやトークン数に "429" が含まれることがあるため)。
+    """
+    if any(cls.__name__ in _RATE_LIMIT_ERROR_NAMES for cls in type(error).__mro__):
+        return True
+    return _status_code(error) == _RATE_LIMIT_STATUS
+
+
+class ModelResponse:
+    """モデルの応答テキストと、報告されたトークン数・応答時間。"""
+
+    def __init__(self, text, prompt_tokens=0, response_tokens=0):
+        self.text = text
+        self.prompt_tokens = prompt_tokens
+        self.response_tokens = response_tokens
+        self.latency = None              # 送信から応答の受信完了までの秒数
+        self.first_token_latency = None  # 送信から最初のテキストを受信するまでの秒数 (ストリーミング時)
+
+
+def _timed(call, on_chunk, backend_name):
+    """
+    call(stream) を呼び出して ModelResponse を返し、応答時間を記録する。
+    on_chunk が指定された場合はストリーミングで受信し、テキストの断片を受信するたびに on_chunk(text) を呼び出す。
+    応答時間・トークン数・失敗 (レート制限の超過を含む) は、backend_name をラベルにして計測値に集計する。
+    """
+    start = time.monotonic()
+    first = []
+
+    def chunk_received(text):
+        if not first:
+            first.append(time.monotonic() - start)
+        on_chunk(text)
+
+    try:
+        with metrics.span('model.call', backend=backend_name, stream=on_chunk is not None):
+            response = call(chunk_received if on_chunk is not None else None)
+    except Exception as e:
+        MODEL_CALLS.inc(backend=backend_name, outcome='rate_limited' if is_rate_limit_error(e) else 'error')
+        raise
+    response.latency = time.monotonic() - start
+    response.first_token_latency = first[0] if first else response.latency
+    MODEL_CALLS.inc(backend=backend_name, outcome='ok')
+    MODEL_CALL_SECONDS.observe(response.latency, backend=backend_name)
+    if on_chunk is not None:
+        MODEL_FIRST_TOKEN_SECONDS.observe(response.first_token_latency, backend=backend_name)
+    PROMPT_TOKENS.inc(response.prompt_tokens, backend=backend_name)
+    RESPONSE_TOKENS.inc(response.response_tokens, backend=backend_name)
+    return response
+
+
+def _usage(response):
+    """Gemini の応答メタデータからトークン数を取り出す。取得できない場合は (None, None)。"""
+    if not hasattr(response, 'usage_metadata'):
+        return None, None
+    return (getattr(response.usage_metadata, 'prompt_token_count', 0),
+            getattr(response.usage_metadata, 'candidates_token_count', 0))
+
+
+class GeminiChat:
+    """GeminiBackend.start_chat() が返す ChatSession のラッパー。"""
+
+    def __init__(self, backend, chat):
+        self._backend = backend
+        self._chat = chat
+
+    def send(self, prompt, on_chunk=None):
+        def call(chunk_received):
+            response = self._chat.send_message(prompt, generation_config=self._backend.generation_config,
+                                               safety_settings=SAFETY_SETTINGS, stream=chunk_received is not None)
+            return self._backend.to_model_response(response, chunk_received)
+        return _timed(call, on_chunk, 'gemini')
+
+    def add_turn(self, question, answer):
+        """モデルに問い合わせずに得た回答 (キャッシュなど) を、1往復として会話履歴に加える。"""
+        self._chat.history = [*self._chat.history,
+                              {'role': 'user', 'parts': [question]}, {'role': 'model', 'parts': [answer]}]
+
+
+class GeminiBackend:
+    """
+    Google Gemini API を使うバックエンド。
+    SDK (google.generativeai) の読み込みには時間がかかるため、最初にモデルを使うときまで遅らせる。
+    """
+
+    def __init__(self, model_name, api_key):
+        self.model_name = model_name
+        self._api_key = api_key
+        self._model = None
+        self._generation_config = None
+        self._init_lock = threading.Lock()
+
+    def _initialize(self):
+        """
+        SDKを読み込んでモデルを初期化する (初回のみ)。
+
+        Raises:
+            Exception: SDKの設定やモデルの初期化に失敗した場合 (SDKの例外をそのまま送出する)。
+        """
+        with self._init_lock:
+            if self._model is None:
+                with metrics.span('model.sdk_init', backend='gemini'):
+                    import google.generativeai as genai
+                    genai.configure(api_key=self._api_key)
+                    self._generation_config = genai.types.GenerationConfig(temperature=TEMPERATURE)
+                    self._model = genai.GenerativeModel(self.model_name)
+
+    @property
+    def model(self):
+        if self._model is None:
+            self._initialize()
+        return self._model
+
+    @property
+    def generation_config(self):
+        if self._generation_config is None:
+            self._initialize()
+        return self._generation_config
+
+    def to_model_response(self, response, on_chunk=None):
+        """
+        SDKの応答を ModelResponse に変換する。
+        on_chunk が指定された場合は、ストリーミング応答を最後まで受信しながら断片ごとに呼び出す
+        (トークン数は受信が完了した後の応答メタデータから取得する)。
+        """
+        if on_chunk is not None:
+            for chunk in response:
+                try:
+                    text = chunk.text
+                except ValueError:
+                    # テキストを含まない断片 (終了理由のみなど)
+                    continue
+                if text:
+                    on_chunk(text)
+        prompt_tokens, response_tokens = _usage(response)
+        if prompt_tokens is None:
+            print("警告: 今回のAPI呼び出しのトークン数を取得できませんでした。")
+            prompt_tokens, response_tokens = 0, 0
+        return ModelResponse(response.text, prompt_tokens, response_tokens)
+
+    def generate(self, prompt, on_chunk=None):
+        """
+        会話履歴を持たない1回のリクエストとしてプロンプトを送信する。
+        on_chunk を指定するとストリーミングで受信し、テキストの断片ごとに on_chunk(text) を呼び出す。
+        """
+        def call(chunk_received):
+            response = self.model.generate_content(prompt, generation_config=self.generation_config,
+                                                   safety_settings=SAFETY_SETTINGS, stream=chunk_received is not None)
+            return self.to_model_response(response, chunk_received)
+        return _timed(call, on_chunk, 'gemini')
+
+    def count_tokens(self, text):
+        """モデルのトークナイザーでテキストのトークン数を数える (API呼び出しが発生する)。"""
+        return self.model.count_tokens(text).total_tokens
+
+    def start_chat(self):
+        """会話履歴をSDKが管理する ChatSession を開始する。"""
+        return GeminiChat(self, self.model.start_chat(history=[]))
+
+
+# 偽モデルが回答の根拠として使うFAQ (プロンプト中の「質問: ... 回答: ... 参照URL: ...」)
+_FAKE_FAQ_RE = re.compile(r'^質問: ([^\n]*)\n回答: (.*?)\n参照URL: (\S+)$', re.MULTILINE | re.DOTALL)
+# プロンプト中のユーザーの質問の見出し (ない場合はプロンプトの最後の行を質問とみなす)
+QUESTION_LABEL = "ユーザーの質問: "
+# 偽モデルがストリーミング時に1回に返す文字数
+FAKE_CHUNK_CHARS = 8
+
+
+def estimate_tokens(text):
+    """偽モデル用の簡易的なトークン数 (日本語はおおむね1文字1トークン程度なので文字数とする)。"""
+    return len(text)
+
+
+class FakeChat:
+    """FakeBackend.start_chat() が返す、ChatSession と同じく履歴を毎回送信する偽のチャット。"""
+
+    def __init__(self, backend):
+        self._backend = backend
+        self._history = []
+
+    def send(self, prompt, on_chunk=None):
+        self._history.append(prompt)
+        response = self._backend.generate("\n".join(self._history), on_chunk)
+        self._history.append(response.text)
+        return response
+
+    def add_turn(self, question, answer):
+        self._history.extend((question, answer))
+
+
+class FakeBackend:
+    """
+    APIを呼び出さないローカルの偽モデル。
+    プロンプトに含まれるFAQのうち、ユーザーの質問と共通する文字 n-gram が最も多いFAQの回答を
+    「参照FAQ: URL」付きで返す。共通する語がなければ「関連する情報が見つかりませんでした。」と返す。
+    トークン数は estimate_tokens() で見積もる。
+    """
+
+    model_name = 'fake'
+
+    def __init__(self, latency=0.0, chunk_chars=FAKE_CHUNK_CHARS):
+        """
+        Args:
+            latency (float): 応答全体にかかる秒数 (ストリーミング時は断片ごとに等分して待つ)。負荷試験などで使う。
+            chunk_chars (int): ストリーミング時の1断片の文字数。
+        """
+        self.latency = latency
+        self.chunk_chars = max(1, chunk_chars)
+
+    def generate(self, prompt, on_chunk=None):
+        return _timed(lambda chunk_received: self._answer(prompt, chunk_received), on_chunk, 'fake')
+
+    def _answer(self, prompt, on_chunk):
+        position = prompt.rfind(QUESTION_LABEL)
+        if position >= 0:
+            question = prompt[position + len(QUESTION_LABEL):]
+        else:
+            question = prompt.rstrip().rsplit("\n", 1)[-1]
+        question_tokens = set(tokenize(question))
+
+        best, best_overlap = None, 0
+        for match in _FAKE_FAQ_RE.finditer(prompt):
+            overlap = len(question_tokens & set(tokenize(match.group(1))))
+            if overlap > best_overlap:
+                best, best_overlap = match, overlap
+        if best is not None:
+            text = f"{best.group(2).strip()}\n\n参照FAQ: {best.group(3)}"
+        else:
+            text = "関連する情報が見つかりませんでした。"
+
+        if on_chunk is None:
+            if self.latency:
+                time.sleep(self.latency)
+        else:
+            chunks = [text[i:i + self.chunk_chars] for i in range(0, len(text), self.chunk_chars)]
+            for chunk in chunks:
+                if self.latency:
+                    time.sleep(self.latency / len(chunks))
+                on_chunk(chunk)
+        return ModelResponse(text, estimate_tokens(prompt), estimate_tokens(text))
+
+    def count_tokens(self, text):
+        return estimate_tokens(text)
+
+    def start_chat(self):
+        return FakeChat(self)
+
+
+def create_backend(name, model_name, fake_latency=0.0):
+    """
+    名前を指定してバックエンドを作成する (サーバー・一括処理用)。
+    'gemini' の場合は .env または環境変数 GEMINI_API_KEY からAPIキーを読み込む。
+
+    Raises:
+        ValueError: 不明なバックエンド名の場合や、APIキーが設定されていない場合。
+            (Gemini モデルの初期化は最初の呼び出し時に行うため、その失敗は呼び出し時の例外になる)
+    """
+    if name == 'fake':
+        return FakeBackend(latency=fake_latency)
+    if name != 'gemini':
+        raise ValueError(f"不明なバックエンドです: {name}")
+    from dotenv import load_dotenv
+    load_dotenv()
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        raise ValueError("環境変数 'GEMINI_API_KEY' が設定されていません。")
+    return GeminiBackend(model_name, api_key)
@@ -1,15 +1,29 @@
 # src/openlogi_ai_faq/qa_app.py (トークン数表示修正・コメント調整版)
-import google.generativeai as genai
+import time
+
+# 起動時間の計測の起点 (モジュールの読み込みにかかる時間も含める)
+_STARTED = time.perf_counter()
+
+import argparse
+import hashlib
 import json
 import os
-from dotenv import load_dotenv
+import re
 import sys
 
-# クローラーモジュールをインポート (同じパッケージ内の crawler.py)
-from . import crawler
+# クローラー (crawler.py)・重複除去 (dedup.py)・ベクトル検索 (vector_search.py)・Gemini の SDK は読み込みに時間がかかるため、
+# 起動を速くするよう、必要になったときに読み込む
+from .faq_io import DEFAULT_FAQ_FILENAME, file_hash, iter_faq_records, page_cache_filename
+from . import context_packing
+from . import metrics
+from . import retrieval
+from .answer_cache import AnswerCache, cache_filename
+from .conversation import HISTORY_TURNS, BoundedHistory
+from .corpus import load_corpora, select_corpus
+from .model_backend import MODEL_BACKENDS, QUESTION_LABEL, FakeBackend, GeminiBackend, is_rate_limit_error
 
 # --- 設定 ---
-FAQ_DATA_FILE = crawler.DEFAULT_OUTPUT_FILENAME # クローラーのデフォルト出力ファイル名を参照
+FAQ_DATA_FILE = DEFAULT_FAQ_FILENAME # クローラーのデフォルト出力ファイル名と同じ
 
 # 使用するGeminiモデルを選択 (コメントアウトで切り替え)
 # 注記: モデルによって性能、料金、利用制限が異なります。
@@ -19,27 +33,85 @@ FAQ_DATA_FILE = crawler.DEFAULT_OUTPUT_FILENAME # クローラーのデフォル
 MODEL_NAME = "gemini-2.5-pro-exp-03-25"      # 実験版・無料・レート制限低 (デフォルト)
 # MODEL_NAME = "gemini-2.5-pro-preview-03-25" # プレビュー版・有料・高性能
 
+# FAQ情報の渡し方
+#   'full':      全FAQを最初にChatSessionへ投入する (従来の動作)
+#   'retrieval': 質問ごとに検索インデックスで関連するFAQだけを選び、小さなプロンプトで問い合わせる
+CONTEXT_MODES = ('full', 'retrieval')
+CONTEXT_MODE = 'full'
+# 'retrieval' モードで1回の質問に含めるFAQの件数
+RETRIEVAL_TOP_K = retrieval.TOP_K
+# 'retrieval' モードの検索方法
+#   'bm25':   文字 n-gram の転置インデックス (retrieval.py)
+#   'vector': 文字 n-gram の TF-IDF ベクトル行列をメモリマップして類似度を計算 (vector_search.py)
+RETRIEVAL_ENGINES = ('bm25', 'vector')
+RETRIEVAL_ENGINE = 'bm25'
+# 'full' モードでの会話の続け方
+#   'chat':      ChatSession を使う (SDKが会話履歴をすべて毎回送信するため、質問のたびにプロンプトが大きくなる)
+#   'stateless': 質問ごとに、固定の指示 (FAQ情報を含む) + 直近 HISTORY_TURNS 往復の履歴 + 質問 を送信する
+SESSION_MODES = ('chat', 'stateless')
+SESSION_MODE = 'chat'
+# 使用するモデルのバックエンド ('gemini' または APIを呼び出さない 'fake')
+MODEL_BACKEND = 'gemini'
+# 同じ質問への回答をキャッシュから返すかどうか (FAQデータファイルが変わると自動的に無効になる)
+ANSWER_CACHE_ENABLED = True
+# 回答を生成されたそばから表示するかどうか (ストリーミング)
+STREAM_OUTPUT = False
+# 読み込み時に重複に近いFAQ (同じ回答が複数のURLにあるものなど) を1件にまとめるかどうか (dedup.py)。
+# まとめるのは回答が (正規化後に) 同じFAQだけなので、料金や日付だけが異なるFAQは残る (dedup.SAME_ANSWER_ONLY)
+DEDUP_ON_LOAD = True
+# FAQデータから作ったアーティファクト (artifact.py) を使うかどうか。FAQデータファイルと内容が一致する場合は、
+# 重複除去・コンテキストの整形・検索インデックスの作成を省略してアーティファクトから読み込み、ない場合は作成して保存する
+USE_ARTIFACT = True
+# 長いFAQの回答をパッセージ (chunking.py) に分割し、関連するパッセージだけをプロンプトに含めるかどうか
+# ('retrieval' モードは質問ごとに、'full' モードはコンテキストの予算と優先度に合わせて選ぶ)
+PASSAGE_CHUNKING = False
+
+# モデルへの指示 (ロール、タスク、出力形式、制約などを定義)。両モードで共通
+ANSWER_RULES = """あなたはユーザーの質問に対して、提供された以下のFAQ情報のみを根拠として回答するFAQアシスタントです。
+
+回答生成のルール:
+1.  ユーザーの質問に最も合致するFAQ情報を以下のリストから探し、その**回答内容を要約または引用して**回答を作成してください。
+2.  回答の生成に**直接利用したFAQ情報が特定できる場合のみ**、そのFAQの参照URLを回答の最後に「参照FAQ: [URL]」という形式で**1つだけ**記載してください。
+3.  複数のFAQが関連しそうな場合でも、**最も回答の主要な根拠となったFAQのURLのみ**を記載してください。判断が難しい場合や、確信が持てない場合はURLを記載しないでください。
+4.  FAQ情報の中に該当する答えが見つからない場合は、「関連する情報が見つかりませんでした。」とだけ回答し、URLは記載しないでください。
+5.  絶対に推測で回答したり、FAQ情報にない知識で補完したりしないでください。参照URLも、リストにあるもの以外を生成しないでください。
+"""
+NO_ANSWER_MESSAGE = "関連する情報が見つかりませんでした。"
+# 回答の末尾の「参照FAQ: [URL]」(角括弧はあってもなくてもよい)
+REFERENCE_URL_RE = re.compile(r'参照FAQ\s*[:：]\s*\[?\s*(https?://[^\s\]]+)')
+
 # --- 設定ここまで ---
 
+QUESTIONS = metrics.counter('qa_questions_total',
+                            "Q&Aアプリで受け付けた質問の数 (outcome: answered / cached / no_match / error / rate_limited)")
+STARTUP_SECONDS = metrics.gauge('qa_startup_seconds',
+                                "Q&Aアプリの起動 (モジュールの読み込みからFAQ情報の準備の完了まで。"
+                                "入力待ち・クロール・初期コンテキストの送信を除く) にかかった時間 (秒)")
+
 # --- load_faq_data 関数 ---
-def load_faq_data(filename):
+def load_faq_data(filename, dedup=DEDUP_ON_LOAD):
     """
-    指定されたJSONファイルからFAQデータ（質問と回答のペアのリスト）を読み込む。
+    指定されたファイルからFAQデータ（質問と回答のペアのリスト）を読み込む。
+    JSONL 形式 (1行1レコード) と従来の JSON 配列形式のどちらにも対応する。
+    JSONL 形式はジェネレーターで1行ずつ読み込むため、ファイル全体の文字列を保持しない。
 
     Args:
-        filename (str): 読み込むJSONファイル名。
+        filename (str): 読み込むファイル名。
+        dedup (bool): Trueの場合、重複に近いFAQを最初のレコードにまとめる (他のURLは 'alternate_urls' に残す)。
 
     Returns:
         list or None: 読み込んだFAQデータのリスト。エラー時はNone。
     """
     try:
-        with open(filename, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        # データ形式がリストであるか基本的なチェック
-        if not isinstance(data, list):
-             print(f"エラー: {filename} のデータ形式がリストではありません。")
-             return None
+        with metrics.span('qa.load_faq_data'):
+            data = list(iter_faq_records(filename))
         print(f"{filename} から {len(data)} 件のFAQデータを読み込みました。")
+        if dedup:
+            from .dedup import load_deduplicated
+            with metrics.span('qa.dedup'):
+                data, dedup_report = load_deduplicated(filename, data)
+            if dedup_report.removed:
+                print(dedup_report.format())
         return data
     except FileNotFoundError:
         # ファイルが見つからない場合はNoneを返し、呼び出し元で処理する
@@ -47,19 +119,64 @@ def load_faq_data(filename):
     except json.JSONDecodeError:
         print(f"エラー: FAQデータファイル ({filename}) の形式が正しくありません。")
         return None
+    except ValueError as e:
+        # データ形式がリストではない場合など
+        print(f"エラー: {e}")
+        return None
     except Exception as e:
         print(f"エラー: FAQデータファイルの読み込み中にエラーが発生しました。\n{e}")
         return None
 
+def answer_rules(prompt_prefix=""):
+    """モデルへの指示 (ANSWER_RULES) の前に、コーパスごとのプロンプトの前置き (製品名の説明など) を付ける。"""
+    if not prompt_prefix:
+        return ANSWER_RULES
+    return prompt_prefix.rstrip("\n") + "\n\n" + ANSWER_RULES
+
+def answer_cache_model_key(model_name, mode, engine, prompt_prefix="", passages=False):
+    """
+    回答キャッシュのキーに使うモデル名 (モデル・モード・検索方法・パッセージ単位かどうか)。
+    プロンプトの前置きを指定したコーパスでは、前置きが変わると回答も変わるため、そのハッシュを加える。
+    """
+    key = f"{model_name}/{mode}" + (f"/{engine}" if mode == 'retrieval' else "") + ("/passages" if passages else "")
+    if prompt_prefix:
+        key += "/" + hashlib.sha256(prompt_prefix.encode('utf-8')).hexdigest()[:12]
+    return key
+
+def history_cache_key(model_key, history_text):
+    """
+    会話の途中の質問に使う回答キャッシュのキー (モデル名の部分)。
+    「詳しく」のような質問は前の会話によって答えが変わるため、プロンプトに含める会話履歴のハッシュを加える。
+    履歴がない場合は model_key のまま (会話の最初の質問どうしでキャッシュを共有する)。
+    """
+    if not history_text:
+        return model_key
+    return model_key + "/history:" + hashlib.sha256(history_text.encode('utf-8')).hexdigest()[:16]
+
+def format_faq_entry(faq):
+    """FAQレコード1件をプロンプト用のテキストに整形する。"""
+    return f"質問: {faq['question']}\n回答: {faq['answer']}\n参照URL: {faq['url']}\n---\n"
+
 # --- format_faq_context (参照URL出力指示付き) ---
-def format_faq_context(faq_data):
+def format_faq_context(faq_data, budget=None, estimator=None, priorities=None, prompt_prefix="", parents=None):
     """
     FAQデータのリストをChatSessionの初期コンテキストとして整形する。
     モデルに参照URLの出力をより厳密に指示するプロンプトを含む。
-    トークン制限（文字数ベース）を超えた場合はデータを切り詰める。
+    FAQごとのトークン数を見積もり、トークン数の予算に収まるだけのFAQを優先度の高い順に含める。
+    予算に収まらないFAQは飛ばし、残りの予算はより小さいFAQで埋める。使用したトークン数の内訳を表示する。
 
     Args:
-        faq_data (list): FAQデータのリスト。各要素は辞書形式で'question', 'answer', 'url'キーを持つ想定。
+        faq_data (Iterable[dict]): FAQデータのリスト (または iter_faq_records などのイテレーター)。
+                                   各要素は辞書形式で'question', 'answer', 'url'キーを持つ想定。
+        budget (int | None): FAQ情報に使えるトークン数。Noneの場合は MODEL_NAME のコンテキストの上限から計算する。
+        estimator (context_packing.TokenEstimator | None): トークン数の見積もり。Noneの場合は実測値を使わない
+                                                           大きめの簡易見積もり。
+        priorities (list[float] | None): faq_data と同じ順番の優先度 (context_packing.record_priorities の結果)。
+                                         Noneの場合は faq_data の順番のまま含める。
+        prompt_prefix (str): 回答ルールの前に置くコーパスごとの前置き (answer_rules を参照)。
+        parents (list[dict] | None): faq_data がパッセージ (chunking.chunk_records の結果) の場合の元のFAQデータ。
+                                     選んだパッセージを親のFAQごとにまとめて含め、回答全体を含めた場合と比べた
+                                     トークン数を表示する。
 
     Returns:
         tuple[str | None, bool]: 整形されたコンテキスト文字列と、データが切り詰められたかのフラグ。
@@ -68,80 +185,323 @@ def format_faq_context(faq_data):
     注記: 参照FAQリンクの出力精度はモデルによって異なります。
          Gemini 2.5 Pro 系モデルで比較的良好な結果が得られる傾向があります。
     """
-    # モデルへの指示 (ロール、タスク、出力形式、制約などを定義)
-    context_header = """あなたはユーザーの質問に対して、提供された以下のFAQ情報のみを根拠として回答するFAQアシスタントです。
-
-回答生成のルール:
-1.  ユーザーの質問に最も合致するFAQ情報を以下のリストから探し、その**回答内容を要約または引用して**回答を作成してください。
-2.  回答の生成に**直接利用したFAQ情報が特定できる場合のみ**、そのFAQの参照URLを回答の最後に「参照FAQ: [URL]」という形式で**1つだけ**記載してください。
-3.  複数のFAQが関連しそうな場合でも、**最も回答の主要な根拠となったFAQのURLのみ**を記載してください。判断が難しい場合や、確信が持てない場合はURLを記載しないでください。
-4.  FAQ情報の中に該当する答えが見つからない場合は、「関連する情報が見つかりませんでした。」とだけ回答し、URLは記載しないでください。
-5.  絶対に推測で回答したり、FAQ情報にない知識で補完したりしないでください。参照URLも、リストにあるもの以外を生成しないでください。
-
---- FAQ情報 ---
-"""
+    context_header = answer_rules(prompt_prefix) + "\n--- FAQ情報 ---\n"
     context_footer = "--- FAQ情報ここまで ---\n\n上記ルールを理解し、記憶しました。ユーザーからの質問を待っています。"
 
-    # トークン制限を文字数で簡易的に計算 (実際のトークン数とは異なる)
-    # モデルごとの上限を考慮し、余裕を持たせる
-    max_chars = 950000 # (例: 1Mトークンモデル向け) 必要に応じて調整
-    approx_char_count = len(context_header) + len(context_footer)
+    if budget is None:
+        budget = context_packing.context_budget(MODEL_NAME)
+    if estimator is None:
+        estimator = context_packing.TokenEstimator(MODEL_NAME)
 
-    faq_texts = []      # コンテキストに含めるFAQテキストを格納するリスト
-    content_added = False # 有効なFAQが1つでも追加されたか
-    limited = False     # コンテキスト長制限によりデータが切り詰められたか
+    faq_texts = []      # 質問・回答・URLが揃っているFAQのテキスト
+    entries = []        # faq_texts と同じ順番のFAQ (パッセージ)
+    entry_priorities = [] if priorities is not None else None
+    has_data = False    # 入力にFAQデータが1件でもあったか (イテレーターでも判定できるように)
 
     # FAQデータをループしてテキスト形式に変換し、リストに追加
-    for faq in faq_data:
+    for i, faq in enumerate(faq_data):
+        has_data = True
         q = faq.get('question', '')
         a = faq.get('answer', '')
         url = faq.get('url', '')
 
         # 質問、回答、URLが揃っているデータのみを使用
         if q and a and url:
-            faq_entry = f"質問: {q}\n回答: {a}\n参照URL: {url}\n---\n"
-            entry_len = len(faq_entry)
-            # 文字数制限チェック
-            if approx_char_count + entry_len < max_chars:
-                faq_texts.append(faq_entry)
-                approx_char_count += entry_len
-                content_added = True
-            else:
-                # 制限に達したらループを中断し、フラグを立てる
-                print(f"[注意] FAQデータが大きいため、{len(faq_texts)}件でコンテキストへの追加を打ち切りました。")
-                limited = True
-                break
+            faq_texts.append(format_faq_entry(faq))
+            entries.append(faq)
+            if entry_priorities is not None:
+                entry_priorities.append(priorities[i])
+
+    # 優先度の高い順に、予算に収まるFAQを選ぶ
+    fixed_tokens = estimator.estimate(context_header) + estimator.estimate(context_footer)
+    with metrics.span('qa.pack_context'):
+        selected, report = context_packing.pack_records(faq_texts, budget, fixed_tokens, estimator, entry_priorities)
 
     # 有効なFAQが一つもなかった場合
-    if not content_added and faq_data:
+    if not selected and has_data:
         print("警告: コンテキストに追加できる有効なFAQがありませんでした。")
         return None, False # コンテキスト生成失敗
 
+    print(report.format())
+    if report.limited:
+        print(f"[注意] FAQデータが大きいため、トークン数の上限に収まる {report.included}件 "
+              f"(全 {report.candidates}件) をコンテキストに追加しました。")
+
+    if parents is not None:
+        # 選んだパッセージを親のFAQごとにまとめる (含めなかった部分は省略の印にする)
+        from . import chunking
+        merged = chunking.merge_passages(parents, [entries[i] for i in selected])
+        print(f"パッセージ {len(selected)} 件 (FAQ {len(merged)} 件) をコンテキストに追加しました。")
+        print(chunking.format_savings(*chunking.answer_tokens(parents, merged)))
+        faq_body = "".join(format_faq_entry(faq) for faq in merged)
+    else:
+        faq_body = "".join(faq_texts[i] for i in selected)
+
     # ヘッダー、FAQテキスト、フッターを結合して最終的なコンテキスト文字列を作成
-    full_context = context_header + "".join(faq_texts) + context_footer
-    return full_context, limited
+    full_context = context_header + faq_body + context_footer
+    return full_context, report.limited
+
+# --- calibrate_token_counts ---
+def calibrate_token_counts(estimator, faq_data, counter, samples=None):
+    """
+    estimator にまだ十分な実測値がない場合に、FAQ samples 件のトークン数を counter で実測してキャッシュする。
+    実測できなかった場合は警告を表示する (トークン数は context_packing.UNCALIBRATED_SCALE で大きめに見積もられる)。
+
+    Args:
+        estimator (context_packing.TokenEstimator): FAQデータファイルに対応するトークン数の見積もり。
+        faq_data (Iterable[dict]): FAQデータ。
+        counter (callable): テキストのトークン数を返す関数 (バックエンドの count_tokens)。
+        samples (int | None): 実測する件数。Noneの場合は context_packing.AUTO_CALIBRATE_SAMPLES。
+
+    Returns:
+        bool: 補正係数を計算できるだけの実測値があるかどうか。
+    """
+    if estimator.calibrated:
+        return True
+    if samples is None:
+        samples = context_packing.AUTO_CALIBRATE_SAMPLES
+    if samples > 0:
+        texts = [format_faq_entry(faq) for faq in faq_data
+                 if faq.get('question') and faq.get('answer') and faq.get('url')]
+        try:
+            with metrics.span('qa.calibrate_tokens'):
+                measured = estimator.calibrate(texts, counter, samples)
+            print(f"トークン数の実測値がないため、{measured} 件のFAQのトークン数を実測しました。"
+                  f"(補正係数 {estimator.scale:.2f})")
+        except Exception as e:
+            print(f"警告: トークン数の実測に失敗しました。\n{e}")
+    if not estimator.calibrated:
+        print(f"警告: トークン数の実測値がないため、トークン数を大きめに見積もります (補正係数 {estimator.scale:.2f})。"
+              f"'python -m openlogi_ai_faq.context_packing --calibrate 200' で実測できます。")
+    return estimator.calibrated
+
+# --- prepare_faq_context ('full' モードのコンテキストの準備) ---
+def prepare_faq_context(faq_data, data_filename, model_name, budget=None, focus_queries=(), prompt_prefix="",
+                        passages=False):
+    """
+    モデルとFAQデータファイルに合わせて format_faq_context を呼び出す。
+    トークン数は data_filename に対応するキャッシュの実測値で補正し、
+    優先度は focus_queries との関連度、ページキャッシュの更新日時、カテゴリの重みから計算する。
+
+    Args:
+        faq_data (list[dict]): 読み込んだFAQデータ。
+        data_filename (str): FAQデータファイル名。
+        model_name (str): 使用するモデル名 (コンテキストの上限とトークン数のキャッシュに使う)。
+        budget (int | None): FAQ情報に使えるトークン数。Noneの場合はモデルのコンテキストの上限から計算する。
+        focus_queries (Iterable[str]): 関連度の計算に使う質問 (context_packing.FOCUS_QUERIES に追加する)。
+        prompt_prefix (str): 回答ルールの前に置くコーパスごとの前置き。
+        passages (bool): Trueの場合、回答をパッセージに分割し、パッセージ単位で優先度を計算して予算に詰める。
+
+    Returns:
+        tuple[str | None, bool]: format_faq_context と同じ。
+    """
+    estimator = context_packing.TokenEstimator(model_name, context_packing.token_counts_filename(data_filename))
+    if budget is None:
+        budget = context_packing.context_budget(model_name)
+    parents = None
+    if passages:
+        from . import chunking
+        parents, faq_data = faq_data, chunking.chunk_records(faq_data)
+    priorities = context_packing.record_priorities(
+        faq_data, list(context_packing.FOCUS_QUERIES) + list(focus_queries),
+        context_packing.load_page_timestamps(data_filename))
+    return format_faq_context(faq_data, budget, estimator, priorities, prompt_prefix, parents)
+
+# --- context_artifact_key ---
+def context_artifact_key(data_filename, model_name, budget=None, focus_queries=(), prompt_prefix="", passages=False):
+    """
+    prepare_faq_context の結果を決める設定と入力ファイルから、アーティファクトに保存したコンテキストのキーを作る。
+    ルール・モデル・予算・関連度の質問・優先度の重みのほか、トークン数のキャッシュとページキャッシュの
+    更新日時とサイズを含めるため、これらが変わるとコンテキストは作り直される。
+
+    Returns:
+        str: キー (SHA-256 の16進文字列)。
+    """
+    if budget is None:
+        budget = context_packing.context_budget(model_name)
+    inputs = []
+    for filename in (context_packing.token_counts_filename(data_filename),
+                     page_cache_filename(data_filename)):
+        try:
+            stat = os.stat(filename)
+            inputs.append([stat.st_mtime_ns, stat.st_size])
+        except OSError:
+            inputs.append(None)
+    settings = [answer_rules(prompt_prefix), model_name, budget,
+                list(context_packing.FOCUS_QUERIES) + list(focus_queries), context_packing.PRIORITY_WEIGHTS, context_packing.CATEGORY_WEIGHTS, context_packing.FOCUS_TOP_K,
+                context_packing.TOKENS_PER_CJK_CHAR, context_packing.CHARS_PER_ASCII_TOKEN, inputs]
+    if passages:
+        from . import chunking
+        settings.append([chunking.PASSAGE_MAX_CHARS, chunking.PASSAGE_MIN_CHARS, chunking.HEADING_RE.pattern,
+                         chunking.OMISSION_MARK])
+    return hashlib.sha256(json.dumps(settings, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+# --- open_artifact ---
+def open_artifact(data_filename):
+    """
+    FAQデータファイルと内容が一致するアーティファクトを開く。
+    アーティファクトがない場合、FAQデータファイルが変わった場合、重複除去の設定 (DEDUP_ON_LOAD) が
+    作成時と異なる場合はNone。
+    """
+    from .artifact import FaqArtifact, artifact_filename
+    try:
+        data_hash = file_hash(data_filename)
+    except (IOError, OSError):
+        return None
+    artifact = FaqArtifact.open(artifact_filename(data_filename), data_hash)
+    if artifact is not None and ('records' not in artifact or artifact.meta('records').get('dedup') != DEDUP_ON_LOAD):
+        artifact.close()
+        return None
+    return artifact
+
+# --- load_corpus ---
+def load_corpus(filename, use_artifact=USE_ARTIFACT, need_records=True):
+    """
+    FAQデータを読み込む。use_artifact がTrueで、FAQデータファイルと内容が一致するアーティファクトがあれば、
+    FAQデータファイルの解析と重複除去を省略してアーティファクトから読み込む。
+
+    Args:
+        filename (str): FAQデータファイル名。
+        use_artifact (bool): アーティファクトを使うかどうか。
+        need_records (bool): Falseの場合、アーティファクトがあればFAQレコードは読み込まない
+                             ('full' モードでコンテキストをアーティファクトから読む場合など、必要になるまで遅らせる)。
+
+    Returns:
+        tuple[list[dict] | None, artifact.FaqArtifact | None]: (FAQデータ, アーティファクト)。
+            アーティファクトを使わない場合は (load_faq_data の結果, None)。
+            アーティファクトがあり need_records がFalseの場合は (None, アーティファクト)。
+    """
+    artifact = open_artifact(filename) if use_artifact else None
+    if artifact is None:
+        return load_faq_data(filename), None
+    print(f"{artifact.filename} から {artifact.meta('records')['count']} 件のFAQデータを読み込みました。")
+    if not need_records:
+        return None, artifact
+    with metrics.span('qa.load_artifact'):
+        return artifact.records(), artifact
+
+# --- extract_reference_url ---
+def extract_reference_url(answer_text):
+    """
+    回答テキストから「参照FAQ: [URL]」のURLを取り出す。複数ある場合は最後のもの。
+
+    Returns:
+        str | None: 参照FAQのURL。記載がない場合はNone。
+    """
+    urls = REFERENCE_URL_RE.findall(answer_text or "")
+    return urls[-1] if urls else None
+
+# --- print_stream_chunk (ストリーミング表示用) ---
+def print_stream_chunk(text):
+    """ストリーミングで受信した回答の断片を、改行せずにすぐ表示する。"""
+    print(text, end='', flush=True)
+
+# --- format_retrieval_prompt (検索モード用) ---
+def format_retrieval_prompt(question, faqs, history_text="", prompt_prefix=""):
+    """
+    検索で選んだFAQだけを含む、質問ごとのプロンプトを作成する。
+    回答生成のルールと参照FAQの形式は format_faq_context と同じ。
+
+    Args:
+        question (str): ユーザーの質問。
+        faqs (list[dict]): 質問に関連するFAQレコード (関連度の高い順)。
+        history_text (str): プロンプトに含める会話履歴 (BoundedHistory.format() の結果)。
+        prompt_prefix (str): 回答ルールの前に置くコーパスごとの前置き。
+
+    Returns:
+        str: モデルに送信するプロンプト。
+    """
+    faq_texts = "".join(format_faq_entry(faq) for faq in faqs)
+    return (answer_rules(prompt_prefix) + "\n--- FAQ情報 ---\n" + faq_texts + "--- FAQ情報ここまで ---\n\n"
+            + history_text + QUESTION_LABEL + question)
+
+# --- format_stateless_prompt ('full' モードの stateless 用) ---
+def format_stateless_prompt(context, question, history_text=""):
+    """
+    format_faq_context で作成したコンテキストを固定の前置きとして、
+    直近の会話履歴と質問を続けたプロンプトを作成する。前置きが毎回同じなので、プロンプトの大きさは
+    会話の長さに関わらずほぼ一定になる。
+    """
+    return context + "\n\n" + history_text + QUESTION_LABEL + question
 
 # --- メイン処理 (__main__) ---
 if __name__ == "__main__":
-    print(f"FAQ Q&A アプリ (モデル: {MODEL_NAME}, ChatSession利用)")
+    parser = argparse.ArgumentParser(description="FAQデータに基づいて Gemini で質問に回答する")
+    parser.add_argument("--session", choices=SESSION_MODES, default=SESSION_MODE,
+                        help=f"full モードでの会話の続け方 (デフォルト: {SESSION_MODE})。stateless は直近の履歴だけを送信する")
+    parser.add_argument("--history-turns", type=int, default=HISTORY_TURNS,
+                        help=f"stateless / retrieval モードでプロンプトに含める直近の会話の往復数 (デフォルト: {HISTORY_TURNS})")
+    parser.add_argument("--backend", choices=MODEL_BACKENDS, default=MODEL_BACKEND,
+                        help=f"モデルのバックエンド (デフォルト: {MODEL_BACKEND})。fake はAPIを呼び出さない")
+    parser.add_argument("--no-cache", dest="cache", action="store_false", default=ANSWER_CACHE_ENABLED,
+                        help="回答キャッシュを使わない")
+    parser.add_argument("--stream", action="store_true", default=STREAM_OUTPUT,
+                        help="回答を生成されたそばから表示する (最初のトークンまでの時間も表示する)")
+    parser.add_argument("--mode", choices=CONTEXT_MODES, default=CONTEXT_MODE,
+                        help=f"FAQ情報の渡し方 (デフォルト: {CONTEXT_MODE})。retrieval は質問ごとに関連するFAQだけを送信する")
+    parser.add_argument("--top-k", type=int, default=RETRIEVAL_TOP_K,
+                        help=f"retrieval モードで1回の質問に含めるFAQの件数 (デフォルト: {RETRIEVAL_TOP_K})")
+    parser.add_argument("--engine", choices=RETRIEVAL_ENGINES, default=RETRIEVAL_ENGINE,
+                        help=f"retrieval モードの検索方法 (デフォルト: {RETRIEVAL_ENGINE})")
+    parser.add_argument("--context-budget", type=int,
+                        help="full モードでFAQ情報に使えるトークン数 (デフォルト: モデルのコンテキストの上限から計算)")
+    parser.add_argument("--focus-file",
+                        help="full モードで優先してコンテキストに含めるFAQを決めるための質問ファイル (1行1問、または JSONL)")
+    parser.add_argument("--metrics-file",
+                        help="計測値 (モデルの応答時間・トークン数・エラー数など) の書き出し先 (.prom: Prometheus 形式, それ以外: JSON)")
+    parser.add_argument("--trace-file", help="処理段階ごとのスパン (所要時間) を JSONL 形式で追記するファイル")
+    parser.add_argument("--no-artifact", dest="artifact", action="store_false", default=USE_ARTIFACT,
+                        help="アーティファクト (artifact.py) を使わず、FAQデータファイルから毎回準備する")
+    parser.add_argument("--passages", action="store_true", default=PASSAGE_CHUNKING,
+                        help="長いFAQの回答をパッセージに分割し、関連するパッセージだけをプロンプトに含める")
+    parser.add_argument("--corpus", help="使用するコーパスの名前 (corpus.py / コーパスの定義ファイルを参照)")
+    parser.add_argument("--corpora-file", help="コーパスの定義ファイル (デフォルト: あれば corpus.CORPORA_FILE)")
+    args = parser.parse_args()
+
+    try:
+        metrics.configure(args.metrics_file, args.trace_file)
+    except (IOError, OSError) as e:
+        print(f"エラー: トレースファイルを開けませんでした - {args.trace_file}\n{e}")
+        sys.exit(1)
+
+    try:
+        corpus_config = select_corpus(load_corpora(args.corpora_file, FAQ_DATA_FILE), args.corpus)
+    except (IOError, OSError, ValueError) as e:
+        print(f"エラー: コーパスの設定を読み込めませんでした。\n{e}")
+        sys.exit(1)
+    FAQ_DATA_FILE = corpus_config.data_file
+
+    session_label = "ChatSession利用" if args.mode == 'full' and args.session == 'chat' else "stateless"
+    model_label = MODEL_NAME if args.backend == 'gemini' else args.backend
+    print(f"FAQ Q&A アプリ (コーパス: {corpus_config.name}, モデル: {model_label}, {session_label}, モード: {args.mode})")
     print("-" * 30)
 
     # --- FAQデータの準備 ---
     faq_data = None
+    artifact = None
+    # 'full' モードでコンテキストをアーティファクトから読める場合は、FAQレコード全体は読み込まない
+    need_records = args.mode == 'retrieval'
+    # 起動時間に含めない時間 (ユーザーの入力待ちとクロール)
+    excluded_seconds = 0.0
     # データファイルが存在するかチェック
     if not os.path.exists(FAQ_DATA_FILE):
         print(f"FAQデータファイル ({FAQ_DATA_FILE}) が見つかりません。")
         # ユーザーにデータ取得の意向を確認
+        waiting_since = time.perf_counter()
         user_input = input("今すぐデータを取得しますか？ (y/n): ").lower()
+        excluded_seconds += time.perf_counter() - waiting_since
         if user_input == 'y':
             print("\nクローラーを起動します...")
+            from . import crawler
             # crawler モジュールの run_crawl 関数を呼び出し
-            crawl_success = crawler.run_crawl(start_url=None, output_filename=FAQ_DATA_FILE)
+            crawl_started = time.perf_counter()
+            crawl_success = crawler.run_crawl(start_url=corpus_config.start_url, output_filename=FAQ_DATA_FILE)
+            excluded_seconds += time.perf_counter() - crawl_started
             if not crawl_success:
                 print("FAQデータの取得に失敗しました。アプリケーションを終了します。")
                 sys.exit(1)
             # クロール成功後、データを読み込む
-            faq_data = load_faq_data(FAQ_DATA_FILE)
+            faq_data, artifact = load_corpus(FAQ_DATA_FILE, args.artifact, need_records)
         else:
             # 取得しない場合は終了
             print("データがないため、アプリケーションを終了します。")
@@ -150,114 +510,219 @@ if __name__ == "__main__":
         # ファイルが存在する場合
         print(f"既存のFAQデータファイル ({FAQ_DATA_FILE}) が見つかりました。")
         # ユーザーにデータ更新の意向を確認
+        waiting_since = time.perf_counter()
         user_input = input("データを更新しますか？ (y/n): ").lower()
+        excluded_seconds += time.perf_counter() - waiting_since
         if user_input == 'y':
             print("\nクローラーを起動してデータを更新します...")
-            # クローラーを実行してデータを上書き
-            crawl_success = crawler.run_crawl(start_url=None, output_filename=FAQ_DATA_FILE)
+            from . import crawler
+            # 差分更新モードでクローラーを実行してデータを上書き (変更のないページは解析を省略)
+            crawl_started = time.perf_counter()
+            crawl_success = crawler.run_crawl(start_url=corpus_config.start_url, output_filename=FAQ_DATA_FILE,
+                                              refresh=True)
+            excluded_seconds += time.perf_counter() - crawl_started
             if not crawl_success:
                 print("FAQデータの更新に失敗しました。既存のデータで続行します。")
                 # 更新失敗時は既存データを読み込む
-                faq_data = load_faq_data(FAQ_DATA_FILE)
+                faq_data, artifact = load_corpus(FAQ_DATA_FILE, args.artifact, need_records)
             else:
                  # 更新成功後、新しいデータを読み込む
-                 faq_data = load_faq_data(FAQ_DATA_FILE)
+                 faq_data, artifact = load_corpus(FAQ_DATA_FILE, args.artifact, need_records)
         else:
             # 更新しない場合、既存のデータを読み込む
             print("既存のデータを使用します。")
-            faq_data = load_faq_data(FAQ_DATA_FILE)
+            faq_data, artifact = load_corpus(FAQ_DATA_FILE, args.artifact, need_records)
 
     # データが最終的に読み込めたか確認
-    if faq_data is None:
+    if faq_data is None and artifact is None:
         print(f"エラー: FAQデータの読み込みに失敗しました。({FAQ_DATA_FILE} を確認してください)")
         sys.exit(1)
     # --- FAQデータの準備 ここまで ---
 
 
-    # .envファイルからAPIキーを読み込み
-    load_dotenv()
-    api_key = os.getenv("GEMINI_API_KEY")
+    # モデルのバックエンドを準備
+    if args.backend == 'fake':
+        # APIを呼び出さないローカルの偽モデル (動作確認・トークン数の比較用)
+        backend = FakeBackend()
+        print("\nローカルの偽モデル (fake) を使用します。トークン数は文字数による見積もりです。")
+    else:
+        # .envファイルからAPIキーを読み込み
+        from dotenv import load_dotenv
+        load_dotenv()
+        api_key = os.getenv("GEMINI_API_KEY")
 
-    if not api_key:
-        print("エラー: 環境変数 'GEMINI_API_KEY' が設定されていません。")
-        sys.exit(1)
+        if not api_key:
+            print("エラー: 環境変数 'GEMINI_API_KEY' が設定されていません。")
+            sys.exit(1)
 
-    # Geminiクライアントの設定
-    try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel(MODEL_NAME) # ここで選択されたモデルが使われる
-        print(f"\nGeminiモデル ({MODEL_NAME}) を初期化しました。")
-        # 選択されているモデルに応じた注意喚起
-        if "preview" in MODEL_NAME or "exp" in MODEL_NAME:
-             print(f"INFO: モデル {MODEL_NAME} はプレビュー版または実験版です。")
-             if "preview" in MODEL_NAME:
-                 print("     有料であり、アクセスには権限が必要な場合があります。")
-             if "exp" in MODEL_NAME:
-                 print("     無料ですが、レート制限が低い場合があります。")
-    except Exception as e:
-        print(f"エラー: Geminiモデル ({MODEL_NAME}) の初期化に失敗しました。\n{e}")
-        # モデル名や権限に関するエラーメッセージの可能性
-        if "Resource not found" in str(e) or "Permission denied" in str(e) or "model" in str(e).lower() and "not found" in str(e).lower():
-             print(f"指定されたモデル名 '{MODEL_NAME}' が見つからないか、アクセス権がない可能性があります。")
-             print("モデル名を確認するか、Google CloudプロジェクトでAPIやモデルへのアクセスが有効になっているか確認してください。")
-        sys.exit(1)
+        # Geminiクライアントの設定 (SDKの読み込みとモデルの初期化は、最初にモデルを呼び出すときに行われる)
+        try:
+            backend = GeminiBackend(MODEL_NAME, api_key) # ここで選択されたモデルが使われる
+            print(f"\nGeminiモデル ({MODEL_NAME}) を使用します。")
+            # 選択されているモデルに応じた注意喚起
+            if "preview" in MODEL_NAME or "exp" in MODEL_NAME:
+                 print(f"INFO: モデル {MODEL_NAME} はプレビュー版または実験版です。")
+                 if "preview" in MODEL_NAME:
+                     print("     有料であり、アクセスには権限が必要な場合があります。")
+                 if "exp" in MODEL_NAME:
+                     print("     無料ですが、レート制限が低い場合があります。")
+        except Exception as e:
+            print(f"エラー: Geminiモデル ({MODEL_NAME}) の初期化に失敗しました。\n{e}")
+            # モデル名や権限に関するエラーメッセージの可能性
+            if "Resource not found" in str(e) or "Permission denied" in str(e) or "model" in str(e).lower() and "not found" in str(e).lower():
+                 print(f"指定されたモデル名 '{MODEL_NAME}' が見つからないか、アクセス権がない可能性があります。")
+                 print("モデル名を確認するか、Google CloudプロジェクトでAPIやモデルへのアクセスが有効になっているか確認してください。")
+            sys.exit(1)
 
-    # FAQデータを初期コンテキストとして整形
-    initial_context, context_limited = format_faq_context(faq_data)
-    if initial_context is None:
-        print("エラー: 初期コンテキストの生成に失敗しました。FAQデータを確認してください。")
-        sys.exit(1)
-    if context_limited:
-         print("警告: FAQデータの一部のみがコンテキストとして使用されます。")
+    # アーティファクトになかったため作成したもの (最後にまとめてアーティファクトへ保存する)
+    new_sections = {}
+    if args.artifact and artifact is None:
+        from . import artifact as artifact_module
+        new_sections.update(artifact_module.records_sections(faq_data, DEDUP_ON_LOAD))
+
+    passages = None
+    if args.mode == 'retrieval' and args.passages:
+        # パッセージ単位の検索インデックスを作成する (分割の設定に合わせて毎回作成し、保存しない)
+        from . import chunking
+        passages = chunking.chunk_records(faq_data)
+        if args.engine == 'vector':
+            from . import vector_search
+            search_index = vector_search.VectorIndex.build(passages)
+        else:
+            search_index = retrieval.BM25Index.build(passages)
+        print(f"FAQ {len(faq_data)} 件を {len(passages)} 件のパッセージに分割しました。")
+        if search_index.doc_count == 0:
+            print("エラー: 検索できる有効なFAQがありませんでした。FAQデータを確認してください。")
+            sys.exit(1)
+    elif args.mode == 'retrieval':
+        # 検索インデックスを準備 (アーティファクトにあればそれを使い、
+        # 使わない場合はFAQデータが変わっていなければ保存済みのものを読み込む)
+        if args.engine == 'vector':
+            from . import vector_search
+            search_index = artifact.vector_index() if artifact is not None else None
+            if search_index is None and args.artifact:
+                search_index = vector_search.VectorIndex.build(faq_data)
+                from . import artifact as artifact_module
+                new_sections.update(artifact_module.vector_section(search_index))
+            elif search_index is None:
+                search_index = vector_search.load_or_build_index(FAQ_DATA_FILE, faq_data)
+        else:
+            search_index = artifact.bm25_index() if artifact is not None else None
+            if search_index is None and args.artifact:
+                search_index = retrieval.BM25Index.build(faq_data)
+                from . import artifact as artifact_module
+                new_sections.update(artifact_module.bm25_section(search_index))
+            elif search_index is None:
+                search_index = retrieval.load_or_build_index(FAQ_DATA_FILE, faq_data)
+        if search_index.doc_count == 0:
+            print("エラー: 検索できる有効なFAQがありませんでした。FAQデータを確認してください。")
+            sys.exit(1)
+    else:
+        # FAQデータを初期コンテキストとして整形
+        # 関連度の計算に使う質問 (よく聞かれる質問など) をファイルから読み込む
+        focus_queries = []
+        if args.focus_file:
+            try:
+                focus_queries = context_packing.load_focus_queries(args.focus_file)
+            except (IOError, OSError) as e:
+                print(f"警告: 質問ファイル ({args.focus_file}) の読み込みに失敗しました。関連度は使用しません。\n{e}")
+        # トークン数の実測値がなければ、コンテキストの作成 (とアーティファクトのキーの計算) の前に実測する
+        token_counts = context_packing.TokenEstimator(model_label, context_packing.token_counts_filename(FAQ_DATA_FILE))
+        if not token_counts.calibrated:
+            if faq_data is None:
+                faq_data = artifact.records()
+            calibrate_token_counts(token_counts, faq_data, backend.count_tokens)
+        context_key = context_artifact_key(FAQ_DATA_FILE, model_label, args.context_budget, focus_queries,
+                                           corpus_config.prompt_prefix, args.passages)
+        cached_context = artifact.context(context_key) if artifact is not None else None
+        if cached_context is not None:
+            initial_context, context_limited = cached_context
+            print(f"アーティファクトのコンテキストを使用します。({len(initial_context)} 文字)")
+        else:
+            if faq_data is None:
+                faq_data = artifact.records()
+            initial_context, context_limited = prepare_faq_context(faq_data, FAQ_DATA_FILE, model_label,
+                                                                   args.context_budget, focus_queries,
+                                                                   corpus_config.prompt_prefix, args.passages)
+            if initial_context is not None and args.artifact:
+                from . import artifact as artifact_module
+                new_sections.update(artifact_module.context_section(context_key, initial_context, context_limited))
+        if initial_context is None:
+            print("エラー: 初期コンテキストの生成に失敗しました。FAQデータを確認してください。")
+            sys.exit(1)
+        if context_limited:
+             print("警告: FAQデータの一部のみがコンテキストとして使用されます。")
+
+    # 'retrieval' モードは常に質問ごとの独立したリクエスト (stateless) で問い合わせる
+    use_chat = args.mode == 'full' and args.session == 'chat'
+    # これまでの会話履歴。stateless の場合はプロンプトへ含める分 (直近の数往復 + 古い往復の要約)、
+    # chat の場合は ChatSession が毎回送信する全往復 (回答キャッシュのキーにだけ使う)
+    history = BoundedHistory(sys.maxsize, summary_chars=0) if use_chat else BoundedHistory(args.history_turns)
+
+    data_hash = artifact.data_hash if artifact is not None else file_hash(FAQ_DATA_FILE)
+    if new_sections:
+        # 次回の起動ではこれらの準備を省略できるよう、アーティファクトに保存する
+        from . import artifact as artifact_module
+        if artifact_module.update_artifact(FAQ_DATA_FILE, data_hash, new_sections):
+            print(f"アーティファクトを保存しました。({', '.join(new_sections)})")
+        new_sections = None
+
+    # 回答キャッシュを準備 (キーは 正規化した質問文・モデルとモード・FAQデータのハッシュ)
+    answer_cache = None
+    if args.cache:
+        # 対話では質問の間隔が長く、終了の仕方 (Ctrl+C など) によっては flush() されないため、回答ごとに保存する
+        answer_cache = AnswerCache(cache_filename(FAQ_DATA_FILE), data_hash, save_interval=0)
+        print(f"回答キャッシュを使用します。({len(answer_cache)} 件)")
+    cache_model_key = answer_cache_model_key(model_label, args.mode, args.engine, corpus_config.prompt_prefix,
+                                             args.passages)
 
     # --- トークン数カウンターを初期化 ---
     total_prompt_tokens_sent_in_session = 0 # セッション中にAPIに送信された全プロンプトトークン(重複含む)
     total_candidates_tokens_generated = 0 # セッション中に生成された全応答トークン
     initial_prompt_tokens = 0             # 初期コンテキスト投入時のプロンプトトークン数
     initial_response_tokens = 0           # 初期コンテキスト投入時の応答トークン数
+    # stateless: 会話履歴をすべて送信した場合 (ChatSession 相当) のプロンプトトークン数の推定値
+    total_unbounded_prompt_tokens = 0
+    # パッセージ単位で選んだFAQの回答の推定トークン数と、回答全体を含めた場合の推定トークン数
+    total_passage_tokens = 0
+    total_whole_answer_tokens = 0
     # ----------------------------------
+    # 質問ごとの応答時間 (秒) と、最初のトークンを受信するまでの時間 (秒)
+    latencies = []
+    first_token_latencies = []
+    # 参照FAQのURLがFAQデータに含まれているかの確認用
+    known_urls = set(artifact.urls()) if faq_data is None else {faq.get('url') for faq in faq_data}
+
+    # 起動時間 (ユーザーの入力待ちとクロールの時間を除く)
+    startup_seconds = time.perf_counter() - _STARTED - excluded_seconds
+    STARTUP_SECONDS.set(startup_seconds)
 
     # チャットセッションの開始と初期コンテキストの投入
     try:
-        print("\nチャットセッションを開始し、FAQ情報をモデルに読み込ませています...")
-        # ChatSessionを開始。history=[] で空の状態から始める。
-        # SDKが内部で会話履歴（プロンプトと応答）を管理する。
-        chat = model.start_chat(history=[])
-
-        # 最初のプロンプトには、整形したFAQコンテキスト全体と、モデルへの確認メッセージを含める
-        initial_prompt = f"{initial_context}\n\n上記ルールを理解しましたか？準備ができたら「準備完了」とだけ答えてください。"
-
-        # APIの安全設定 (不適切なコンテンツのブロック閾値)
-        safety_settings=[
-             { "category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-             { "category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-             { "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-             { "category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-        ]
-        # 回答の生成に関する設定 (temperatureを低くして、より決定的な回答を促す)
-        generation_config = genai.types.GenerationConfig(temperature=0.2)
-
-        # --- 初期コンテキスト投入とトークン数記録 ---
-        # 最初のメッセージを送信し、モデルにFAQ情報を「記憶」させる
-        response = chat.send_message(
-            initial_prompt,
-            generation_config=generation_config,
-            safety_settings=safety_settings
-            )
-
-        # 応答メタデータからトークン数を取得して記録
-        if hasattr(response, 'usage_metadata'):
-            initial_prompt_tokens = getattr(response.usage_metadata, 'prompt_token_count', 0)
-            initial_response_tokens = getattr(response.usage_metadata, 'candidates_token_count', 0)
+        if use_chat:
+            print("\nチャットセッションを開始し、FAQ情報をモデルに読み込ませています...")
+            # ChatSessionを開始。history=[] で空の状態から始める。
+            # SDKが内部で会話履歴（プロンプトと応答）を管理する。
+            chat = backend.start_chat()
+
+            # 最初のプロンプトには、整形したFAQコンテキスト全体と、モデルへの確認メッセージを含める
+            initial_prompt = f"{initial_context}\n\n上記ルールを理解しましたか？準備ができたら「準備完了」とだけ答えてください。"
+
+            # --- 初期コンテキスト投入とトークン数記録 ---
+            # 最初のメッセージを送信し、モデルにFAQ情報を「記憶」させる
+            response = chat.send(initial_prompt)
+
+            # 応答のトークン数を記録
+            initial_prompt_tokens = response.prompt_tokens
+            initial_response_tokens = response.response_tokens
             # 初回のトークン数を合計に記録
             total_prompt_tokens_sent_in_session += initial_prompt_tokens
             total_candidates_tokens_generated += initial_response_tokens
             print(f"(初期コンテキスト投入: プロンプト {initial_prompt_tokens} トークン, 応答 {initial_response_tokens} トークン)")
-        else:
-            print("警告: 初期コンテキスト投入時のトークン数を取得できませんでした。")
-        # -----------------------------------------
+            # -----------------------------------------
+        # stateless の場合は初期コンテキストを投入せず、質問ごとに固定の指示 + 直近の履歴 + 質問を送信する
 
-        print("\nFAQ情報の読み込みが完了しました。質問を入力してください。")
+        print(f"\nFAQ情報の読み込みが完了しました。(起動時間: {startup_seconds:.2f}秒) 質問を入力してください。")
         print("終了するには 'quit' または 'exit' と入力してください。")
         print("-" * 30)
 
@@ -280,37 +745,119 @@ if __name__ == "__main__":
             if not user_question:
                 continue
 
-            print("\nGeminiに問い合わせています...")
-            # --- 質問応答とトークン数記録 ---
-            # ChatSessionにユーザーの質問を送信。SDKが自動的に履歴を付加する。
-            response = chat.send_message(
-                user_question,
-                generation_config=generation_config, # 同じ設定を使用
-                safety_settings=safety_settings     # 同じ設定を使用
-                )
-
-            # このAPI呼び出しで消費されたトークン数を取得して加算
-            if hasattr(response, 'usage_metadata'):
-                 current_prompt_tokens = getattr(response.usage_metadata, 'prompt_token_count', 0)
-                 current_candidates_tokens = getattr(response.usage_metadata, 'candidates_token_count', 0)
-                 # 各API呼び出しで送信されたプロンプトと生成された応答のトークン数を累積
-                 total_prompt_tokens_sent_in_session += current_prompt_tokens
-                 total_candidates_tokens_generated += current_candidates_tokens
-                 print(f"(今回API呼出: プロンプト {current_prompt_tokens}, 応答 {current_candidates_tokens})") # 今回の呼び出し分
+            # 以前に同じ会話の流れで同じ質問 (表記ゆれを含む) に回答していれば、モデルに問い合わせずに返す。
+            # 会話の途中の質問 (「詳しく」など) は前の会話によって答えが変わるため、キーに会話履歴のハッシュを含める
+            question_cache_key = history_cache_key(cache_model_key, history.format())
+            cached = answer_cache.get(user_question, question_cache_key) if answer_cache is not None else None
+            if cached is not None:
+                QUESTIONS.inc(outcome='cached')
+                history.add(user_question, cached['answer'])
+                if use_chat:
+                    # 次の質問が前の往復を踏まえて回答されるよう、ChatSession の履歴にも加える
+                    chat.add_turn(user_question, cached['answer'])
+                print("\n回答 (キャッシュ):")
+                print(cached['answer'])
+                continue
+
+            # ストリーミングの場合は、受信した断片をそのまま表示する
+            on_chunk = print_stream_chunk if args.stream else None
+            if use_chat:
+                print("\nGeminiに問い合わせています...")
+                if args.stream:
+                    print("\n回答:")
+                # --- 質問応答とトークン数記録 ---
+                # ChatSessionにユーザーの質問を送信。SDKが自動的に履歴を付加する。
+                response = chat.send(user_question, on_chunk)
+                history.add(user_question, response.text)
+                prompt = None
             else:
-                 print("警告: 今回のAPI呼び出しのトークン数を取得できませんでした。")
+                history_text = history.format()
+                if args.mode == 'retrieval':
+                    # 質問に関連するFAQを検索し、そのFAQだけを含むプロンプトを作成
+                    with metrics.span('qa.retrieve', engine=args.engine):
+                        if passages is not None:
+                            related_faqs = chunking.retrieve_passages(search_index, faq_data, passages,
+                                                                      user_question, args.top_k)
+                        else:
+                            related_faqs = retrieval.retrieve_faqs(search_index, faq_data, user_question, args.top_k)
+                    if not related_faqs:
+                        # 一致する語が1つもない場合はモデルに問い合わせない
+                        QUESTIONS.inc(outcome='no_match')
+                        print("\n回答:")
+                        print(NO_ANSWER_MESSAGE)
+                        continue
+                    if passages is not None:
+                        whole_tokens, passage_tokens = chunking.answer_tokens(faq_data, related_faqs)
+                        total_whole_answer_tokens += whole_tokens
+                        total_passage_tokens += passage_tokens
+                        print(f"\n関連するFAQのパッセージを {len(related_faqs)} 件のFAQから選びました。"
+                              f"(回答の推定 {passage_tokens} トークン, 回答全体の場合 {whole_tokens} トークン)")
+                        print("Geminiに問い合わせています...")
+                    else:
+                        print(f"\n関連するFAQを {len(related_faqs)} 件選びました。Geminiに問い合わせています...")
+                    prompt = format_retrieval_prompt(user_question, related_faqs, history_text,
+                                                     corpus_config.prompt_prefix)
+                else:
+                    print("\nGeminiに問い合わせています...")
+                    prompt = format_stateless_prompt(initial_context, user_question, history_text)
+                if args.stream:
+                    print("\n回答:")
+                # 質問ごとに独立したリクエストとして送信する (会話履歴は直近の分だけプロンプトに含める)
+                response = backend.generate(prompt, on_chunk)
+            if args.stream:
+                print()  # ストリーミング表示の最後の改行
+
+            QUESTIONS.inc(outcome='answered')
+            # このAPI呼び出しで消費されたトークン数を加算
+            current_prompt_tokens = response.prompt_tokens
+            current_candidates_tokens = response.response_tokens
+            # 各API呼び出しで送信されたプロンプトと生成された応答のトークン数を累積
+            total_prompt_tokens_sent_in_session += current_prompt_tokens
+            total_candidates_tokens_generated += current_candidates_tokens
+            if prompt is None:
+                usage_line = f"(今回API呼出: プロンプト {current_prompt_tokens}, 応答 {current_candidates_tokens})" # 今回の呼び出し分
+            else:
+                # 履歴をすべて送信した場合のプロンプトの大きさを、文字数の比から推定する
+                unbounded_chars = len(prompt) - len(history_text) + history.unbounded_chars()
+                unbounded_tokens = round(current_prompt_tokens * unbounded_chars / len(prompt))
+                total_unbounded_prompt_tokens += unbounded_tokens
+                usage_line = (f"(今回API呼出: プロンプト {current_prompt_tokens}, 応答 {current_candidates_tokens}"
+                              f" / 履歴をすべて送信した場合の推定プロンプト {unbounded_tokens})")
+                history.add(user_question, response.text)
             # -------------------------------
-
-            # 回答をコンソールに表示
-            print("\n回答:")
-            print(response.text) # 回答に参照URLが含まれることを期待
+            latencies.append(response.latency)
+            if args.stream:
+                first_token_latencies.append(response.first_token_latency)
+                timing_line = f"(応答時間: 最初のトークンまで {response.first_token_latency:.2f}秒, 合計 {response.latency:.2f}秒)"
+            else:
+                timing_line = f"(応答時間: {response.latency:.2f}秒)"
+            if answer_cache is not None:
+                answer_cache.put(user_question, question_cache_key, response.text,
+                                 current_prompt_tokens, current_candidates_tokens)
+
+            print(usage_line)
+            print(timing_line)
+            # 回答をコンソールに表示 (ストリーミングの場合は受信しながら表示済み)
+            if not args.stream:
+                print("\n回答:")
+                print(response.text) # 回答に参照URLが含まれることを期待
+
+            # 回答の末尾の参照FAQのURLが、読み込んだFAQデータにあるものか確認する
+            reference_url = extract_reference_url(response.text)
+            if reference_url is not None and reference_url not in known_urls:
+                print(f"警告: 参照FAQのURLがFAQデータにありません - {reference_url}")
+            metrics.flush()
 
         # ループ中のエラーハンドリング
         except Exception as e:
             print(f"エラー: メッセージの送信または応答の受信中にエラーが発生しました。\n{e}")
             # レート制限エラーの場合のメッセージ
-            if "Resource has been exhausted" in str(e) or "rate limit" in str(e).lower():
+            if is_rate_limit_error(e) or "rate limit" in str(e).lower():
+                QUESTIONS.inc(outcome='rate_limited')
                 print("INFO: レート制限に達した可能性があります。")
+            else:
+                QUESTIONS.inc(outcome='error')
+            metrics.flush()
             # エラーが発生してもループは継続
             continue
 
@@ -324,10 +871,31 @@ if __name__ == "__main__":
     print(f"  ---")
     print(f"  APIに送信された総プロンプトトークン数 (履歴重複含む): {total_prompt_tokens_sent_in_session}")
     print(f"  APIが生成した総応答トークン数:                       {total_candidates_tokens_generated}")
+    if not use_chat and total_unbounded_prompt_tokens:
+        saved = total_unbounded_prompt_tokens - total_prompt_tokens_sent_in_session
+        print(f"  履歴をすべて送信した場合の推定プロンプトトークン数: {total_unbounded_prompt_tokens}"
+              f" (削減: {saved}, {saved / total_unbounded_prompt_tokens:.0%})")
+    if total_whole_answer_tokens:
+        print(f"  ---")
+        print("  " + chunking.format_savings(total_whole_answer_tokens, total_passage_tokens))
+    if answer_cache is not None:
+        answer_cache.flush()
+        print(f"  ---")
+        print(answer_cache.format_stats())
+    if latencies:
+        print(f"  ---")
+        timing_summary = f"  応答時間: 平均 {sum(latencies) / len(latencies):.2f}秒, 最大 {max(latencies):.2f}秒"
+        if first_token_latencies:
+            timing_summary += f" (最初のトークンまで 平均 {sum(first_token_latencies) / len(first_token_latencies):.2f}秒)"
+        print(timing_summary)
     print("="*30)
     print("\n重要: 上記はAPI呼び出しで報告されたトークン数の合計です。")
-    print("      ChatSessionでは会話履歴が毎回送信されるため、「送信された総プロンプトトークン数」には過去の履歴が重複してカウントされています。")
+    if use_chat:
+        print("      ChatSessionでは会話履歴が毎回送信されるため、「送信された総プロンプトトークン数」には過去の履歴が重複してカウントされています。")
+    else:
+        print(f"      stateless モードでは、会話履歴は直近 {history.max_turns} 往復と古い往復の短い要約だけを送信しています。")
     print("      課金対象となる正確な「入力トークン数」「出力トークン数」とは異なります。")
     print("      正確な料金はGoogle Cloudの請求情報をご確認ください。")
+    metrics.flush()
     print("\nアプリを終了します。")
-    # -----------------------------------------
\ No newline at end of file
+    # -----------------------------------------
@@ -0,0 +1,148 @@
+# src/openlogi_ai_faq/ratelimit.py (トークンバケット方式のレート制限)
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    トークンバケット方式のレート制限。
+    1秒あたり rate 個のトークンが補充され、最大 capacity 個まで貯められる。
+    スレッドセーフで、複数ワーカーから同時に acquire() を呼び出せる。
+    """
+
+    def __init__(self, rate, capacity=1):
+        if rate <= 0:
+            raise ValueError("rate は正の値である必要があります。")
+        self.rate = float(rate)
+        self.capacity = max(1.0, float(capacity))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._updated = now
+
+    def acquire(self, tokens=1):
+        """
+        トークンを取得する。不足している場合は補充されるまで待機する。
+
+        Returns:
+            float: 待機した秒数。
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            # 先にトークンを予約しておき、待機はロックの外で行う
+            self._tokens -= tokens
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def consume(self, tokens):
+        """
+        待機せずにトークンを消費する (後から判明した使用量を差し引く場合などに使う)。
+        不足分は次の acquire() の待機時間に反映される。
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= tokens
+
+    def set_rate(self, rate):
+        """補充レートを変更する (それまでに貯まった分は元のレートで計算する)。"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = float(rate)
+
+    def pause(self, seconds):
+        """今から seconds 秒間はトークンを補充しない (Retry-After への対応などに使う)。"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, 0.0) - seconds * self.rate
+
+
+class HostRateLimiter:
+    """ホスト (netloc) ごとに TokenBucket を持つレート制限。"""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket_for(self, host):
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                bucket = TokenBucket(self.rate, self.burst)
+                self._buckets[host] = bucket
+            return bucket
+
+    def acquire(self, host):
+        """指定ホストへのリクエスト枠を取得する (必要なら待機する)。"""
+        return self.bucket_for(host).acquire()
+
+
+class AdaptiveHostRateLimiter(HostRateLimiter):
+    """
+    サーバーの状態に応じてホストごとのレートを自動調整する HostRateLimiter。
+
+    - 429 / 503 や Retry-After を受けた場合は、レートを decrease_factor 倍に下げる (乗算的減少)。
+      Retry-After がある場合は、その秒数だけ次のリクエストを待たせる。
+    - 応答時間の移動平均が、それまでの最小値の latency_factor 倍 (かつ latency_floor 秒) を
+      超えた場合もレートを下げる。
+    - 正常な応答が続く間は、最大レート (rate) まで increase_step ずつ戻す (加算的増加)。
+    """
+
+    def __init__(self, rate, burst=1, min_rate=0.1, decrease_factor=0.5, increase_step=None,
+                 latency_factor=2.0, latency_floor=0.5, latency_alpha=0.2, cooldown=1.0):
+        super().__init__(rate, burst)
+        self.max_rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.decrease_factor = decrease_factor
+        self.increase_step = increase_step if increase_step is not None else rate * 0.1
+        self.latency_factor = latency_factor
+        self.latency_floor = latency_floor
+        self.latency_alpha = latency_alpha
+        self.cooldown = cooldown
+        self._latency = {}        # ホスト -> 応答時間の指数移動平均
+        self._min_latency = {}    # ホスト -> 応答時間の移動平均の最小値
+        self._last_decrease = {}  # ホスト -> 最後にレートを下げた時刻
+        self._state_lock = threading.Lock()
+
+    def current_rate(self, host):
+        return self.bucket_for(host).rate
+
+    def _decrease(self, host, factor):
+        now = time.monotonic()
+        # 並行リクエストの失敗が同時に返ってきても、短時間に何度も下げすぎないようにする
+        if now - self._last_decrease.get(host, float('-inf')) < self.cooldown:
+            return
+        self._last_decrease[host] = now
+        bucket = self.bucket_for(host)
+        bucket.set_rate(max(self.min_rate, bucket.rate * factor))
+
+    def on_throttle(self, host, retry_after=None):
+        """429 / 503 などで、サーバーから速度を落とすよう求められた場合に呼び出す。"""
+        with self._state_lock:
+            self._decrease(host, self.decrease_factor)
+        if retry_after:
+            self.bucket_for(host).pause(retry_after)
+
+    def on_success(self, host, latency):
+        """正常な応答を受け取った場合に、応答時間 (秒) とともに呼び出す。"""
+        with self._state_lock:
+            average = self._latency.get(host)
+            average = latency if average is None else (1 - self.latency_alpha) * average + self.latency_alpha * latency
+            self._latency[host] = average
+            baseline = min(self._min_latency.get(host, average), average)
+            self._min_latency[host] = baseline
+            if average > max(baseline * self.latency_factor, self.latency_floor):
+                # 応答時間が悪化しているので少しずつ下げる
+                self._decrease(host, 0.8)
+                return
+            bucket = self.bucket_for(host)
+            if bucket.rate < self.max_rate:
+                bucket.set_rate(min(self.max_rate, bucket.rate + self.increase_step))
@@ -0,0 +1,224 @@
+# src/openlogi_ai_faq/retrieval.py (FAQ検索用の BM25 転置インデックス)
+import argparse
+import heapq
+import json
+import math
+import re
+import sys
+import unicodedata
+from collections import Counter
+
+from .faq_io import DEFAULT_FAQ_FILENAME, file_hash, write_json_atomic
+
+# インデックスファイルの接尾辞 (FAQデータファイルと同じ場所に保存する)
+INDEX_SUFFIX = ".bm25.json"
+# インデックスの形式のバージョン (形式を変えたら上げる。古いインデックスは作り直される)
+INDEX_VERSION = 1
+# 日本語 (英数字以外) の文字列を区切る文字 n-gram の長さ
+NGRAM_SIZE = 2
+# BM25 のパラメーター
+BM25_K1 = 1.5
+BM25_B = 0.75
+# 質問文の語の出現回数に掛ける重み (回答文より質問文の一致を重視する)
+QUESTION_WEIGHT = 2
+# 1回の質問で取り出すFAQの件数
+TOP_K = 5
+
+# 英数字の単語と、それ以外の文字 (かな・漢字など) の連続を取り出す
+_TOKEN_RE = re.compile(r'[a-z0-9]+|(?:(?![a-z0-9_])\w)+')
+
+
+def normalize_text(text):
+    """全角・半角 (NFKC) と大文字・小文字を揃える。"""
+    return unicodedata.normalize('NFKC', text or '').lower()
+
+
+def tokenize(text, ngram_size=NGRAM_SIZE):
+    """
+    テキストを検索用の語に分割する。
+    日本語は単語の区切りに空白を使わないため、英数字の単語はそのまま1語とし、
+    それ以外の文字の連続は文字 n-gram に分割する (n 文字未満の場合はそのまま1語)。
+
+    Returns:
+        list[str]: 語のリスト (重複を含む)。
+    """
+    tokens = []
+    for match in _TOKEN_RE.finditer(normalize_text(text)):
+        word = match.group()
+        if word.isascii() or len(word) <= ngram_size:
+            tokens.append(word)
+        else:
+            tokens.extend(word[i:i + ngram_size] for i in range(len(word) - ngram_size + 1))
+    return tokens
+
+
+def index_filename(data_filename):
+    """FAQデータファイル名に対応するインデックスのファイル名を返す。"""
+    return data_filename + INDEX_SUFFIX
+
+
+def _is_usable(faq):
+    return bool(faq.get('question') and faq.get('answer') and faq.get('url'))
+
+
+class BM25Index:
+    """
+    FAQの質問文と回答文に対する BM25 の転置インデックス。
+    文書番号は、インデックスを作成したときの faq_data のリストの位置と一致する。
+    質問・回答・URLのいずれかが欠けているレコードは検索対象に含めない。
+    """
+
+    def __init__(self, postings, doc_lengths, k1=BM25_K1, b=BM25_B, ngram_size=NGRAM_SIZE):
+        """
+        Args:
+            postings (dict[str, list[list[int]]]): 語 -> [[文書番号, 出現回数], ...]
+            doc_lengths (list[int]): 文書番号ごとの語数 (検索対象外のレコードは 0)。
+        """
+        self.postings = postings
+        self.doc_lengths = doc_lengths
+        self.k1 = k1
+        self.b = b
+        self.ngram_size = ngram_size
+        self.doc_count = sum(1 for length in doc_lengths if length)
+        self.avg_doc_length = sum(doc_lengths) / self.doc_count if self.doc_count else 0.0
+
+    @classmethod
+    def build(cls, faq_data, k1=BM25_K1, b=BM25_B, ngram_size=NGRAM_SIZE, question_weight=QUESTION_WEIGHT):
+        """FAQデータのリストからインデックスを作成する。"""
+        postings = {}
+        doc_lengths = []
+        for doc_id, faq in enumerate(faq_data):
+            if not _is_usable(faq):
+                doc_lengths.append(0)
+                continue
+            counts = Counter(tokenize(faq['answer'], ngram_size))
+            for token in tokenize(faq['question'], ngram_size):
+                counts[token] += question_weight
+            doc_lengths.append(sum(counts.values()))
+            for token, count in counts.items():
+                postings.setdefault(token, []).append([doc_id, count])
+        return cls(postings, doc_lengths, k1, b, ngram_size)
+
+    def idf(self, token):
+        df = len(self.postings.get(token, ()))
+        return math.log(1 + (self.doc_count - df + 0.5) / (df + 0.5))
+
+    def search(self, query, top_k=TOP_K):
+        """
+        質問文に関連するFAQを検索する。
+
+        Returns:
+            list[tuple[int, float]]: (文書番号, スコア) のリスト (スコアの高い順)。一致する語がない場合は空のリスト。
+        """
+        scores = {}
+        for token in set(tokenize(query, self.ngram_size)):
+            entries = self.postings.get(token)
+            if not entries:
+                continue
+            idf = self.idf(token)
+            for doc_id, count in entries:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / self.avg_doc_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * count * (self.k1 + 1) / (count + norm)
+        return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+
+    def to_dict(self):
+        return {
+            'k1': self.k1,
+            'b': self.b,
+            'ngram_size': self.ngram_size,
+            'doc_lengths': self.doc_lengths,
+            'postings': self.postings,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['postings'], data['doc_lengths'], data['k1'], data['b'], data['ngram_size'])
+
+
+def save_index(filename, index, data_hash):
+    """インデックスを、元のFAQデータファイルのハッシュとともに保存する。"""
+    try:
+        write_json_atomic(filename, {'version': INDEX_VERSION, 'data_hash': data_hash, 'index': index.to_dict()})
+        return True
+    except (IOError, OSError) as e:
+        print(f"警告: 検索インデックスの保存に失敗しました - {filename}\n{e}")
+        return False
+
+
+def load_index(filename, data_hash):
+    """
+    保存済みのインデックスを読み込む。
+
+    Returns:
+        BM25Index | None: FAQデータのハッシュや形式・パラメーターが一致しない場合、
+                          ファイルがない場合や壊れている場合はNone。
+    """
+    try:
+        with open(filename, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (json.JSONDecodeError, IOError, OSError) as e:
+        print(f"警告: 検索インデックスの読み込みに失敗しました。作り直します - {filename}\n{e}")
+        return None
+    if not isinstance(data, dict) or data.get('version') != INDEX_VERSION or data.get('data_hash') != data_hash:
+        return None
+    try:
+        index = BM25Index.from_dict(data['index'])
+    except (KeyError, TypeError) as e:
+        print(f"警告: 検索インデックスの形式が正しくありません。作り直します - {filename}\n{e}")
+        return None
+    if (index.k1, index.b, index.ngram_size) != (BM25_K1, BM25_B, NGRAM_SIZE):
+        return None
+    return index
+
+
+def load_or_build_index(data_filename, faq_data):
+    """
+    FAQデータファイルに対応するインデックスを読み込む。
+    インデックスがない場合や、FAQデータファイルの内容が変わっている場合は作り直して保存する。
+
+    Args:
+        data_filename (str): FAQデータファイル名 (インデックスの保存場所と、変更の検出に使う)。
+        faq_data (list[dict]): data_filename から読み込んだFAQデータ。
+
+    Returns:
+        BM25Index: FAQデータのインデックス。
+    """
+    data_hash = file_hash(data_filename)
+    filename = index_filename(data_filename)
+    index = load_index(filename, data_hash)
+    if index is not None and len(index.doc_lengths) == len(faq_data):
+        print(f"検索インデックス ({filename}) を読み込みました。")
+        return index
+
+    index = BM25Index.build(faq_data)
+    if save_index(filename, index, data_hash):
+        print(f"検索インデックスを作成しました。({index.doc_count} 件, {len(index.postings)} 語) -> {filename}")
+    return index
+
+
+def retrieve_faqs(index, faq_data, question, top_k=TOP_K):
+    """
+    質問文に関連するFAQレコードを、関連度の高い順に最大 top_k 件返す。
+    index は BM25Index または vector_search.VectorIndex (search() が同じ形式の結果を返すもの)。
+    """
+    return [faq_data[doc_id] for doc_id, _ in index.search(question, top_k)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="FAQデータを BM25 で検索する (インデックスがなければ作成する)")
+    parser.add_argument("query", help="検索する質問文")
+    parser.add_argument("--data", default=DEFAULT_FAQ_FILENAME, help="FAQデータファイル")
+    parser.add_argument("--top-k", type=int, default=TOP_K, help=f"表示する件数 (デフォルト: {TOP_K})")
+    args = parser.parse_args()
+
+    # Q&Aアプリと同じ手順 (重複の除去を含む) で読み込み、インデックスの文書番号を揃える
+    from .qa_app import load_faq_data
+    faq_data = load_faq_data(args.data)
+    if faq_data is None:
+        print(f"エラー: FAQデータの読み込みに失敗しました - {args.data}")
+        sys.exit(1)
+    index = load_or_build_index(args.data, faq_data)
+    for doc_id, score in index.search(args.query, args.top_k):
+        print(f"{score:7.3f}  {faq_data[doc_id]['question']}  {faq_data[doc_id]['url']}")
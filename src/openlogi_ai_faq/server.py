@@ -0,0 +1,423 @@
+# src/openlogi_ai_faq/server.py (asyncio による JSON over HTTP の Q&A サーバー)
+import argparse
+import asyncio
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from http import HTTPStatus
+
+from . import metrics
+from . import qa_app
+from .answer_cache import normalize_question
+from .answerer import load_corpus_answerer
+from .corpus import (CORPUS_IDLE_SECONDS, MAX_LOADED_CORPORA, CorpusConfig, CorpusRegistry, load_corpora,
+                     select_corpus)
+from .model_backend import MODEL_BACKENDS, create_backend, is_rate_limit_error
+
+# --- 設定 ---
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8000
+# サーバーで使うFAQ情報の渡し方 (対話アプリと違い、デフォルトは質問ごとに関連FAQを検索する 'retrieval')
+SERVER_CONTEXT_MODE = 'retrieval'
+# 同時に実行するモデル呼び出しの最大数
+MAX_CONCURRENT_CALLS = 4
+# モデル呼び出しの空きを待てるリクエストの最大数 (超えた場合はすぐに 503 を返す)
+MAX_PENDING_REQUESTS = 100
+# モデル呼び出しの空きを待つ最大秒数 (超えた場合は 503 を返す)
+QUEUE_TIMEOUT = 30.0
+# 1回のモデル呼び出しを待つ最大秒数 (超えた場合は 504 を返す)
+MODEL_TIMEOUT = 120.0
+# Keep-Alive 接続で次のリクエストを待つ秒数
+KEEPALIVE_TIMEOUT = 15.0
+# リクエストボディと質問文の大きさの上限
+MAX_BODY_BYTES = 64 * 1024
+MAX_QUESTION_CHARS = 2000
+# 使われていないコーパスを解放するかどうかを確認する間隔 (秒)
+CORPUS_EVICT_INTERVAL = 60.0
+# --- 設定ここまで ---
+
+
+class ServiceError(Exception):
+    """HTTPのエラー応答として返す例外。"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class QAService:
+    """
+    コーパスごとの FaqAnswerer を asyncio から呼び出すサービス。
+
+    - コーパス (corpus.CorpusRegistry) は、最初の質問を処理するときに読み込む。
+    - モデル呼び出し (ブロッキング) はスレッドプールで実行し、同時実行数を max_concurrent_calls に制限する。
+    - 空きを待つリクエストは max_pending 件まで。待ち時間が queue_timeout 秒を超えたら 503 にする。
+    - 会話履歴のない同じコーパスへの同じ質問 (正規化後) が処理中であれば、新たにモデルを呼び出さずにその結果を共有する。
+    """
+
+    def __init__(self, registry, default_corpus, max_concurrent_calls=MAX_CONCURRENT_CALLS,
+                 max_pending=MAX_PENDING_REQUESTS, queue_timeout=QUEUE_TIMEOUT, model_timeout=MODEL_TIMEOUT):
+        self.registry = registry
+        self.default_corpus = default_corpus
+        self.max_concurrent_calls = max(1, max_concurrent_calls)
+        self.max_pending = max_pending
+        self.queue_timeout = queue_timeout
+        self.model_timeout = model_timeout
+        self._semaphore = asyncio.Semaphore(self.max_concurrent_calls)
+        # スレッド数を同時実行数と同じにするので、タイムアウトしたモデル呼び出しが裏で続いていても上限を超えない
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrent_calls)
+        self._in_flight = {}   # (コーパス, 正規化した質問文) -> 処理中の asyncio.Future
+        self._pending = 0
+        self._running = 0
+        self.counts = {
+            'requests': 0,         # /ask のリクエスト数
+            'answered': 0,         # 回答を返した数
+            'model_calls': 0,      # モデル (またはキャッシュ・検索) の処理を実行した数
+            'coalesced': 0,        # 処理中の同じ質問の結果を共有した数
+            'cached': 0,           # 回答キャッシュから返した数
+            'rejected': 0,         # 待ちが多すぎて 503 を返した数
+            'queue_timeouts': 0,   # 空きを待つ間にタイムアウトした数
+            'model_timeouts': 0,   # モデル呼び出しがタイムアウトした数
+            'errors': 0,           # モデル呼び出しが失敗した数
+        }
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.registry.close()
+
+    def stats(self):
+        result = dict(self.counts)
+        result.update({'running': self._running, 'pending': self._pending, 'in_flight_questions': len(self._in_flight)})
+        # 読み込み済みのコーパスの回答キャッシュの合計 (同じFAQデータを使うコーパスは1つのキャッシュを共有する)
+        caches = {id(answerer.answer_cache): answerer.answer_cache for _, answerer in self.registry.loaded()
+                  if answerer.answer_cache is not None}
+        if caches:
+            result['answer_cache'] = {'hits': sum(cache.hits for cache in caches.values()),
+                                      'misses': sum(cache.misses for cache in caches.values()),
+                                      'entries': sum(len(cache) for cache in caches.values())}
+        result['corpora'] = self.registry.status()
+        return result
+
+    def health(self):
+        loaded = dict(self.registry.loaded())
+        corpora = self.registry.status()
+        for name, status in corpora.items():
+            if name in loaded:
+                status['faq_count'] = len(loaded[name].faq_data)
+        default = loaded.get(self.default_corpus)
+        return {'status': 'ok', 'faq_count': len(default.faq_data) if default is not None else None,
+                'mode': default.mode if default is not None else None, 'default_corpus': self.default_corpus,
+                'corpora': corpora}
+
+    async def evict_idle_corpora(self, interval=CORPUS_EVICT_INTERVAL):
+        """interval 秒ごとに、使われていないコーパスを解放する (停止されるまで続ける)。"""
+        while True:
+            await asyncio.sleep(interval)
+            for name in self.registry.evict_idle():
+                print(f"使われていないコーパス {name} を解放しました。")
+
+    async def ask(self, question, history=None, corpus=None):
+        """
+        質問に回答する。
+
+        Args:
+            question (str): ユーザーの質問。
+            history (list[dict] | None): それまでの会話 [{'question', 'answer'}, ...] (古い順)。
+            corpus (str | None): 回答に使うコーパスの名前。Noneの場合は default_corpus。
+
+        Returns:
+            dict: FaqAnswerer.answer() の結果に 'coalesced' (処理中の同じ質問の結果を共有したか) を加えたもの。
+
+        Raises:
+            ServiceError: 混雑・タイムアウト・コーパスの読み込みやモデル呼び出しの失敗の場合。
+        """
+        self.counts['requests'] += 1
+        corpus = corpus or self.default_corpus
+        if history:
+            result = await self._call(corpus, question, history)
+            return dict(result, coalesced=False)
+
+        key = (corpus, normalize_question(question))
+        shared = self._in_flight.get(key)
+        if shared is not None:
+            self.counts['coalesced'] += 1
+            result = await asyncio.shield(shared)
+            return dict(result, coalesced=True)
+
+        shared = asyncio.get_running_loop().create_future()
+        # 共有する相手がいないまま失敗した場合に「例外が取得されなかった」警告を出さないようにする
+        shared.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._in_flight[key] = shared
+        try:
+            result = await self._call(corpus, question, None)
+            shared.set_result(result)
+            return dict(result, coalesced=False)
+        except BaseException as e:
+            shared.set_exception(e if isinstance(e, Exception) else ServiceError(HTTPStatus.SERVICE_UNAVAILABLE, "処理が中断されました。"))
+            raise
+        finally:
+            del self._in_flight[key]
+
+    def _answer(self, corpus, question, history):
+        # スレッドプールで実行する (コーパスが読み込まれていなければ、ここで読み込む)
+        try:
+            answerer = self.registry.get(corpus)
+        except Exception as e:
+            raise ServiceError(HTTPStatus.SERVICE_UNAVAILABLE, f"コーパス {corpus} を読み込めませんでした: {e}")
+        return answerer.answer(question, history)
+
+    async def _call(self, corpus, question, history):
+        if self._pending >= self.max_pending:
+            self.counts['rejected'] += 1
+            raise ServiceError(HTTPStatus.SERVICE_UNAVAILABLE, "混雑しているため受け付けられませんでした。時間をおいて再度お試しください。")
+        self._pending += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.counts['queue_timeouts'] += 1
+            raise ServiceError(HTTPStatus.SERVICE_UNAVAILABLE, "混雑しているため、待ち時間内に処理できませんでした。")
+        finally:
+            self._pending -= 1
+
+        self._running += 1
+        self.counts['model_calls'] += 1
+        try:
+            loop = asyncio.get_running_loop()
+            call = loop.run_in_executor(self._executor, self._answer, corpus, question, history)
+            result = await asyncio.wait_for(call, self.model_timeout)
+        except asyncio.TimeoutError:
+            self.counts['model_timeouts'] += 1
+            raise ServiceError(HTTPStatus.GATEWAY_TIMEOUT, "モデルの応答がタイムアウトしました。")
+        except ServiceError:
+            raise
+        except Exception as e:
+            self.counts['errors'] += 1
+            status = HTTPStatus.TOO_MANY_REQUESTS if is_rate_limit_error(e) else HTTPStatus.BAD_GATEWAY
+            raise ServiceError(status, f"モデルの呼び出しに失敗しました: {e}")
+        finally:
+            self._running -= 1
+            self._semaphore.release()
+        if result['cached']:
+            self.counts['cached'] += 1
+        return result
+
+    # --- HTTP ---
+
+    async def handle_connection(self, reader, writer):
+        """1つのクライアント接続を処理する (Keep-Alive で複数のリクエストを受け付ける)。"""
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(_read_request(reader), KEEPALIVE_TIMEOUT)
+                except ServiceError as e:
+                    _write_response(writer, e.status, {'error': e.message}, keep_alive=False)
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+                method, path, headers, body, keep_alive = request
+                status, payload = await self.dispatch(method, path, body)
+                _write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, method, path, body):
+        """
+        リクエストを処理して (HTTPステータス, JSONにする辞書) を返す。
+        /metrics の場合は、辞書の代わりに Prometheus のテキスト形式の文字列を返す。
+
+        - POST /ask    {"question": "...", "history": [{"question": "...", "answer": "..."}, ...], "corpus": "..."}
+        - GET  /health
+        - GET  /stats
+        - GET  /metrics  (モデルの呼び出し回数・応答時間・トークン数など)
+        """
+        path = path.split('?', 1)[0]
+        if path == '/metrics':
+            if method != 'GET':
+                return HTTPStatus.METHOD_NOT_ALLOWED, {'error': "GET を使用してください。"}
+            return HTTPStatus.OK, metrics.REGISTRY.render_prometheus()
+        if path == '/health':
+            if method != 'GET':
+                return HTTPStatus.METHOD_NOT_ALLOWED, {'error': "GET を使用してください。"}
+            return HTTPStatus.OK, self.health()
+        if path == '/stats':
+            if method != 'GET':
+                return HTTPStatus.METHOD_NOT_ALLOWED, {'error': "GET を使用してください。"}
+            return HTTPStatus.OK, self.stats()
+        if path != '/ask':
+            return HTTPStatus.NOT_FOUND, {'error': f"{path} は見つかりません。"}
+        if method != 'POST':
+            return HTTPStatus.METHOD_NOT_ALLOWED, {'error': "POST を使用してください。"}
+
+        try:
+            data = json.loads(body.decode('utf-8') or 'null')
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            return HTTPStatus.BAD_REQUEST, {'error': "リクエストボディが正しいJSONではありません。"}
+        question = data.get('question') if isinstance(data, dict) else None
+        if not isinstance(question, str) or not question.strip():
+            return HTTPStatus.BAD_REQUEST, {'error': "'question' (文字列) を指定してください。"}
+        if len(question) > MAX_QUESTION_CHARS:
+            return HTTPStatus.BAD_REQUEST, {'error': f"質問は {MAX_QUESTION_CHARS} 文字以内にしてください。"}
+        history = data.get('history') or None
+        if history is not None and (not isinstance(history, list) or not all(isinstance(turn, dict) for turn in history)):
+            return HTTPStatus.BAD_REQUEST, {'error': "'history' は {\"question\", \"answer\"} のリストで指定してください。"}
+        corpus = data.get('corpus') or None
+        if corpus is not None and (not isinstance(corpus, str) or corpus not in self.registry.corpora):
+            return HTTPStatus.BAD_REQUEST, {'error': "'corpus' には定義済みのコーパスの名前を指定してください。"
+                                                     f"(定義済み: {', '.join(sorted(self.registry.corpora))})"}
+
+        try:
+            result = await self.ask(question.strip(), history, corpus)
+        except ServiceError as e:
+            return e.status, {'error': e.message}
+        self.counts['answered'] += 1
+        return HTTPStatus.OK, result
+
+
+async def _read_request(reader):
+    """
+    HTTP/1.x のリクエストを1つ読み込む。
+
+    Returns:
+        tuple | None: (メソッド, パス, ヘッダー (小文字のキー), ボディ, keep_alive)。接続が閉じられた場合はNone。
+
+    Raises:
+        ServiceError: リクエストの形式が正しくない場合や、ボディが大きすぎる場合。
+    """
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    try:
+        method, path, version = request_line.decode('latin-1').split()
+    except ValueError:
+        raise ServiceError(HTTPStatus.BAD_REQUEST, "リクエスト行の形式が正しくありません。")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if not line:
+            raise asyncio.IncompleteReadError(line, None)
+        if line in (b'\r\n', b'\n'):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get('content-length', '0'))
+    except ValueError:
+        raise ServiceError(HTTPStatus.BAD_REQUEST, "Content-Length が正しくありません。")
+    if length > MAX_BODY_BYTES:
+        raise ServiceError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "リクエストボディが大きすぎます。")
+    body = await reader.readexactly(length) if length > 0 else b''
+
+    connection = headers.get('connection', '').lower()
+    keep_alive = connection != 'close' if version == 'HTTP/1.1' else connection == 'keep-alive'
+    return method.upper(), path, headers, body, keep_alive
+
+
+def _write_response(writer, status, payload, keep_alive):
+    if isinstance(payload, str):
+        body, content_type = payload.encode('utf-8'), "text/plain; version=0.0.4; charset=utf-8"
+    else:
+        body, content_type = json.dumps(payload, ensure_ascii=False).encode('utf-8'), "application/json; charset=utf-8"
+    status = HTTPStatus(status)
+    head = (f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    writer.write(head.encode('latin-1') + body)
+
+
+async def serve(service, host=SERVER_HOST, port=SERVER_PORT):
+    """サービスを HTTP サーバーとして起動し、停止されるまで処理を続ける。"""
+    server = await asyncio.start_server(service.handle_connection, host, port)
+    print(f"Q&A サーバーを起動しました: http://{host}:{port}/ask (停止するには Ctrl-C)")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="FAQデータに基づいて質問に回答する JSON over HTTP サーバー")
+    parser.add_argument("--host", default=SERVER_HOST, help=f"待ち受けるアドレス (デフォルト: {SERVER_HOST})")
+    parser.add_argument("--port", type=int, default=SERVER_PORT, help=f"待ち受けるポート (デフォルト: {SERVER_PORT})")
+    parser.add_argument("--corpus", help="'corpus' を指定しない質問に使うコーパスの名前 (デフォルト: corpus.DEFAULT_CORPUS)")
+    parser.add_argument("--corpora-file", help="コーパスの定義ファイル (デフォルト: あれば corpus.CORPORA_FILE)")
+    parser.add_argument("--data", help="デフォルトのコーパスのFAQデータファイル (定義ファイルの設定より優先する)")
+    parser.add_argument("--mode", choices=qa_app.CONTEXT_MODES, default=SERVER_CONTEXT_MODE,
+                        help=f"FAQ情報の渡し方 (デフォルト: {SERVER_CONTEXT_MODE})")
+    parser.add_argument("--engine", choices=qa_app.RETRIEVAL_ENGINES, default=qa_app.RETRIEVAL_ENGINE,
+                        help=f"retrieval モードの検索方法 (デフォルト: {qa_app.RETRIEVAL_ENGINE})")
+    parser.add_argument("--top-k", type=int, default=qa_app.RETRIEVAL_TOP_K,
+                        help=f"retrieval モードで1回の質問に含めるFAQの件数 (デフォルト: {qa_app.RETRIEVAL_TOP_K})")
+    parser.add_argument("--backend", choices=MODEL_BACKENDS, default=qa_app.MODEL_BACKEND,
+                        help=f"モデルのバックエンド (デフォルト: {qa_app.MODEL_BACKEND})。fake はAPIを呼び出さない")
+    parser.add_argument("--fake-latency", type=float, default=0.0,
+                        help="fake バックエンドの1回の応答にかかる秒数 (負荷試験用)")
+    parser.add_argument("--max-concurrency", type=int, default=MAX_CONCURRENT_CALLS,
+                        help=f"同時に実行するモデル呼び出しの最大数 (デフォルト: {MAX_CONCURRENT_CALLS})")
+    parser.add_argument("--max-pending", type=int, default=MAX_PENDING_REQUESTS,
+                        help=f"モデル呼び出しの空きを待てるリクエストの最大数 (デフォルト: {MAX_PENDING_REQUESTS})")
+    parser.add_argument("--queue-timeout", type=float, default=QUEUE_TIMEOUT,
+                        help=f"モデル呼び出しの空きを待つ最大秒数 (デフォルト: {QUEUE_TIMEOUT})")
+    parser.add_argument("--model-timeout", type=float, default=MODEL_TIMEOUT,
+                        help=f"1回のモデル呼び出しを待つ最大秒数 (デフォルト: {MODEL_TIMEOUT})")
+    parser.add_argument("--no-cache", dest="cache", action="store_false", default=qa_app.ANSWER_CACHE_ENABLED,
+                        help="回答キャッシュを使わない")
+    parser.add_argument("--no-artifact", dest="artifact", action="store_false", default=qa_app.USE_ARTIFACT,
+                        help="アーティファクト (artifact.py) を使わず、FAQデータファイルから準備する")
+    parser.add_argument("--passages", action="store_true", default=qa_app.PASSAGE_CHUNKING,
+                        help="長いFAQの回答をパッセージに分割し、関連するパッセージだけをプロンプトに含める")
+    parser.add_argument("--max-loaded-corpora", type=int, default=MAX_LOADED_CORPORA,
+                        help=f"同時に読み込んでおくコーパスの最大数 (デフォルト: {MAX_LOADED_CORPORA})")
+    parser.add_argument("--corpus-idle-seconds", type=float, default=CORPUS_IDLE_SECONDS,
+                        help=f"この秒数のあいだ使われなかったコーパスを解放する。0 の場合は解放しない "
+                             f"(デフォルト: {CORPUS_IDLE_SECONDS})")
+    args = parser.parse_args()
+
+    try:
+        corpora = load_corpora(args.corpora_file, qa_app.FAQ_DATA_FILE)
+        default_config = select_corpus(corpora, args.corpus)
+    except (IOError, OSError, ValueError) as e:
+        print(f"エラー: コーパスの設定を読み込めませんでした。\n{e}")
+        sys.exit(1)
+    if args.data:
+        corpora[default_config.name] = CorpusConfig(default_config.name, args.data, default_config.start_url,
+                                                    default_config.prompt_prefix)
+
+    try:
+        backend = create_backend(args.backend, qa_app.MODEL_NAME, args.fake_latency)
+    except Exception as e:
+        print(f"エラー: モデルのバックエンド ({args.backend}) の初期化に失敗しました。\n{e}")
+        sys.exit(1)
+
+    loader = partial(load_corpus_answerer, backend=backend, mode=args.mode, engine=args.engine, top_k=args.top_k,
+                     use_cache=args.cache, use_artifact=args.artifact, passages=args.passages)
+    registry = CorpusRegistry(corpora, loader, args.max_loaded_corpora, args.corpus_idle_seconds)
+    # デフォルトのコーパスは起動時に読み込み、FAQデータの問題があればここで終了する (他のコーパスは最初の質問で読み込む)
+    try:
+        registry.get(default_config.name)
+    except ValueError as e:
+        print(f"エラー: コーパス {default_config.name}: {e} FAQデータを確認してください。")
+        sys.exit(1)
+
+    async def main():
+        service = QAService(registry, default_config.name, args.max_concurrency, args.max_pending,
+                            args.queue_timeout, args.model_timeout)
+        evictor = asyncio.create_task(service.evict_idle_corpora()) if args.corpus_idle_seconds > 0 else None
+        try:
+            await serve(service, args.host, args.port)
+        finally:
+            if evictor is not None:
+                evictor.cancel()
+            service.close()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("\nQ&A サーバーを停止しました。")
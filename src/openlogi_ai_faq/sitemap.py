@@ -0,0 +1,144 @@
+# src/openlogi_ai_faq/sitemap.py (robots.txt / sitemap.xml からのURL収集)
+import gzip
+from datetime import datetime, timezone
+from urllib.parse import urljoin
+
+import lxml.etree
+import requests
+
+# 1回のクロールで読み込むサイトマップファイル数の上限 (サイトマップインデックスの入れ子を含む)
+SITEMAP_MAX_FILES = 200
+
+# 外部エンティティやネットワークアクセスを無効にしたXMLパーサー
+_XML_PARSER = lxml.etree.XMLParser(resolve_entities=False, no_network=True, huge_tree=True)
+
+
+def _localname(element):
+    return lxml.etree.QName(element).localname
+
+
+def _child_text(element, name):
+    for child in element:
+        if isinstance(child.tag, str) and _localname(child) == name:
+            return (child.text or '').strip()
+    return ''
+
+
+def parse_lastmod(value):
+    """
+    サイトマップの lastmod (W3C Datetime 形式) を datetime に変換する。
+    日付のみの場合は 00:00 UTC、タイムゾーンがない場合は UTC とみなす。解析できない場合はNone。
+    """
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.strip())
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def parse_sitemap(content):
+    """
+    サイトマップ (urlset) またはサイトマップインデックス (sitemapindex) を解析する。
+    gzip 圧縮されたデータ (.xml.gz) もそのまま渡せる。
+
+    Returns:
+        tuple[str, list[tuple[str, str]]]: ('urlset' または 'sitemapindex', [(loc, lastmod), ...])。
+                                           解析できない場合は ('', [])。
+    """
+    if content[:2] == b'\x1f\x8b':
+        try:
+            content = gzip.decompress(content)
+        except (OSError, EOFError):
+            return '', []
+    try:
+        root = lxml.etree.fromstring(content, parser=_XML_PARSER)
+    except lxml.etree.XMLSyntaxError:
+        return '', []
+
+    kind = _localname(root)
+    if kind not in ('urlset', 'sitemapindex'):
+        return '', []
+    item_name = 'url' if kind == 'urlset' else 'sitemap'
+    entries = []
+    for item in root:
+        if isinstance(item.tag, str) and _localname(item) == item_name:
+            loc = _child_text(item, 'loc')
+            if loc:
+                entries.append((loc, _child_text(item, 'lastmod')))
+    return kind, entries
+
+
+def _get(url, fetcher):
+    if fetcher is not None:
+        response = fetcher.get(url)
+    else:
+        response = requests.get(url, timeout=20)
+    response.raise_for_status()
+    return response
+
+
+def find_sitemap_urls(start_url, fetcher=None):
+    """
+    robots.txt の Sitemap: 行からサイトマップのURLを探す。
+    robots.txt にない場合は /sitemap.xml を候補として返す。
+    fetcher (Fetcher) が渡された場合は、それを使って取得する。
+    """
+    robots_url = urljoin(start_url, '/robots.txt')
+    sitemap_urls = []
+    try:
+        response = _get(robots_url, fetcher)
+        for line in response.text.splitlines():
+            key, _, value = line.partition(':')
+            if key.strip().lower() == 'sitemap' and value.strip():
+                sitemap_urls.append(urljoin(robots_url, value.strip()))
+    except requests.exceptions.RequestException:
+        pass
+    if not sitemap_urls:
+        sitemap_urls.append(urljoin(start_url, '/sitemap.xml'))
+    return sitemap_urls
+
+
+def collect_sitemap_entries(start_url, fetcher=None, max_files=SITEMAP_MAX_FILES):
+    """
+    開始URLのサイトの robots.txt とサイトマップ (インデックス・gzip圧縮を含む) をたどり、
+    ページURLと lastmod の一覧を集める。
+
+    Returns:
+        list[tuple[str, str]]: [(ページURL, lastmod文字列), ...]。サイトマップがない場合は空のリスト。
+    """
+    pending = find_sitemap_urls(start_url, fetcher)
+    seen_sitemaps = set()
+    entries = []
+    seen_pages = set()
+    while pending and len(seen_sitemaps) < max_files:
+        sitemap_url = pending.pop(0)
+        if sitemap_url in seen_sitemaps:
+            continue
+        seen_sitemaps.add(sitemap_url)
+        try:
+            response = _get(sitemap_url, fetcher)
+        except requests.exceptions.RequestException as e:
+            if e.response is None or e.response.status_code != 404:
+                print(f"警告: サイトマップの取得に失敗しました - {sitemap_url}\n{e}")
+            continue
+
+        kind, items = parse_sitemap(response.content)
+        if not kind:
+            print(f"警告: サイトマップの形式が正しくありません - {sitemap_url}")
+            continue
+        for loc, lastmod in items:
+            loc = urljoin(sitemap_url, loc)
+            if kind == 'sitemapindex':
+                pending.append(loc)
+            elif loc not in seen_pages:
+                seen_pages.add(loc)
+                entries.append((loc, lastmod))
+
+    pending = [url for url in pending if url not in seen_sitemaps]
+    if pending:
+        print(f"警告: サイトマップファイル数の上限 ({max_files}) に達したため、残り {len(pending)} 件は読み込みませんでした。")
+    return entries
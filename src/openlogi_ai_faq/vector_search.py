@@ -0,0 +1,257 @@
+# src/openlogi_ai_faq/vector_search.py (ハッシュ化した文字 n-gram の TF-IDF ベクトルによるFAQ検索)
+import argparse
+import json
+import os
+import sys
+import zlib
+from collections import Counter
+
+import numpy as np
+
+from .faq_io import DEFAULT_FAQ_FILENAME, write_json_atomic
+from .retrieval import NGRAM_SIZE, QUESTION_WEIGHT, TOP_K, file_hash, tokenize
+
+# ベクトル行列 (.npy) とメタデータ (.json) のファイルの接尾辞 (FAQデータファイルと同じ場所に保存する)
+MATRIX_SUFFIX = ".vectors.npy"
+META_SUFFIX = ".vectors.json"
+# 形式のバージョン (形式を変えたら上げる。古いファイルは作り直される)
+VECTOR_VERSION = 1
+# ベクトルの次元数 (語をハッシュ値でこの数のバケットに振り分ける)。
+# 行列のサイズは レコード数 x VECTOR_DIM x 4 バイト (10万件・1024次元で約400MB)
+VECTOR_DIM = 1024
+# 行列を作成するときに一度に書き込むレコード数
+BUILD_CHUNK_ROWS = 4096
+
+
+def _bucket_counts(text_weights, dim, ngram_size):
+    """[(テキスト, 重み), ...] の語をハッシュしてバケットごとの出現回数を数える。"""
+    counts = Counter()
+    for text, weight in text_weights:
+        for token in tokenize(text, ngram_size):
+            # Python の hash() はプロセスごとに値が変わるため、crc32 を使う
+            counts[zlib.crc32(token.encode('utf-8')) % dim] += weight
+    return counts
+
+
+def _weighted_vector(counts, idf):
+    """バケットごとの出現回数から、L2正規化した TF-IDF ベクトル (float32) を作る。"""
+    vector = np.zeros(len(idf), dtype=np.float32)
+    if counts:
+        buckets = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+        tf = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+        vector[buckets] = (1 + np.log(tf)) * idf[buckets]
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+    return vector
+
+
+def matrix_filename(data_filename):
+    return data_filename + MATRIX_SUFFIX
+
+
+def meta_filename(data_filename):
+    return data_filename + META_SUFFIX
+
+
+class VectorIndex:
+    """
+    FAQごとの TF-IDF ベクトルを並べた float32 行列による検索。
+    各ベクトルはL2正規化されており、クエリベクトルとの行列積1回で全FAQのコサイン類似度が求まる。
+
+    行列は (次元数, レコード数) の向きで持つ。質問文の語が入るバケットはごく一部なので、
+    クエリベクトルが0でない次元の行だけ (それぞれ連続した領域) を読めば済み、
+    メモリマップした大きな行列でも読み込む量が少ない。
+    列番号 (文書番号) は、作成したときの faq_data のリストの位置と一致する。
+    質問・回答・URLのいずれかが欠けているレコードはゼロベクトル (検索されない) になる。
+    """
+
+    def __init__(self, matrix, idf, ngram_size=NGRAM_SIZE, doc_count=None):
+        """
+        Args:
+            matrix (numpy.ndarray): (次元数, レコード数) の float32 行列。np.memmap でもよい。
+            idf (numpy.ndarray): バケットごとの IDF (次元数,)。
+            doc_count (int | None): 検索対象のレコード数。Noneの場合はレコード数とみなす。
+        """
+        self.matrix = matrix
+        self.idf = np.asarray(idf, dtype=np.float32)
+        self.ngram_size = ngram_size
+        self.dim = len(self.idf)
+        self.doc_count = self.record_count if doc_count is None else doc_count
+
+    @property
+    def record_count(self):
+        return self.matrix.shape[1]
+
+    @classmethod
+    def build(cls, faq_data, filename=None, dim=VECTOR_DIM, ngram_size=NGRAM_SIZE, question_weight=QUESTION_WEIGHT):
+        """
+        FAQデータのリストから行列を作成する。
+        filename を指定した場合は、行列を .npy ファイルに直接書き込み (メモリに全体を持たない)、
+        メモリマップとして開いた状態で返す。
+
+        Returns:
+            VectorIndex: 作成したインデックス。
+        """
+        # 1回目: レコードごとのバケット出現回数と、バケットごとの文書頻度を数える
+        doc_counts = []
+        df = np.zeros(dim, dtype=np.int64)
+        for faq in faq_data:
+            if faq.get('question') and faq.get('answer') and faq.get('url'):
+                counts = _bucket_counts([(faq['question'], question_weight), (faq['answer'], 1)], dim, ngram_size)
+                df[np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))] += 1
+            else:
+                counts = None
+            doc_counts.append(counts)
+        doc_count = sum(1 for counts in doc_counts if counts is not None)
+        idf = (np.log((1 + doc_count) / (1 + df)) + 1).astype(np.float32)
+
+        # 2回目: TF-IDF ベクトルを行列の列に書き込む
+        shape = (dim, len(doc_counts))
+        if filename is None:
+            matrix = np.zeros(shape, dtype=np.float32)
+        else:
+            matrix = np.lib.format.open_memmap(filename, mode='w+', dtype=np.float32, shape=shape)
+        for start in range(0, len(doc_counts), BUILD_CHUNK_ROWS):
+            chunk = doc_counts[start:start + BUILD_CHUNK_ROWS]
+            matrix[:, start:start + len(chunk)] = np.array([
+                _weighted_vector(counts, idf) if counts else np.zeros(dim, dtype=np.float32) for counts in chunk
+            ]).reshape(len(chunk), dim).T
+        if filename is not None:
+            matrix.flush()
+
+        return cls(matrix, idf, ngram_size, doc_count)
+
+    def query_vectors(self, queries):
+        """質問文のリストを (質問数, 次元数) のクエリ行列に変換する。"""
+        result = np.zeros((len(queries), self.dim), dtype=np.float32)
+        for i, query in enumerate(queries):
+            result[i] = _weighted_vector(_bucket_counts([(query, 1)], self.dim, self.ngram_size), self.idf)
+        return result
+
+    def search_batch(self, queries, top_k=TOP_K):
+        """
+        複数の質問文をまとめて検索する (行列積1回で全質問のスコアを計算する)。
+
+        Returns:
+            list[list[tuple[int, float]]]: 質問ごとの (文書番号, 類似度) のリスト (類似度の高い順)。
+                                           類似度が0のFAQは含めない。
+        """
+        if not queries or self.record_count == 0 or top_k <= 0:
+            return [[] for _ in queries]
+        query_matrix = self.query_vectors(queries)
+        # いずれかの質問で0でない次元だけを使う (それ以外の行は積に寄与しない)
+        dims = np.flatnonzero(query_matrix.any(axis=0))
+        if len(dims) == 0:
+            return [[] for _ in queries]
+        scores = query_matrix[:, dims] @ self.matrix[dims]   # (質問数, レコード数)
+        k = min(top_k, scores.shape[1])
+        # 全件をソートせず、上位k件だけを取り出してから並べ替える
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for row_scores, candidates in zip(scores, top):
+            candidates = candidates[np.argsort(-row_scores[candidates], kind='stable')]
+            results.append([(int(doc_id), float(row_scores[doc_id])) for doc_id in candidates if row_scores[doc_id] > 0])
+        return results
+
+    def search(self, query, top_k=TOP_K):
+        """
+        質問文に関連するFAQを検索する (retrieval.BM25Index.search と同じ形式)。
+
+        Returns:
+            list[tuple[int, float]]: (文書番号, 類似度) のリスト (類似度の高い順)。
+        """
+        return self.search_batch([query], top_k)[0]
+
+
+def load_index(data_filename, data_hash):
+    """
+    保存済みの行列をメモリマップで開く。
+
+    Returns:
+        VectorIndex | None: FAQデータのハッシュや形式・パラメーターが一致しない場合、
+                            ファイルがない場合や壊れている場合はNone。
+    """
+    try:
+        with open(meta_filename(data_filename), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (json.JSONDecodeError, IOError, OSError) as e:
+        print(f"警告: ベクトルインデックスの読み込みに失敗しました。作り直します - {meta_filename(data_filename)}\n{e}")
+        return None
+    if (not isinstance(meta, dict) or meta.get('version') != VECTOR_VERSION or meta.get('data_hash') != data_hash
+            or meta.get('dim') != VECTOR_DIM or meta.get('ngram_size') != NGRAM_SIZE
+            or meta.get('question_weight') != QUESTION_WEIGHT):
+        return None
+    try:
+        matrix = np.load(matrix_filename(data_filename), mmap_mode='r')
+    except (IOError, OSError, ValueError) as e:
+        print(f"警告: ベクトル行列の読み込みに失敗しました。作り直します - {matrix_filename(data_filename)}\n{e}")
+        return None
+    if matrix.dtype != np.float32 or matrix.shape != (VECTOR_DIM, meta.get('rows')):
+        return None
+    return VectorIndex(matrix, meta['idf'], meta['ngram_size'], meta.get('doc_count'))
+
+
+def load_or_build_index(data_filename, faq_data):
+    """
+    FAQデータファイルに対応するベクトルインデックスを読み込む。
+    ない場合や、FAQデータファイルの内容が変わっている場合は作り直して保存する。
+
+    Args:
+        data_filename (str): FAQデータファイル名 (保存場所と、変更の検出に使う)。
+        faq_data (list[dict]): data_filename から読み込んだFAQデータ。
+
+    Returns:
+        VectorIndex: FAQデータのインデックス。
+    """
+    data_hash = file_hash(data_filename)
+    index = load_index(data_filename, data_hash)
+    if index is not None and index.record_count == len(faq_data):
+        print(f"ベクトルインデックス ({matrix_filename(data_filename)}) を読み込みました。")
+        return index
+
+    filename = matrix_filename(data_filename)
+    # 行列を一時ファイルに書いてから置き換え、最後にメタデータを書く (メタデータがそろって初めて有効になる)
+    tmp_filename = filename + ".tmp.npy"
+    try:
+        index = VectorIndex.build(faq_data, tmp_filename)
+        del index.matrix   # 置き換える前にメモリマップを閉じる
+        os.replace(tmp_filename, filename)
+        write_json_atomic(meta_filename(data_filename), {
+            'version': VECTOR_VERSION,
+            'data_hash': data_hash,
+            'rows': len(faq_data),
+            'dim': VECTOR_DIM,
+            'ngram_size': NGRAM_SIZE,
+            'question_weight': QUESTION_WEIGHT,
+            'doc_count': index.doc_count,
+            'idf': index.idf.tolist(),
+        })
+        index.matrix = np.load(filename, mmap_mode='r')
+    except (IOError, OSError) as e:
+        print(f"警告: ベクトルインデックスの保存に失敗しました。メモリ上で作成します - {filename}\n{e}")
+        return VectorIndex.build(faq_data)
+    print(f"ベクトルインデックスを作成しました。({index.doc_count} 件, {VECTOR_DIM} 次元) -> {filename}")
+    return index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="FAQデータを TF-IDF ベクトルの類似度で検索する (インデックスがなければ作成する)")
+    parser.add_argument("queries", nargs='+', help="検索する質問文 (複数指定するとまとめて検索する)")
+    parser.add_argument("--data", default=DEFAULT_FAQ_FILENAME, help="FAQデータファイル")
+    parser.add_argument("--top-k", type=int, default=TOP_K, help=f"表示する件数 (デフォルト: {TOP_K})")
+    args = parser.parse_args()
+
+    # Q&Aアプリと同じ手順 (重複の除去を含む) で読み込み、インデックスの文書番号を揃える
+    from .qa_app import load_faq_data
+    faq_data = load_faq_data(args.data)
+    if faq_data is None:
+        print(f"エラー: FAQデータの読み込みに失敗しました - {args.data}")
+        sys.exit(1)
+    index = load_or_build_index(args.data, faq_data)
+    for query, hits in zip(args.queries, index.search_batch(args.queries, args.top_k)):
+        print(f"== {query}")
+        for doc_id, score in hits:
+            print(f"{score:7.3f}  {faq_data[doc_id]['question']}  {faq_data[doc_id]['url']}")
@@ -0,0 +1,81 @@
+# tests/test_answer_cache.py (回答キャッシュの無効化・有効期間・LRU)
+import types
+
+import pytest
+
+from openlogi_ai_faq import answer_cache
+from openlogi_ai_faq.answer_cache import AnswerCache
+
+MODEL = "fake/full"
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """answer_cache の time.time() / time.monotonic() を進められる時計に置き換える。"""
+    now = [1_000_000.0]
+    fake_time = types.SimpleNamespace(time=lambda: now[0], monotonic=lambda: now[0])
+    monkeypatch.setattr(answer_cache, 'time', fake_time)
+    return now
+
+
+def make_cache(tmp_path, corpus_hash="hash-1", **kwargs):
+    return AnswerCache(str(tmp_path / "faq.json.answers.json"), corpus_hash, save_interval=0, **kwargs)
+
+
+def test_normalized_question_hits(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put("出荷の締め時間は？", MODEL, "平日 12:00 です。")
+
+    # 全角・半角、大文字・小文字、空白の違いは同じ質問とみなす
+    assert cache.get("出荷の締め時間は?", MODEL)['answer'] == "平日 12:00 です。"
+    cache.put("OpenLogi の料金は？", MODEL, "料金表をご覧ください。")
+    assert cache.get("ＯＰＥＮＬＯＧＩ  の料金は？", MODEL) is not None
+    assert cache.get("出荷の締め時間は？", "fake/retrieval/bm25") is None
+
+
+def test_changed_corpus_hash_discards_entries(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put("出荷の締め時間は？", MODEL, "平日 12:00 です。")
+
+    assert len(make_cache(tmp_path)) == 1
+    reloaded = make_cache(tmp_path, corpus_hash="hash-2")
+    assert len(reloaded) == 0
+    assert reloaded.get("出荷の締め時間は？", MODEL) is None
+
+
+def test_expired_answer_is_removed(tmp_path, clock):
+    cache = make_cache(tmp_path, ttl=60)
+    cache.put("出荷の締め時間は？", MODEL, "平日 12:00 です。")
+
+    clock[0] += 59
+    assert cache.get("出荷の締め時間は？", MODEL) is not None
+    clock[0] += 2
+    assert cache.get("出荷の締め時間は？", MODEL) is None
+    assert len(cache) == 0
+    assert cache.evictions == 1
+
+
+def test_least_recently_used_answer_is_evicted(tmp_path):
+    cache = make_cache(tmp_path, max_entries=2)
+    cache.put("質問A", MODEL, "回答A")
+    cache.put("質問B", MODEL, "回答B")
+    # A を参照したので、次に追加したときに削除されるのは B
+    assert cache.get("質問A", MODEL) is not None
+    cache.put("質問C", MODEL, "回答C")
+
+    assert cache.get("質問B", MODEL) is None
+    assert cache.get("質問A", MODEL) is not None
+    assert cache.get("質問C", MODEL) is not None
+    assert cache.evictions == 1
+    # 保存したファイルにも上限までしか残らない
+    assert len(make_cache(tmp_path, max_entries=2)) == 2
+
+
+def test_flush_saves_pending_answers(tmp_path, clock):
+    cache = AnswerCache(str(tmp_path / "faq.json.answers.json"), "hash-1", save_interval=60)
+    cache.put("質問A", MODEL, "回答A")   # 最初の追加は保存される
+    cache.put("質問B", MODEL, "回答B")   # 間隔内なので保存を遅らせる
+    assert len(make_cache(tmp_path)) == 1
+
+    cache.flush()
+    assert len(make_cache(tmp_path)) == 2
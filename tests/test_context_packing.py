@@ -0,0 +1,42 @@
+# tests/test_context_packing.py (トークン数の見積もりの補正)
+from openlogi_ai_faq.context_packing import (CALIBRATION_MIN_SAMPLES, UNCALIBRATED_SCALE, TokenEstimator,
+                                             heuristic_tokens)
+from openlogi_ai_faq.qa_app import calibrate_token_counts
+
+RECORDS = [{'question': f"質問{i}", 'answer': f"回答{i}です。" * 5, 'url': f"https://help.example.com/{i}"}
+           for i in range(CALIBRATION_MIN_SAMPLES + 3)]
+
+
+def test_uncalibrated_estimate_is_conservative(tmp_path):
+    estimator = TokenEstimator("model", str(tmp_path / "faq.json.tokens.json"))
+
+    assert not estimator.calibrated
+    assert estimator.estimate("入荷予定の登録方法") == round(heuristic_tokens("入荷予定の登録方法") * UNCALIBRATED_SCALE)
+
+
+def test_calibrate_token_counts_measures_and_caches(tmp_path):
+    filename = str(tmp_path / "faq.json.tokens.json")
+    calls = []
+
+    def counter(text):
+        calls.append(text)
+        return len(text)
+
+    assert calibrate_token_counts(TokenEstimator("model", filename), RECORDS, counter)
+    estimator = TokenEstimator("model", filename)
+    assert estimator.calibrated
+    assert estimator.scale != UNCALIBRATED_SCALE
+    # 実測値があれば、次回は実測しない
+    measured = len(calls)
+    assert calibrate_token_counts(estimator, RECORDS, counter)
+    assert len(calls) == measured
+
+
+def test_failed_calibration_keeps_conservative_scale(tmp_path, capsys):
+    def counter(text):
+        raise RuntimeError("count_tokens is unavailable")
+
+    estimator = TokenEstimator("model", str(tmp_path / "faq.json.tokens.json"))
+    assert not calibrate_token_counts(estimator, RECORDS, counter)
+    assert estimator.scale == UNCALIBRATED_SCALE
+    assert "警告: トークン数の実測値がないため" in capsys.readouterr().out
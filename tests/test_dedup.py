@@ -0,0 +1,60 @@
+# tests/test_dedup.py (MinHash と LSH による重複に近いFAQのまとめ方)
+import json
+
+import numpy as np
+
+from openlogi_ai_faq.dedup import MINHASH_PERMUTATIONS, dedup_records, find_duplicates, minhash_signature
+from openlogi_ai_faq.qa_app import load_faq_data
+
+ANSWER = ("OpenLogi では、倉庫への入荷予定を管理画面の「入荷」メニューから登録できます。"
+          "商品コードと数量を入力し、入荷予定日を選んで登録ボタンを押してください。")
+SAME_ANSWER = [
+    {'question': "入荷予定の登録方法は？", 'answer': ANSWER, 'url': "https://help.example.com/inbound/1"},
+    {'question': "入荷予定の登録方法は?", 'answer': ANSWER, 'url': "https://help.example.com/faq/1"},
+]
+# 料金だけが異なるFAQ (プランごとのページなど)
+FEE_TEMPLATE = ("保管料は1パレットあたり月額{fee}円です。保管期間が1か月に満たない場合も1か月分として計算し、"
+                "毎月末日の在庫数をもとに翌月に請求します。詳しくは料金表のページをご覧ください。")
+PRICE_VARIANTS = [
+    {'question': "保管料はいくらですか？", 'answer': FEE_TEMPLATE.format(fee="3,000"), 'url': "https://help.example.com/fee/a"},
+    {'question': "保管料はいくらですか？", 'answer': FEE_TEMPLATE.format(fee="3,500"), 'url': "https://help.example.com/fee/b"},
+]
+OTHER = {'question': "出荷の締め時間は？", 'answer': "平日 12:00 までのご依頼は当日出荷します。", 'url': "https://help.example.com/2"}
+
+
+def similarity(a, b):
+    return np.count_nonzero(minhash_signature(a) == minhash_signature(b)) / MINHASH_PERMUTATIONS
+
+
+def test_signature_similarity_tracks_text_overlap():
+    assert similarity(ANSWER, ANSWER) == 1.0
+    assert similarity(FEE_TEMPLATE.format(fee="3,000"), FEE_TEMPLATE.format(fee="3,500")) >= 0.8
+    assert similarity(ANSWER, OTHER['answer']) < 0.2
+
+
+def test_same_answer_at_several_urls_is_merged():
+    faq_data, report = dedup_records(SAME_ANSWER + [OTHER])
+
+    assert [faq['url'] for faq in faq_data] == ["https://help.example.com/inbound/1", OTHER['url']]
+    assert faq_data[0]['alternate_urls'] == ["https://help.example.com/faq/1"]
+    assert (report.before, report.after, report.clusters) == (3, 2, 1)
+
+
+def test_price_variants_are_kept():
+    faq_data, report = dedup_records(PRICE_VARIANTS)
+
+    assert faq_data == PRICE_VARIANTS
+    assert report.removed == 0
+    # 回答の違いを無視すると、類似度だけでまとめられてしまう
+    assert find_duplicates(PRICE_VARIANTS, same_answer=False)[0] == {0: [1]}
+
+
+def test_load_keeps_price_variants(tmp_path):
+    data_file = tmp_path / "faq.json"
+    data_file.write_text(json.dumps(PRICE_VARIANTS + SAME_ANSWER, ensure_ascii=False), encoding='utf-8')
+
+    faq_data = load_faq_data(str(data_file), dedup=True)
+    assert [faq['answer'] for faq in faq_data] == [faq['answer'] for faq in PRICE_VARIANTS] + [ANSWER]
+    # 2回目は検出結果のキャッシュから同じ結果になる
+    assert (tmp_path / "faq.json.dedup.json").exists()
+    assert load_faq_data(str(data_file), dedup=True) == faq_data
@@ -0,0 +1,24 @@
+# tests/test_extract_parity.py (解析バックエンド 'html.parser' と 'lxml' の抽出結果の一致)
+import glob
+import os
+
+import pytest
+
+from openlogi_ai_faq import crawler
+from openlogi_ai_faq.benchmark import load_html_fixtures
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+FIXTURES = load_html_fixtures(sorted(glob.glob(os.path.join(FIXTURE_DIR, "*.html"))))
+
+
+@pytest.mark.parametrize("url, html", FIXTURES, ids=[os.path.basename(url) for url, _ in FIXTURES])
+def test_lxml_matches_html_parser(url, html):
+    assert crawler.extract_page(html, url, 'html.parser') == crawler.extract_page(html, url, 'lxml')
+
+
+def test_fixtures_cover_faq_and_non_faq_pages():
+    # 両方とも None になるだけの比較にならないよう、FAQページとFAQでないページの両方があることを確認する
+    faq_infos = {os.path.basename(url): crawler.extract_page(html, url, 'html.parser')[0] for url, html in FIXTURES}
+    assert faq_infos["faq_page.html"] is not None
+    assert faq_infos["edge_markup.html"] is not None
+    assert faq_infos["non_faq_page.html"] is None
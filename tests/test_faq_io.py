@@ -0,0 +1,38 @@
+# tests/test_faq_io.py (FAQデータファイルの読み書き)
+import json
+
+from openlogi_ai_faq.faq_io import convert_faq_file, iter_faq_records
+
+RECORDS = [
+    {'question': "入荷予定の登録方法は？", 'answer': "「入荷」メニューから登録します。", 'url': "https://help.example.com/1"},
+    {'question': "出荷の締め時間は？", 'answer': "平日 12:00 です。", 'url': "https://help.example.com/2"},
+]
+
+
+def test_convert_between_json_and_jsonl(tmp_path):
+    src = tmp_path / "faq.json"
+    src.write_text(json.dumps(RECORDS, ensure_ascii=False), encoding='utf-8')
+
+    assert convert_faq_file(str(src), str(tmp_path / "faq.jsonl")) == 2
+    assert len((tmp_path / "faq.jsonl").read_text(encoding='utf-8').splitlines()) == 2
+    assert convert_faq_file(str(tmp_path / "faq.jsonl"), str(tmp_path / "back.json")) == 2
+    assert json.loads((tmp_path / "back.json").read_text(encoding='utf-8')) == RECORDS
+
+
+def test_convert_onto_itself_keeps_records(tmp_path):
+    for name in ("faq.json", "faq.jsonl"):
+        path = tmp_path / name
+        path.write_text(json.dumps(RECORDS, ensure_ascii=False), encoding='utf-8')
+
+        assert convert_faq_file(str(path), str(path)) == 2
+        assert list(iter_faq_records(str(path))) == RECORDS
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["faq.json", "faq.jsonl"]  # 一時ファイルが残らない
+
+
+def test_convert_keeps_file_mode(tmp_path):
+    path = tmp_path / "faq.json"
+    path.write_text(json.dumps(RECORDS, ensure_ascii=False), encoding='utf-8')
+    path.chmod(0o644)
+
+    convert_faq_file(str(path), str(path))
+    assert path.stat().st_mode & 0o777 == 0o644
@@ -0,0 +1,61 @@
+# tests/test_frontier.py (URLキューの重複排除と優先度順)
+from openlogi_ai_faq.frontier import UrlFrontier
+
+BASE = "https://help.example.com"
+PATTERNS = [(r'faq', 2.0), (r'/(search|tags?)(/|$)', -2.0)]
+
+
+def drain(frontier):
+    urls = []
+    while frontier:
+        urls.append(frontier.pop())
+    return urls
+
+
+def test_duplicates_are_skipped():
+    frontier = UrlFrontier()
+    assert frontier.push(f"{BASE}/a")
+    assert not frontier.push(f"{BASE}/a")
+    frontier.mark_seen(f"{BASE}/b")
+    assert not frontier.push(f"{BASE}/b")
+
+    assert drain(frontier) == [f"{BASE}/a"]
+    # 取り出した後も追加済みとして扱う
+    assert not frontier.push(f"{BASE}/a")
+    assert frontier.stats() == {'queued': 0, 'enqueued': 1, 'duplicates': 3, 'max_size': 1}
+
+
+def test_fifo_keeps_insertion_order():
+    frontier = UrlFrontier(patterns=PATTERNS)
+    urls = [f"{BASE}/search", f"{BASE}/faq/1", f"{BASE}/about"]
+    for url in urls:
+        frontier.push(url)
+
+    assert frontier.pending_urls() == urls
+    assert drain(frontier) == urls
+
+
+def test_priority_prefers_faq_like_paths():
+    frontier = UrlFrontier(priority=True, patterns=PATTERNS)
+    for url in [f"{BASE}/search", f"{BASE}/about", f"{BASE}/faq/1", f"{BASE}/faq/2"]:
+        frontier.push(url)
+
+    # 加点が同じURLは追加順
+    assert frontier.pending_urls() == [f"{BASE}/faq/1", f"{BASE}/faq/2", f"{BASE}/about", f"{BASE}/search"]
+    assert drain(frontier) == [f"{BASE}/faq/1", f"{BASE}/faq/2", f"{BASE}/about", f"{BASE}/search"]
+
+
+def test_priority_follows_parent_hit_rate():
+    frontier = UrlFrontier(priority=True, parent_weight=1.0)
+    for parent in ("dead", "hub"):
+        for i in range(3):
+            frontier.push(f"{BASE}/{parent}/{i}", parent=f"{BASE}/{parent}")
+
+    # 的中率が同じ間は追加順。dead からの最初のリンクはFAQでなかった
+    first = frontier.pop()
+    assert first == f"{BASE}/dead/0"
+    frontier.record_result(first, False)
+
+    # 的中率が下がった dead のリンクは、後から追加された hub のリンクより後に回される
+    assert drain(frontier) == [f"{BASE}/hub/0", f"{BASE}/hub/1", f"{BASE}/hub/2", f"{BASE}/dead/1", f"{BASE}/dead/2"]
+    assert frontier.parent_hit_rate(f"{BASE}/dead") < frontier.parent_hit_rate(f"{BASE}/hub")
@@ -0,0 +1,46 @@
+# tests/test_qa_cache.py (Q&Aアプリの回答キャッシュ。偽モデルで対話アプリを実行する)
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from openlogi_ai_faq.faq_io import DEFAULT_FAQ_FILENAME
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+RECORDS = [
+    {'question': "入荷予定の登録方法は？", 'answer': "「入荷」メニューから登録します。", 'url': "https://help.example.com/1"},
+    {'question': "出荷の締め時間は？", 'answer': "平日 12:00 です。", 'url': "https://help.example.com/2"},
+]
+# 最初の質問と、前の会話によって答えが変わる続きの質問
+QUESTIONS = ["入荷予定の登録方法は？", "詳しく教えてください"]
+
+
+def run_session(workdir, session, questions=QUESTIONS):
+    """データを更新せずに questions を順に質問し、表示された回答の見出しを返す。"""
+    lines = ["n", *questions, "quit"]
+    env = dict(os.environ, PYTHONPATH=SRC_DIR, PYTHONWARNINGS="ignore")
+    result = subprocess.run([sys.executable, "-m", "openlogi_ai_faq.qa_app", "--backend", "fake",
+                             "--mode", "full", "--session", session, "--no-artifact"],
+                            input="\n".join(lines) + "\n", capture_output=True, text=True, encoding='utf-8',
+                            cwd=workdir, env=env, timeout=60)
+    assert result.returncode == 0, result.stdout + result.stderr
+    return [line for line in result.stdout.splitlines() if line in ("回答:", "回答 (キャッシュ):")]
+
+
+@pytest.mark.parametrize("session", ["chat", "stateless"])
+def test_repeated_conversation_is_served_from_cache(tmp_path, session):
+    (tmp_path / DEFAULT_FAQ_FILENAME).write_text(json.dumps(RECORDS, ensure_ascii=False), encoding='utf-8')
+
+    assert run_session(tmp_path, session) == ["回答:", "回答:"]
+    # 同じ会話の流れなら、続きの質問もキャッシュから回答される
+    assert run_session(tmp_path, session) == ["回答 (キャッシュ):", "回答 (キャッシュ):"]
+
+
+def test_follow_up_after_different_question_is_not_cached(tmp_path):
+    (tmp_path / DEFAULT_FAQ_FILENAME).write_text(json.dumps(RECORDS, ensure_ascii=False), encoding='utf-8')
+    run_session(tmp_path, "stateless")
+
+    # 「詳しく」は前の質問が違えば答えも違うため、キャッシュを使わない
+    assert run_session(tmp_path, "stateless", ["出荷の締め時間は？", QUESTIONS[1]]) == ["回答:", "回答:"]
@@ -0,0 +1,64 @@
+# tests/test_ratelimit.py (トークンバケットのレート制限)
+import types
+
+import pytest
+
+from openlogi_ai_faq import ratelimit
+from openlogi_ai_faq.ratelimit import TokenBucket
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """ratelimit の time.monotonic() / time.sleep() を、sleep で進む時計に置き換える。"""
+    now = [100.0]
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+
+    monkeypatch.setattr(ratelimit, 'time', types.SimpleNamespace(monotonic=lambda: now[0], sleep=sleep))
+    return types.SimpleNamespace(now=now, sleeps=sleeps)
+
+
+def test_rejects_non_positive_rate():
+    with pytest.raises(ValueError):
+        TokenBucket(0)
+    with pytest.raises(ValueError):
+        TokenBucket(-1)
+
+
+def test_burst_then_steady_rate(clock):
+    bucket = TokenBucket(rate=2, capacity=3)
+
+    # 最初は capacity 件まで待たずに取得できる
+    assert [bucket.acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    # その後は 1 / rate 秒に1件
+    assert bucket.acquire() == pytest.approx(0.5)
+    assert bucket.acquire() == pytest.approx(0.5)
+    assert clock.sleeps == [pytest.approx(0.5), pytest.approx(0.5)]
+
+
+def test_refill_is_capped_at_capacity(clock):
+    bucket = TokenBucket(rate=1, capacity=2)
+    bucket.acquire()
+    bucket.acquire()
+
+    clock.now[0] += 60
+    assert [bucket.acquire() for _ in range(2)] == [0.0, 0.0]
+    assert bucket.acquire() == pytest.approx(1.0)
+
+
+def test_consume_delays_next_acquire(clock):
+    bucket = TokenBucket(rate=10, capacity=1)
+    bucket.consume(5)   # 後から判明した使用量
+    assert bucket.acquire() == pytest.approx(0.5)
+
+
+def test_pause_and_set_rate(clock):
+    bucket = TokenBucket(rate=1, capacity=1)
+    bucket.pause(2)
+    assert bucket.acquire() == pytest.approx(3.0)
+
+    bucket.set_rate(4)
+    assert bucket.acquire() == pytest.approx(0.25)